@@ -1,33 +1,46 @@
-import os
-from pymilvus import MilvusClient, CollectionSchema, FieldSchema, DataType
-from dotenv import load_dotenv
-
-load_dotenv()
-
-
-milvus_url = os.getenv("MILVUS_URL")
-milvus_user = os.getenv("MILVUS_USER")
-milvus_password = os.getenv("MILVUS_PASSWORD")
-if not milvus_url:
-    raise ValueError("MILVUS_URL environment variable is not set")
-client = MilvusClient(uri=milvus_url, token=f"{milvus_user}:{milvus_password}")
-
-# client.create_database(db_name="my_database_23232")
-# 打印结果
-print(client.list_databases())
-
-client.create_database(db_name="personal")
-
-# 切换数据库
-client.switch_database(db_name="personal")
-
-schema = CollectionSchema(
-    fields=[
-        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=128),
-        FieldSchema(name="name", dtype=DataType.VARCHAR, max_length=100)
-    ],
-    description="Personal info collection"
-)
-# 创建集合
-client.create_collection(collection_name="personal_info", schema=schema)
\ No newline at end of file
+import argparse
+import asyncio
+import glob
+
+from utils.env import load_env
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest markdown documents into Milvus")
+    parser.add_argument(
+        "paths", nargs="*", default=["reference.md", "output/*.md"], help="Files or glob patterns"
+    )
+    parser.add_argument("--uri", default=None, help="Milvus URI (defaults to MILVUS_URL or ./milvus.db); local://<dir> uses LocalVectorStore")
+    parser.add_argument("--db", default="", help="Database name (not supported by milvus-lite)")
+    parser.add_argument("--collection", default="documents")
+    parser.add_argument("--dim", type=int, default=None, help="Vector dimension, inferred if omitted")
+    parser.add_argument("--index", default="HNSW", choices=["HNSW", "IVF_FLAT", "FLAT", "AUTOINDEX"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--max-chars", type=int, default=1500)
+    parser.add_argument("--drop", action="store_true", help="Recreate the collection first")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    load_env()
+    # pymilvus and the embedding client load only once there is something to ingest
+    from rag.ingest import MilvusConfig, get_milvus_client, ingest_documents
+
+    paths = sorted({path for pattern in args.paths for path in glob.glob(pattern)})
+    config = MilvusConfig(
+        collection=args.collection, dim=args.dim, db_name=args.db, index_type=args.index
+    )
+    report = await ingest_documents(
+        paths,
+        client=get_milvus_client(args.uri),
+        config=config,
+        batch_size=args.batch_size,
+        max_chars=args.max_chars,
+        drop=args.drop,
+    )
+    print(report)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
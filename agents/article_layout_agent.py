@@ -1,19 +1,222 @@
+import asyncio
+import json
+from typing import AsyncIterable, AsyncIterator, List, Optional
+
+from loguru import logger
+
 from utils.ai_client import AIClient
-from prompting.loader import load_all_chat_prompts
+from utils.http_pool import HTTPPool
+from utils.response_cache import ResponseCache, is_error_text
+from utils.markdown import (
+    demote_titles,
+    demote_titles_stream,
+    heading_lines,
+    iter_sections,
+    pack_sections,
+    replace_headings,
+    split_sections,
+)
+from prompting.registry import get_prompt
 
 
 class ArticleLayoutAgent:
-    def __init__(self, model: str = "qwen-plus", deep_think: str = "disabled"):
+    def __init__(
+        self,
+        model: str = "qwen-plus",
+        deep_think: str = "disabled",
+        pool: Optional[HTTPPool] = None,
+        cache: Optional[ResponseCache] = None,
+        long_document_chars: int = 12000,
+        part_chars: int = 4000,
+        max_concurrency: int = 4,
+        harmonize: bool = False,
+    ):
         self.model = model
         self.deep_think = deep_think
-        self.client = AIClient(model=self.model)
-        self.prompt_template = load_all_chat_prompts()["article_layout"]
+        self.client = AIClient(model=self.model, pool=pool, cache=cache, stage="layout")
+        self.prompt_template = get_prompt("article_layout")
+        self.section_prompt = get_prompt("article_layout_section")
+        # Long-document (map-reduce) mode settings
+        self.long_document_chars = long_document_chars
+        self.part_chars = part_chars
+        self.max_concurrency = max_concurrency
+        self.harmonize = harmonize
+
+    def build_messages(self, raw_analysis: str) -> List[dict]:
+        """Chat messages for a single-call layout of ``raw_analysis`` (also used as a cache key)."""
+        messages = self.prompt_template.format()
+        messages.append({"role": "user", "content": raw_analysis})
+        return messages
+
+    def _section_messages(self, part: str, index: int, total: Optional[int] = None) -> List[dict]:
+        """Messages laying out one part of a longer document; only part 0 keeps a level-1 title."""
+        messages = self.prompt_template.format()
+        section = self.section_prompt.format(
+            position=f"第 {index + 1}/{total} 部分" if total else f"第 {index + 1} 部分",
+            title_rule=(
+                "如有全文标题，保留为一级标题（#）。"
+                if index == 0
+                else "不要使用一级标题（#），本部分标题从二级（##）开始。"
+            ),
+        )
+        # One system message: some providers (Anthropic) accept only a single system prompt
+        system = "\n\n".join(m["content"] for m in messages + section if m["role"] == "system")
+        messages = [{"role": "system", "content": system}] + [m for m in messages if m["role"] != "system"]
+        messages.append({"role": "user", "content": part})
+        return messages
 
-    async def format(self, raw_analysis: str) -> str:
+    async def format(self, raw_analysis: str, long_document: Optional[bool] = None) -> str:
         """
         Receive unformatted company analysis content and return formatted articles in markdown format
+
+        Inputs longer than ``long_document_chars`` (or any input with ``long_document=True``)
+        go through format_long instead of a single call.
         """
-        messages = self.prompt_template.format()
-        messages.append({"role": "user", "content": raw_analysis})
+        if long_document is None:
+            long_document = len(raw_analysis) > self.long_document_chars
+        if long_document:
+            return await self.format_long(raw_analysis)
+        messages = self.build_messages(raw_analysis)
         response = await self.client.chat(messages, deep_think=self.deep_think)
         return response
+
+    async def format_long(self, raw_analysis: str) -> str:
+        """
+        Map-reduce layout for long documents.
+
+        The text is split at heading boundaries into parts of about ``part_chars``
+        characters, which are laid out concurrently and stitched back in order. Only
+        the first part may keep a level-1 title, so the result has the same single-title
+        structure as the single-call path. With ``harmonize`` a final light call unifies
+        the headings across parts. If any part fails its error text is returned, as
+        format would, and the remaining part calls are cancelled.
+        """
+        parts = pack_sections(split_sections(raw_analysis), self.part_chars)
+        if len(parts) <= 1:
+            return await self.format(raw_analysis, long_document=False)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def layout(index: int, part: str) -> str:
+            messages = self._section_messages(part, index, len(parts))
+            async with semaphore:
+                return await self.client.chat(messages, deep_think=self.deep_think)
+
+        logger.info(f"Long-document layout: {len(parts)} parts")
+        tasks = [asyncio.create_task(layout(i, part)) for i, part in enumerate(parts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if is_error_text(result):
+                    # Same in-band error as a single-call format; the other parts are cancelled below
+                    logger.error(f"Long-document layout failed: {result[:200]}")
+                    return result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        results = [task.result().strip() for task in tasks]
+        article = "\n\n".join([results[0]] + [demote_titles(r) for r in results[1:]])
+
+        if self.harmonize:
+            article = await self._harmonize_headings(article)
+        return article
+
+    async def _harmonize_headings(self, article: str) -> str:
+        """Reduce pass: rewrite only the heading lines so style and numbering are consistent."""
+        headings = heading_lines(article)
+        if len(headings) < 2:
+            return article
+        messages = get_prompt("article_layout_reduce").format()
+        messages.append({"role": "user", "content": json.dumps(headings, ensure_ascii=False)})
+        result = await self.client.chat(messages, deep_think=self.deep_think)
+        try:
+            rewritten = json.loads(result.strip().removeprefix("```json").strip("`\n "))
+        except (json.JSONDecodeError, AttributeError):
+            logger.warning("Heading harmonization returned invalid JSON, keeping original headings")
+            return article
+        valid = (
+            isinstance(rewritten, list)
+            and len(rewritten) == len(headings)
+            and all(
+                isinstance(new, str)
+                and new.startswith("#")
+                and len(new) - len(new.lstrip("#")) == len(old) - len(old.lstrip("#"))
+                for old, new in zip(headings, rewritten)
+            )
+        )
+        if not valid:
+            logger.warning("Heading harmonization changed the outline, keeping original headings")
+            return article
+        return replace_headings(article, rewritten)
+
+    async def format_stream(self, raw_analysis: str) -> AsyncIterator[str]:
+        """
+        Streaming version of format: yield the formatted article as tokens arrive
+        """
+        messages = self.build_messages(raw_analysis)
+        async for chunk in self.client.chat_stream(messages, deep_think=self.deep_think):
+            yield chunk
+
+    async def format_sections_stream(
+        self,
+        chunks: AsyncIterable[str],
+        min_chars: int = 800,
+    ) -> AsyncIterator[str]:
+        """
+        Lay out an upstream token stream section by section.
+
+        Each markdown section is sent for layout as soon as the upstream stream has
+        completed it, so formatting starts while the source is still being generated.
+        Sections use the same per-part prompt as format_long, and level-1 titles after
+        the first section are demoted. Up to ``max_concurrency`` sections are formatted
+        at once but always yielded in source order; the earliest unfinished section is
+        streamed live, later ones are buffered. A failed section raises instead of
+        being dropped.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        queues: asyncio.Queue = asyncio.Queue()
+        done = object()
+        tasks = []
+
+        async def layout(index: int, section: str, out: asyncio.Queue):
+            try:
+                async with semaphore:
+                    messages = self._section_messages(section, index)
+                    stream = self.client.chat_stream(messages, deep_think=self.deep_think)
+                    if index:
+                        stream = demote_titles_stream(stream)
+                    async for chunk in stream:
+                        await out.put(chunk)
+            finally:
+                await out.put(done)
+
+        async def split():
+            try:
+                index = 0
+                async for section in iter_sections(chunks, min_chars=min_chars):
+                    out: asyncio.Queue = asyncio.Queue()
+                    task = asyncio.create_task(layout(index, section, out))
+                    tasks.append(task)
+                    await queues.put((out, task))
+                    index += 1
+            finally:
+                await queues.put(done)
+
+        splitter = asyncio.create_task(split())
+        try:
+            first = True
+            while (entry := await queues.get()) is not done:
+                out, task = entry
+                if not first:
+                    yield "\n\n"
+                first = False
+                while (chunk := await out.get()) is not done:
+                    yield chunk
+                # Re-raise a failed section's error rather than silently skipping it
+                await task
+            await splitter
+        finally:
+            for task in [splitter, *tasks]:
+                task.cancel()
+            await asyncio.gather(splitter, *tasks, return_exceptions=True)
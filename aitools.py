@@ -0,0 +1,82 @@
+"""
+Single entry point for the project's command-line tools.
+
+    python aitools.py analyze [--batch DIR_OR_JSONL ...]   # company_analysis.py
+    python aitools.py write                                  # article_writing.py
+    python aitools.py ingest [PATHS ...]                     # Milvus.py
+    python aitools.py serve [--port 8000]                    # mcp/server.py
+    python aitools.py batch INPUT OUTPUT [--model ...]       # utils/batch_jobs.py
+    python aitools.py bench NAME [...]                       # benchmarks/bench_NAME.py
+
+Everything after the subcommand is passed to the underlying script unchanged, so
+``python aitools.py batch --help`` shows that command's own options. This module
+imports only the standard library: each command's dependencies (httpx, numpy,
+pymilvus, fastmcp, ...) are loaded when the command runs, and ``.env`` is read once
+before dispatch. ``python -m benchmarks.bench_import`` keeps the startup cost measured.
+"""
+import argparse
+import glob
+import os
+import runpy
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# subcommand -> (module run as __main__, help)
+COMMANDS = {
+    "analyze": ("company_analysis", "Company analysis pipeline, or --batch over many documents"),
+    "write": ("article_writing", "Article transcription and layout pipeline"),
+    "ingest": ("Milvus", "Chunk, embed and index markdown documents into Milvus"),
+    "serve": ("mcp/server.py", "Serve the tools over MCP"),
+    "batch": ("utils.batch_jobs", "Answer a JSONL file of chat requests offline"),
+    "bench": ("benchmarks.bench_{}", "Run a benchmark: bench NAME [options]"),
+}
+
+
+def available_benchmarks():
+    paths = glob.glob(os.path.join(ROOT, "benchmarks", "bench_*.py"))
+    return sorted(os.path.basename(p)[len("bench_"):-len(".py")] for p in paths)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="aitools",
+        description="AI tools command line",
+        epilog="\n".join(f"  {name:<8} {help}" for name, (_, help) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=list(COMMANDS), metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Options for the command")
+    return parser.parse_args(argv)
+
+
+def run(command, args):
+    target, _ = COMMANDS[command]
+    if command == "bench":
+        names = available_benchmarks()
+        if not args or args[0] not in names:
+            sys.exit(f"usage: aitools bench NAME [options]\navailable: {', '.join(names)}")
+        target = target.format(args[0])
+        args = args[1:]
+
+    from utils.env import load_env
+
+    load_env()
+    if target.endswith(".py"):
+        path = os.path.join(ROOT, target)
+        sys.argv = [path] + args
+        runpy.run_path(path, run_name="__main__")
+    else:
+        sys.argv = [target] + args
+        runpy.run_module(target, run_name="__main__", alter_sys=True)
+
+
+def main(argv=None):
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    args = parse_args(argv)
+    run(args.command, args.args)
+
+
+if __name__ == "__main__":
+    main()
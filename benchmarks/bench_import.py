@@ -0,0 +1,92 @@
+"""
+Cold-start benchmark of the CLI and the modules short invocations import.
+
+Each target runs ``--rounds`` times in a fresh interpreter; the report shows the
+median wall time, the time over a bare ``python -c pass``, and the slowest imports
+from ``-X importtime`` so regressions point at the module that caused them:
+
+    python -m benchmarks.bench_import --rounds 7
+    python -m benchmarks.bench_import --max-ms 250   # exit 1 if any target's overhead exceeds 250 ms
+
+``--max-ms`` bounds the overhead (median minus the bare interpreter), which keeps the
+check meaningful across machines of different speed.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> python arguments
+TARGETS: Dict[str, List[str]] = {
+    "aitools --help": ["aitools.py", "--help"],
+    "aitools batch --help": ["aitools.py", "batch", "--help"],
+    "aitools analyze --help": ["aitools.py", "analyze", "--help"],
+    "import utils.ai_client": ["-c", "import utils.ai_client"],
+    "import utils.batch_jobs": ["-c", "import utils.batch_jobs"],
+    "import pipelines.engine": ["-c", "import pipelines.engine"],
+}
+BASELINE = ["-c", "pass"]
+
+
+def run_once(args: List[str]) -> float:
+    t0 = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *args], cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return (time.perf_counter() - t0) * 1000
+
+
+def median_ms(args: List[str], rounds: int) -> float:
+    run_once(args)  # warm the OS file cache and __pycache__
+    return statistics.median(run_once(args) for _ in range(rounds))
+
+
+def top_imports(args: List[str], limit: int) -> List[Tuple[str, float]]:
+    """Top-level packages by total self import time (ms), from ``-X importtime``."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    totals: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        fields = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        package = fields[2].strip().split(".")[0]
+        totals[package] = totals.get(package, 0.0) + int(fields[0]) / 1000
+    totals.pop("site", None)  # paid by the baseline too
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+
+
+def run(rounds: int, top: int, max_ms: float) -> bool:
+    baseline = median_ms(BASELINE, rounds)
+    print(f"python -c pass: {baseline:.1f} ms (median of {rounds})\n")
+    print(f"{'target':<26} {'median ms':>10} {'overhead':>9}  slowest imports")
+    ok = True
+    for name, args in TARGETS.items():
+        total = median_ms(args, rounds)
+        overhead = total - baseline
+        slowest = ", ".join(f"{module} {ms:.0f}" for module, ms in top_imports(args, top))
+        flag = ""
+        if max_ms and overhead > max_ms:
+            flag, ok = "  OVER", False
+        print(f"{name:<26} {total:>10.1f} {overhead:>9.1f}  {slowest}{flag}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--top", type=int, default=4, help="Slowest imports to list per target")
+    parser.add_argument("--max-ms", type=float, default=0, help="Fail if any overhead exceeds this (0 = report only)")
+    args = parser.parse_args()
+    if not run(args.rounds, args.top, args.max_ms):
+        sys.exit(1)
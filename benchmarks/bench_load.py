@@ -0,0 +1,197 @@
+"""
+Load-test AIClient and the pipelines against the local mock LLM server.
+
+Runs ``--requests`` calls at each concurrency level and reports latency percentiles,
+time to first token, throughput and peak memory of this (client) process:
+
+    python -m benchmarks.bench_load --model qwen-plus --concurrency 1,16,64 --requests 200 --stream
+    python -m benchmarks.bench_load --pipeline layout --concurrency 8 --ttft 0.5 --rate-limit-rate 0.05
+
+Provider rate limits are lifted unless ``--respect-limits`` is given, so the numbers
+reflect the client itself. Pass ``--no-mock`` to drive whatever *_URL variables are
+already set instead of spawning the mock server.
+"""
+import argparse
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.mock_server import MockConfig, MockServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROMPT = "请根据以下资料分析公司的主营业务、财务状况与竞争格局。\n\n" + "## 资料\n\n公司年报摘要。" * 50
+
+
+@dataclass
+class LevelResult:
+    concurrency: int
+    latencies: List[float] = field(default_factory=list)
+    ttfts: List[float] = field(default_factory=list)
+    tokens: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    peak_rss_mb: Optional[float] = None
+
+    def row(self) -> str:
+        def pct(values: List[float], q: int) -> str:
+            return f"{np.percentile(values, q) * 1000:.0f}" if values else "-"
+
+        done = len(self.latencies)
+        rss = f"{self.peak_rss_mb:.0f}" if self.peak_rss_mb is not None else "n/a"
+        return (
+            f"{self.concurrency:>5} {done:>5} {self.errors:>5} "
+            f"{pct(self.latencies, 50):>7} {pct(self.latencies, 95):>7} {pct(self.latencies, 99):>7} "
+            f"{pct(self.ttfts, 50):>8} {pct(self.ttfts, 95):>8} "
+            f"{done / self.elapsed:>7.1f} {self.tokens / self.elapsed:>9.0f} {rss:>8}"
+        )
+
+
+HEADER = (
+    f"{'conc':>5} {'ok':>5} {'err':>5} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+    f"{'ttft p50':>8} {'ttft p95':>8} {'req/s':>7} {'tokens/s':>9} {'rss MB':>8}"
+)
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# A call returns (ttft, output tokens, ok)
+Call = Callable[[], Awaitable[Tuple[float, int, bool]]]
+
+
+def build_call(pipeline: str, model: str, stream: bool, respect_limits: bool) -> Call:
+    from agents.article_layout_agent import ArticleLayoutAgent
+    from prompting.registry import get_prompt
+    from utils.ai_client import AIClient
+    from utils.model_config import detect_provider
+    from utils.rate_limit import ProviderLimiter
+    from utils.response_cache import is_error_text
+    from utils.tokens import estimate_tokens
+
+    provider = detect_provider(model)
+    limiter = None if respect_limits else ProviderLimiter(provider, {"rpm": 0, "tpm": 0})
+    client = AIClient(model, limiter=limiter)
+    agent = ArticleLayoutAgent(model=model)
+    if limiter is not None:
+        agent.client.limiter = limiter
+    messages = [{"role": "user", "content": PROMPT}]
+
+    async def chat() -> Tuple[float, int, bool]:
+        started = time.perf_counter()
+        if not stream:
+            result = await client.chat(messages, use_cache=False)
+            return time.perf_counter() - started, estimate_tokens(result, provider), not is_error_text(result)
+        ttft, tokens, ok = None, 0, True
+        async for event in client.stream_events(messages):
+            if event.type == "content":
+                ttft = ttft if ttft is not None else time.perf_counter() - started
+                tokens += 1
+            elif event.type == "error":
+                ok = False
+        return (ttft if ttft is not None else time.perf_counter() - started), tokens, ok
+
+    async def layout() -> Tuple[float, int, bool]:
+        started = time.perf_counter()
+        result = await agent.format(PROMPT)
+        return time.perf_counter() - started, estimate_tokens(result, provider), not is_error_text(result)
+
+    async def analysis() -> Tuple[float, int, bool]:
+        # The company_analysis pipeline: analysis call followed by the layout agent
+        started = time.perf_counter()
+        analysis_messages = get_prompt("company_analysis").format()
+        analysis_messages.append({"role": "user", "content": PROMPT})
+        result = await client.chat(analysis_messages, use_cache=False, deep_think="disabled")
+        if is_error_text(result):
+            return time.perf_counter() - started, 0, False
+        report = await agent.format(result)
+        return time.perf_counter() - started, estimate_tokens(report, provider), not is_error_text(report)
+
+    return {"chat": chat, "layout": layout, "analysis": analysis}[pipeline]
+
+
+async def run_level(call: Call, concurrency: int, requests: int) -> LevelResult:
+    result = LevelResult(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            ttft, tokens, ok = await call()
+            if ok:
+                result.latencies.append(time.perf_counter() - started)
+                result.ttfts.append(ttft)
+                result.tokens += tokens
+            else:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    result.elapsed = time.perf_counter() - started
+    result.peak_rss_mb = peak_rss_mb()
+    return result
+
+
+async def run(args) -> List[LevelResult]:
+    from utils.http_pool import get_http_pool
+
+    call = build_call(args.pipeline, args.model, args.stream, args.respect_limits)
+    results = []
+    print(HEADER)
+    try:
+        for concurrency in args.concurrency:
+            level = await run_level(call, concurrency, args.requests)
+            print(level.row(), flush=True)
+            results.append(level)
+    finally:
+        await get_http_pool().aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="qwen-plus")
+    parser.add_argument("--pipeline", choices=["chat", "layout", "analysis"], default="chat")
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--respect-limits", action="store_true", help="Keep the provider rpm/tpm limits")
+    parser.add_argument("--no-mock", action="store_true", help="Use the *_URL variables already set")
+    mock = parser.add_argument_group("mock server")
+    mock.add_argument("--ttft", type=float, default=0.2)
+    mock.add_argument("--token-rate", type=float, default=200.0)
+    mock.add_argument("--output-tokens", type=int, default=200)
+    mock.add_argument("--error-rate", type=float, default=0.0)
+    mock.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.no_mock:
+        asyncio.run(run(args))
+        return
+
+    config = MockConfig(
+        ttft=args.ttft,
+        token_rate=args.token_rate,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=0.2,
+    )
+    with MockServer(config) as server:
+        os.environ.update(server.provider_env())
+        asyncio.run(run(args))
+        print(f"server: {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Throughput benchmark of the SSE stream decoder against the old line-based parser.
+
+Replays a recorded stream for every provider in LEGACY_EXTRACTORS, cut into
+network-sized byte chunks, and reports parsed tokens (content deltas) per second.
+Streams are synthesised in each provider's wire format unless ``--streams-dir``
+holds real captures named ``<provider>.sse``.
+
+    python -m benchmarks.bench_stream_decode --tokens 20000 --rounds 5
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Callable, Dict, List
+
+from httpx._decoders import LineDecoder, TextDecoder
+
+from utils.sse import StreamAccumulator, StreamParser
+
+# Frozen copy of the per-line stream extractors the client used before utils/sse.StreamParser;
+# kept only as this benchmark's baseline
+_CHOICES_DELTA = lambda chunk: chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")  # noqa: E731
+LEGACY_EXTRACTORS: Dict[str, Callable[[Dict], str]] = {
+    "anthropic": lambda chunk: (
+        chunk.get("delta", {}).get("text", "") if chunk.get("type") == "content_block_delta" else ""
+    ),
+    "google": lambda chunk: next(
+        (
+            part.get("text", "")
+            for candidate in chunk.get("candidates", [])
+            for part in candidate.get("content", {}).get("parts", [])
+        ),
+        "",
+    ),
+    "openai": _CHOICES_DELTA,
+    "zhipu": _CHOICES_DELTA,
+    "volcengine": _CHOICES_DELTA,
+}
+
+SAMPLE = "公司主营业务包括云计算、数据库与人工智能服务，Revenue grew 12% YoY. "
+
+
+def _sse(data: Dict, event: str = "") -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _openai_stream(pieces: List[str]) -> str:
+    events = [
+        _sse({"id": "c1", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": p}, "finish_reason": None}]})
+        for p in pieces
+    ]
+    events.append(_sse({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+    events.append(_sse({"choices": [], "usage": {"prompt_tokens": 100, "completion_tokens": len(pieces)}}))
+    return "".join(events) + "data: [DONE]\n\n"
+
+
+def _anthropic_stream(pieces: List[str]) -> str:
+    events = [_sse({"type": "message_start", "message": {"usage": {"input_tokens": 100}}}, "message_start")]
+    events += [
+        _sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": p}}, "content_block_delta")
+        for p in pieces
+    ]
+    events.append(_sse({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(pieces)}}, "message_delta"))
+    return "".join(events) + _sse({"type": "message_stop"}, "message_stop")
+
+
+def _google_stream(pieces: List[str]) -> str:
+    events = [_sse({"candidates": [{"content": {"parts": [{"text": p}], "role": "model"}}]}) for p in pieces]
+    events.append(_sse({"candidates": [{"finishReason": "STOP"}], "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": len(pieces)}}))
+    return "".join(events)
+
+
+SYNTHESISERS: Dict[str, Callable[[List[str]], str]] = {
+    "anthropic": _anthropic_stream,
+    "google": _google_stream,
+}
+
+
+def recorded_stream(provider: str, tokens: int, streams_dir: str = "") -> bytes:
+    path = os.path.join(streams_dir, f"{provider}.sse") if streams_dir else ""
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    rng = random.Random(0)
+    pieces = []
+    for _ in range(tokens):
+        start = rng.randrange(len(SAMPLE) - 4)
+        pieces.append(SAMPLE[start : start + rng.randint(1, 4)])
+    return SYNTHESISERS.get(provider, _openai_stream)(pieces).encode("utf-8")
+
+
+def network_chunks(data: bytes, seed: int = 0) -> List[bytes]:
+    """Cut bytes at arbitrary offsets (splitting lines and UTF-8 characters) like a socket does."""
+    rng = random.Random(seed)
+    chunks, pos = [], 0
+    while pos < len(data):
+        size = rng.randint(64, 4096)
+        chunks.append(data[pos : pos + size])
+        pos += size
+    return chunks
+
+
+def decode_new(provider: str, chunks: List[bytes]) -> int:
+    parser = StreamParser(provider)
+    result = StreamAccumulator()
+    count = 0
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            result.add(event)
+            count += event.type == "content"
+    for event in parser.flush():
+        result.add(event)
+        count += event.type == "content"
+    return count
+
+
+def decode_legacy(provider: str, chunks: List[bytes]) -> int:
+    """The previous approach: text lines, stdlib json per line and ``buffer +=``."""
+    extract = LEGACY_EXTRACTORS[provider]
+    # The same decoding httpx.Response.aiter_lines applies to each received chunk
+    text_decoder, line_decoder = TextDecoder("utf-8"), LineDecoder()
+    lines = []
+    for chunk in chunks:
+        lines.extend(line_decoder.decode(text_decoder.decode(chunk)))
+    lines.extend(line_decoder.decode(text_decoder.flush()))
+    lines.extend(line_decoder.flush())
+    buffer, count = "", 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("data:"):
+            line = line[5:].strip()
+        if line == "[DONE]":
+            continue
+        try:
+            content = extract(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+        except Exception:
+            content = None
+        if content:
+            buffer += content
+            count += 1
+    return count
+
+
+def run(tokens: int, rounds: int, streams_dir: str):
+    print(f"{'provider':<11} {'MB':>6} {'tokens':>7} {'legacy tok/s':>13} {'new tok/s':>11} {'speedup':>8}")
+    for provider in LEGACY_EXTRACTORS:
+        data = recorded_stream(provider, tokens, streams_dir)
+        chunks = network_chunks(data)
+        timings = {}
+        for name, decode in (("legacy", decode_legacy), ("new", decode_new)):
+            best = float("inf")
+            for _ in range(rounds):
+                t0 = time.perf_counter()
+                count = decode(provider, chunks)
+                best = min(best, time.perf_counter() - t0)
+            timings[name] = (count, best)
+        count, new_s = timings["new"]
+        legacy_s = timings["legacy"][1]
+        print(
+            f"{provider:<11} {len(data) / 1e6:>6.2f} {count:>7} {count / legacy_s:>13,.0f} "
+            f"{count / new_s:>11,.0f} {legacy_s / new_s:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=20_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--streams-dir", default="", help="Directory of captured <provider>.sse files")
+    args = parser.parse_args()
+    run(args.tokens, args.rounds, args.streams_dir)
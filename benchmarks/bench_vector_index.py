@@ -0,0 +1,66 @@
+"""
+Recall/latency benchmark of LocalVectorStore's IVF index against exact search.
+
+    python -m benchmarks.bench_vector_index --rows 100000 --dim 128
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from rag.local_store import LocalVectorStore
+
+
+def clustered_data(rows: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return centers[labels] + 0.3 * rng.normal(size=(rows, dim)).astype(np.float32)
+
+
+def run(rows: int, dim: int, queries: int, k: int, nprobes, persist: bool):
+    data = clustered_data(rows, dim, clusters=max(8, rows // 2000))
+    query_vectors = data[np.random.default_rng(1).choice(rows, queries)] + 0.05
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LocalVectorStore(tmp if persist else None, ivf_min_rows=0)
+        store.create_collection("bench", dimension=dim)
+        t0 = time.perf_counter()
+        for start in range(0, rows, 10_000):
+            store.insert("bench", [{"embedding": v} for v in data[start : start + 10_000]])
+        print(f"insert: {rows / (time.perf_counter() - t0):,.0f} rows/s")
+
+        def timed_search(nprobe=None):
+            params = {"params": {"nprobe": nprobe}} if nprobe else None
+            t = time.perf_counter()
+            hits = store.search("bench", query_vectors, limit=k, search_params=params)
+            per_query = (time.perf_counter() - t) / queries * 1000
+            return [{hit["id"] for hit in h} for h in hits], per_query
+
+        exact, exact_ms = timed_search()
+        print(f"exact: {exact_ms:.2f} ms/query")
+
+        params = store.prepare_index_params()
+        params.add_index("embedding", index_type="IVF_FLAT")
+        t0 = time.perf_counter()
+        store.create_index("bench", params)
+        print(f"ivf build: {time.perf_counter() - t0:.2f}s")
+
+        print(f"{'nprobe':>7} {'recall@' + str(k):>10} {'ms/query':>9} {'speedup':>8}")
+        for nprobe in nprobes:
+            approx, ms = timed_search(nprobe)
+            recall = np.mean([len(a & e) / k for a, e in zip(approx, exact)])
+            print(f"{nprobe:>7} {recall:>10.3f} {ms:>9.2f} {exact_ms / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--memory", action="store_true", help="Keep vectors in memory instead of a memmap")
+    args = parser.parse_args()
+    run(args.rows, args.dim, args.queries, args.k, args.nprobe, persist=not args.memory)
@@ -0,0 +1,476 @@
+"""
+Local stand-in LLM server for offline benchmarks.
+
+Speaks the request/response and SSE formats that utils/model_config.py parses:
+
+    POST /v1/chat/completions   OpenAI-compatible (OpenAI, Qwen, Zhipu, Volcengine)
+    POST /v1/messages           Anthropic Messages API
+    POST /v1beta/models/{m}     Google Gemini (generateContent / streamGenerateContent)
+    POST /v1/embeddings         OpenAI-compatible embeddings
+    POST /v1/files, /v1/batches OpenAI-style batch API (upload, create, poll, download)
+    POST /v1/batch/chat/completions  Volcengine-style batch inference endpoint
+    POST /v1/context/create, /v1/context/chat/completions  Volcengine context caching
+    GET  /stats                 request / error counters
+
+Latency, token rate, output length and error/429 injection are configurable; batches
+complete ``--batch-delay`` seconds after submission, failing lines at ``--error-rate``:
+
+    python -m benchmarks.mock_server --port 8765 --ttft 0.3 --token-rate 60 --rate-limit-rate 0.05
+
+``MockServer`` runs it in a subprocess (so it does not compete with the client for the
+GIL) and ``provider_env()`` gives the environment variables pointing AIClient at it.
+Repeated system prompts of 1024+ tokens are reported as prefix-cache hits in the usage
+block, as OpenAI and Anthropic do.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from utils.model_config import PROVIDER_ENV_MAPPING
+from utils.tokens import estimate_messages
+
+VOCABULARY = "公司 业务 收入 增长 市场 份额 产品 研发 the company revenue grew market share product".split()
+
+# Path (relative to the server root) that each provider's *_URL should point at
+PROVIDER_ROUTES = {
+    "anthropic": "/v1/messages",
+    "google": "/v1beta/models/gemini:generateContent",
+}
+DEFAULT_ROUTE = "/v1/chat/completions"
+
+
+@dataclass
+class MockConfig:
+    ttft: float = 0.2  # seconds before the first token / response headers
+    token_rate: float = 100.0  # tokens per second after the first one; 0 = instant
+    output_tokens: int = 200  # tokens per completion (capped by max_tokens)
+    error_rate: float = 0.0  # fraction of requests answered with HTTP 500
+    rate_limit_rate: float = 0.0  # fraction of requests answered with HTTP 429
+    retry_after: float = 0.5  # Retry-After sent with injected 429s
+    batch_delay: float = 1.0  # seconds a submitted batch stays in progress
+    seed: Optional[int] = None
+
+
+def _completion_tokens(config: MockConfig, body: Dict[str, Any]) -> List[str]:
+    count = min(config.output_tokens, int(body.get("max_tokens") or config.output_tokens))
+    rng = random.Random(hashlib.sha256(json.dumps(body, sort_keys=True).encode()).digest())
+    words = [rng.choice(VOCABULARY) + " " for _ in range(max(1, count))]
+    words[0] = "# Mock\n\n" + words[0]
+    return words
+
+
+def _sse(data: Dict[str, Any], event: str = "") -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _paced(config: MockConfig, tokens: List[str]) -> AsyncIterator[List[str]]:
+    """Yield tokens in batches so the average rate matches ``token_rate``."""
+    await asyncio.sleep(config.ttft)
+    if config.token_rate <= 0:
+        yield tokens
+        return
+    started = time.monotonic()
+    sent = 0
+    while sent < len(tokens):
+        due = 1 + int((time.monotonic() - started) * config.token_rate)
+        batch = tokens[sent : max(due, sent + 1)]
+        sent += len(batch)
+        yield batch
+        if sent < len(tokens):
+            await asyncio.sleep(max(0.0, started + sent / config.token_rate - time.monotonic()))
+
+
+def create_app(config: MockConfig):
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, Response, StreamingResponse
+    from starlette.routing import Route
+
+    rng = random.Random(config.seed)
+    stats: Counter = Counter()
+    files: Dict[str, bytes] = {}
+    batches: Dict[str, Dict[str, Any]] = {}
+    contexts: Dict[str, List[Dict[str, Any]]] = {}
+    seen_prefixes: set = set()
+
+    def system_text(system: Any) -> str:
+        return system if isinstance(system, str) else "".join(b.get("text", "") for b in system or [])
+
+    def prefix_cache_hit(system: Any) -> int:
+        """Tokens of a long system prompt served from the (simulated) prefix cache."""
+        text = system_text(system)
+        tokens = estimate_messages([{"content": text}]) if text else 0
+        if tokens < 1024:
+            return 0
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        hit = digest in seen_prefixes
+        seen_prefixes.add(digest)
+        return tokens if hit else 0
+
+    def injected_error() -> Optional[JSONResponse]:
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "rate limit exceeded (mock)", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after)},
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "internal error (mock)", "type": "server_error"}},
+                status_code=500,
+            )
+        return None
+
+    async def non_stream_delay(tokens: List[str]) -> None:
+        rate_time = len(tokens) / config.token_rate if config.token_rate > 0 else 0.0
+        await asyncio.sleep(config.ttft + rate_time)
+
+    def streaming(chunks: AsyncIterator[str]) -> StreamingResponse:
+        return StreamingResponse(chunks, media_type="text/event-stream")
+
+    def openai_completion(body: Dict[str, Any], cached_tokens: Optional[int] = None):
+        tokens = _completion_tokens(config, body)
+        # Volcengine-style deep thinking streams reasoning_content before the answer
+        thinking = (body.get("thinking") or {}).get("type") == "enabled"
+        reasoning = tokens[: len(tokens) // 4] if thinking else []
+        usage = {
+            "prompt_tokens": estimate_messages(body.get("messages", [])),
+            "completion_tokens": len(tokens) + len(reasoning),
+            "total_tokens": 0,
+            "completion_tokens_details": {"reasoning_tokens": len(reasoning)},
+        }
+        if cached_tokens is None:
+            system = [m for m in body.get("messages", []) if m.get("role") == "system"][:1]
+            cached_tokens = prefix_cache_hit(system[0]["content"]) if system else 0
+        usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        message = {"role": "assistant", "content": "".join(tokens)}
+        if reasoning:
+            message["reasoning_content"] = "".join(reasoning)
+        completion = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+        return tokens, reasoning, usage, completion
+
+    async def openai_chat(request: Request):
+        body = await request.json()
+        stats["openai"] += 1
+        cached_tokens = None
+        if "context_id" in body:
+            if body["context_id"] not in contexts:
+                return JSONResponse({"error": {"message": "context not found (mock)"}}, status_code=404)
+            prefix = contexts[body["context_id"]]
+            body = {**body, "messages": prefix + body.get("messages", [])}
+            cached_tokens = estimate_messages(prefix)
+            stats["context_hits"] += 1
+        error = injected_error()
+        if error is not None:
+            return error
+        tokens, reasoning, usage, completion = openai_completion(body, cached_tokens)
+        model = completion["model"]
+
+        if not body.get("stream"):
+            await non_stream_delay(reasoning + tokens)
+            return JSONResponse(completion)
+
+        async def events():
+            stream = [("reasoning_content", t) for t in reasoning] + [("content", t) for t in tokens]
+            async for batch in _paced(config, stream):
+                for field, text in batch:
+                    yield _sse(
+                        {
+                            "id": "chatcmpl-mock",
+                            "object": "chat.completion.chunk",
+                            "model": model,
+                            "choices": [{"index": 0, "delta": {field: text}, "finish_reason": None}],
+                        }
+                    )
+            yield _sse({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            yield _sse({"choices": [], "usage": usage})
+            yield "data: [DONE]\n\n"
+
+        return streaming(events())
+
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        stats["anthropic"] += 1
+        error = injected_error()
+        if error is not None:
+            return error
+        tokens = _completion_tokens(config, body)
+        system = body.get("system", "")
+        input_tokens = estimate_messages(body.get("messages", []))
+        # Only system blocks marked with cache_control are cached
+        marked = isinstance(system, list) and any("cache_control" in b for b in system)
+        cache_read = prefix_cache_hit(system) if marked else 0
+        system_tokens = estimate_messages([{"content": system_text(system)}]) if system else 0
+        cache_write = system_tokens if marked and not cache_read else 0
+        input_tokens += system_tokens - cache_read - cache_write
+        usage = {
+            "input_tokens": input_tokens,
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_write,
+        }
+
+        if not body.get("stream"):
+            await non_stream_delay(tokens)
+            return JSONResponse(
+                {
+                    "id": "msg_mock",
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [{"type": "text", "text": "".join(tokens)}],
+                    "stop_reason": "end_turn",
+                    "usage": {**usage, "output_tokens": len(tokens)},
+                }
+            )
+
+        async def events():
+            yield _sse(
+                {"type": "message_start", "message": {"id": "msg_mock", "usage": {**usage, "output_tokens": 0}}},
+                "message_start",
+            )
+            yield _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+            yield _sse({"type": "ping"}, "ping")
+            async for batch in _paced(config, tokens):
+                for text in batch:
+                    yield _sse(
+                        {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}},
+                        "content_block_delta",
+                    )
+            yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield _sse(
+                {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(tokens)}},
+                "message_delta",
+            )
+            yield _sse({"type": "message_stop"}, "message_stop")
+
+        return streaming(events())
+
+    async def google_generate(request: Request):
+        body = await request.json()
+        stats["google"] += 1
+        error = injected_error()
+        if error is not None:
+            return error
+        tokens = _completion_tokens(config, body)
+        usage = {
+            "promptTokenCount": estimate_messages(body.get("messages", [])),
+            "candidatesTokenCount": len(tokens),
+        }
+        stream = body.get("stream") or request.path_params["action"].endswith(":streamGenerateContent")
+
+        if not stream:
+            await non_stream_delay(tokens)
+            return JSONResponse(
+                {
+                    "candidates": [
+                        {"content": {"parts": [{"text": "".join(tokens)}], "role": "model"}, "finishReason": "STOP"}
+                    ],
+                    "usageMetadata": usage,
+                }
+            )
+
+        async def events():
+            async for batch in _paced(config, tokens):
+                yield _sse({"candidates": [{"content": {"parts": [{"text": "".join(batch)}], "role": "model"}}]})
+            yield _sse({"candidates": [{"content": {"parts": []}, "finishReason": "STOP"}], "usageMetadata": usage})
+
+        return streaming(events())
+
+    async def embeddings(request: Request):
+        body = await request.json()
+        stats["embeddings"] += 1
+        error = injected_error()
+        if error is not None:
+            return error
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(inputs):
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            data.append({"index": i, "object": "embedding", "embedding": [(b - 128) / 128 for b in digest]})
+        await asyncio.sleep(config.ttft)
+        return JSONResponse({"object": "list", "data": data, "model": body.get("model", "mock")})
+
+    async def create_context(request: Request):
+        body = await request.json()
+        stats["contexts"] += 1
+        context_id = f"ctx-{len(contexts) + 1}"
+        contexts[context_id] = body.get("messages", [])
+        return JSONResponse({"id": context_id, "model": body.get("model"), "mode": body.get("mode"), "ttl": body.get("ttl")})
+
+    async def upload_file(request: Request):
+        form = await request.form()
+        upload = form["file"]
+        file_id = f"file-{len(files) + 1}"
+        files[file_id] = await upload.read()
+        stats["files"] += 1
+        return JSONResponse({"id": file_id, "object": "file", "bytes": len(files[file_id]), "purpose": form.get("purpose")})
+
+    async def file_content(request: Request):
+        file_id = request.path_params["file_id"]
+        if file_id not in files:
+            return JSONResponse({"error": {"message": f"no such file {file_id}"}}, status_code=404)
+        return Response(files[file_id], media_type="application/jsonl")
+
+    def run_batch(batch: Dict[str, Any]) -> None:
+        """Answer every line of a batch's input file, splitting results into output and error files."""
+        output, errors = [], []
+        lines = files[batch["input_file_id"]].decode("utf-8").splitlines()
+        for line in filter(None, map(str.strip, lines)):
+            request = json.loads(line)
+            result = {"id": f"batch_req_{len(output) + len(errors) + 1}", "custom_id": request["custom_id"]}
+            if rng.random() < config.error_rate:
+                error = {"message": "internal error (mock)", "type": "server_error"}
+                errors.append({**result, "response": {"status_code": 500, "body": {"error": error}}, "error": None})
+            else:
+                completion = openai_completion(request["body"])[3]
+                output.append({**result, "response": {"status_code": 200, "body": completion}, "error": None})
+        for name, records in (("output_file_id", output), ("error_file_id", errors)):
+            if records:
+                file_id = f"file-{len(files) + 1}"
+                files[file_id] = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+                batch[name] = file_id
+        batch["status"] = "completed"
+        batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+
+    async def create_batch(request: Request):
+        body = await request.json()
+        if body.get("input_file_id") not in files:
+            return JSONResponse({"error": {"message": "input file not found"}}, status_code=400)
+        batch_id = f"batch_{len(batches) + 1}"
+        batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body.get("endpoint"),
+            "input_file_id": body["input_file_id"],
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "due": time.monotonic() + config.batch_delay,
+        }
+        stats["batches"] += 1
+        return JSONResponse({k: v for k, v in batches[batch_id].items() if k != "due"})
+
+    async def get_batch(request: Request):
+        batch = batches.get(request.path_params["batch_id"])
+        if batch is None:
+            return JSONResponse({"error": {"message": "batch not found"}}, status_code=404)
+        if batch["status"] == "in_progress" and time.monotonic() >= batch["due"]:
+            run_batch(batch)
+        return JSONResponse({k: v for k, v in batch.items() if k != "due"})
+
+    async def get_stats(request: Request):
+        return JSONResponse({**stats, "config": asdict(config)})
+
+    return Starlette(
+        routes=[
+            Route("/v1/chat/completions", openai_chat, methods=["POST"]),
+            Route("/v1/batch/chat/completions", openai_chat, methods=["POST"]),
+            Route("/v1/messages", anthropic_messages, methods=["POST"]),
+            Route("/v1beta/models/{action}", google_generate, methods=["POST"]),
+            Route("/v1/embeddings", embeddings, methods=["POST"]),
+            Route("/v1/context/create", create_context, methods=["POST"]),
+            Route("/v1/context/chat/completions", openai_chat, methods=["POST"]),
+            Route("/v1/files", upload_file, methods=["POST"]),
+            Route("/v1/files/{file_id}/content", file_content),
+            Route("/v1/batches", create_batch, methods=["POST"]),
+            Route("/v1/batches/{batch_id}", get_batch),
+            Route("/stats", get_stats),
+        ]
+    )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class MockServer:
+    """Run the mock server in a subprocess for the duration of a ``with`` block."""
+
+    def __init__(self, config: Optional[MockConfig] = None, port: int = 0):
+        self.config = config or MockConfig()
+        self.port = port or _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._process: Optional[subprocess.Popen] = None
+
+    def provider_env(self) -> Dict[str, str]:
+        """Environment variables pointing every provider in PROVIDER_ENV_MAPPING here."""
+        env = {"EMBEDDING_URL": f"{self.base_url}/v1/embeddings", "EMBEDDING_KEY": "mock-key"}
+        for provider, names in PROVIDER_ENV_MAPPING.items():
+            env[names["api_url"]] = self.base_url + PROVIDER_ROUTES.get(provider, DEFAULT_ROUTE)
+            env[names["api_key"]] = "mock-key"
+        return env
+
+    def __enter__(self) -> "MockServer":
+        args = [sys.executable, "-m", "benchmarks.mock_server", "--port", str(self.port)]
+        for key, value in asdict(self.config).items():
+            if value is not None:
+                args += [f"--{key.replace('_', '-')}", str(value)]
+        self._process = subprocess.Popen(args, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"mock server exited with code {self._process.returncode}")
+            try:
+                httpx.get(f"{self.base_url}/stats", timeout=0.5)
+                return self
+            except httpx.TransportError:
+                time.sleep(0.1)
+        self.__exit__(None, None, None)
+        raise RuntimeError("mock server did not start within 15s")
+
+    def stats(self) -> Dict[str, Any]:
+        return httpx.get(f"{self.base_url}/stats", timeout=5).json()
+
+    def __exit__(self, *exc) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            self._process = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    defaults = MockConfig()
+    for key, value in asdict(defaults).items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value) if value is not None else int, default=value)
+    args = parser.parse_args()
+    config = MockConfig(**{key: getattr(args, key) for key in asdict(defaults)})
+
+    import uvicorn
+
+    print(f"mock LLM server on http://{args.host}:{args.port} ({config})", flush=True)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,159 @@
+import argparse
 import asyncio
-from loguru import logger
-from agents.article_layout_agent import ArticleLayoutAgent
-from utils.ai_client import AIClient
-from prompting.loader import load_all_chat_prompts
+import os
+
+from utils.env import load_env
+
+# Heavy imports (HTTP clients, numpy, pipeline engine) live inside the functions that
+# need them, so `--help` and the unified CLI start without loading them
 
 
 async def main():
+    # The analysis -> layout flow (models, prompts, paths) is declared in
+    # pipelines/definitions/company_analysis.yml and run through the pipeline engine
+    from pipelines.engine import run_pipeline_by_name
+
+    await run_pipeline_by_name("company_analysis")
+
+
+async def run_batch_analysis(
+    source: str,
+    output_dir: str = "./output/batch",
+    model: str = "doubao-seed-1-6-250615",
+    analysis_concurrency: int = 8,
+    layout_concurrency: int = 8,
+    checkpoint_path: str = "",
+    context_budget: int = 0,
+    max_in_flight_tokens: int = 0,
+):
+    """
+    Run analysis-then-layout over every document in a directory or JSONL manifest.
+
+    The two stages have separate concurrency limits so layouts of finished analyses
+    overlap with new analyses. Each report is written as soon as it is ready, and
+    finished ids are checkpointed so a rerun skips them. ``max_in_flight_tokens`` bounds
+    the estimated prompt tokens of documents being processed at once.
+    """
+    from loguru import logger
+
+    from agents.article_layout_agent import ArticleLayoutAgent
+    from prompting.registry import get_prompt
+    from rag.retriever import ContextTrimmer, prompt_queries
+    from utils.ai_client import AIClient
+    from utils.batch_runner import (
+        Checkpoint,
+        Stage,
+        estimate_payload_tokens,
+        iter_input_items,
+        load_text,
+        run_batch,
+    )
+    from utils.file_io import write_text_atomic
+    from utils.http_pool import get_http_pool
+    from utils.response_cache import ResponseCache, is_error_text
+    from utils.telemetry import get_telemetry
+
+    cache = ResponseCache() if os.getenv("AI_RESPONSE_CACHE") == "1" else None
+    prompt = get_prompt("company_analysis")
+    analysis_client = AIClient(model=model, cache=cache, stage="analysis")
+    layout_agent = ArticleLayoutAgent(model=model, cache=cache)
+    checkpoint = Checkpoint(checkpoint_path or os.path.join(output_dir, ".checkpoint.jsonl"))
+    trimmer = ContextTrimmer(token_budget=context_budget) if context_budget else None
+    queries = prompt_queries(prompt)
+    tokens_saved = 0
+
+    async def analyze(payload) -> str:
+        nonlocal tokens_saved
+        content = await load_text(payload)
+        if trimmer is not None:
+            content, trim_report = await trimmer.trim(content, queries)
+            tokens_saved += trim_report.saved_tokens
+        messages = prompt.format()
+        messages.append({"role": "user", "content": content})
+        result = await analysis_client.chat(messages, deep_think="disabled")
+        if not result or is_error_text(result):
+            raise RuntimeError(f"analysis failed: {result[:200] if result else 'empty'}")
+        return result
+
+    async def layout(analysis: str) -> str:
+        result = await layout_agent.format(analysis)
+        if not result or is_error_text(result):
+            raise RuntimeError(f"layout failed: {result[:200] if result else 'empty'}")
+        return result
+
+    async def save(item, report: str):
+        path = os.path.join(output_dir, f"{item.id}.md")
+        await write_text_atomic(path, report)
+        logger.info(f"[{item.id}] report saved to {path}")
+
+    os.makedirs(output_dir, exist_ok=True)
     try:
-        MODEL_NAME = "doubao-seed-1-6-250615"
-        COMPANY_INFO_PATH = "company_info.md"
-        OUTPUT_PATH = "./output/company_analysis.md"
-
-        prompts = load_all_chat_prompts()
-        company_analysis_prompt = prompts["company_analysis"]
-
-        logger.info(f"Loading company information: {COMPANY_INFO_PATH}")
-        with open(COMPANY_INFO_PATH, "r", encoding="utf-8") as f:
-            company_info = f.read()
-        logger.info(f"Company information loaded: {company_info}")
-        # Step 1: Company analysis
-        analysis_client = AIClient(model=MODEL_NAME)
-        analysis_messages = company_analysis_prompt.format()
-
-        analysis_messages.append({"role": "user", "content": company_info})
-
-        logger.info("Generating preliminary company analysis...")
-        first_analysis = await analysis_client.chat(
-            analysis_messages, deep_think="disabled"
+        summary = await run_batch(
+            iter_input_items(source),
+            [
+                Stage("analysis", analyze, analysis_concurrency),
+                Stage("layout", layout, layout_concurrency),
+            ],
+            on_result=save,
+            checkpoint=checkpoint,
+            cost=lambda item: estimate_payload_tokens(item.payload),
+            max_in_flight_cost=max_in_flight_tokens or None,
         )
-        # Check if empty, print content length
-        if not first_analysis or len(first_analysis) == 0:
-            logger.error(
-                "Preliminary analysis result is empty, please check the input content or model configuration"
-            )
-            return
-        else:
-            logger.info(f"Preliminary analysis result length: {len(first_analysis)}")
-        # Step 2: Format layout
-        format_analysis = ArticleLayoutAgent(model=MODEL_NAME)
-        logger.info("Formatting analysis result...")
-        final_response = await format_analysis.format(first_analysis)
-
-        with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-            f.write(final_response)
-        logger.success(f"Analysis report has been saved to: {OUTPUT_PATH}")
-
-    except FileNotFoundError as e:
-        logger.critical(f"File not found: {e.filename}")
-        raise
-    except Exception as e:
-        logger.exception("An unknown error occurred during processing")
-        raise
+        logger.success(f"Batch analysis finished: {summary}")
+        if trimmer is not None:
+            logger.info(f"Context trimming saved {tokens_saved} prompt tokens")
+    finally:
+        checkpoint.close()
+        if cache is not None:
+            cache.log_stats()
+            cache.close()
+        get_telemetry().log_summary()
+        get_telemetry().close()
+        await get_http_pool().aclose()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Company analysis pipeline")
+    parser.add_argument(
+        "--batch", help="Directory of .md/.txt files or a JSONL manifest to process"
+    )
+    parser.add_argument("--output-dir", default="./output/batch")
+    parser.add_argument("--model", default="doubao-seed-1-6-250615")
+    parser.add_argument("--analysis-concurrency", type=int, default=8)
+    parser.add_argument("--layout-concurrency", type=int, default=8)
+    parser.add_argument(
+        "--checkpoint", default="", help="Defaults to <output-dir>/.checkpoint.jsonl"
+    )
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        default=int(os.getenv("AI_CONTEXT_BUDGET", "0")),
+        help="Token budget per input; larger inputs are trimmed to relevant chunks",
+    )
+    parser.add_argument(
+        "--max-in-flight-tokens",
+        type=int,
+        default=0,
+        help="Cap on estimated prompt tokens of documents in flight (0 = unlimited)",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    load_env()
+    args = parse_args()
+    if args.batch:
+        asyncio.run(
+            run_batch_analysis(
+                args.batch,
+                output_dir=args.output_dir,
+                model=args.model,
+                analysis_concurrency=args.analysis_concurrency,
+                layout_concurrency=args.layout_concurrency,
+                checkpoint_path=args.checkpoint,
+                context_budget=args.context_budget,
+                max_in_flight_tokens=args.max_in_flight_tokens,
+            )
+        )
+    else:
+        asyncio.run(main())
@@ -2,6 +2,12 @@ import asyncio
 from fastmcp import Client
 
 
+async def print_progress(progress: float, total: float | None, message: str | None):
+    # Long-running tools send their output chunk by chunk as progress messages
+    if message:
+        print(message, end="", flush=True)
+
+
 async def example():
     async with Client("http://127.0.0.1:8000/mcp/") as client:
         await client.ping()
@@ -16,6 +22,12 @@ async def example():
             if tool.inputSchema:
                 print(f"Parameters: {tool.inputSchema}")
 
+        # The reply arrives through print_progress as it streams
+        await client.call_tool(
+            "chat", {"prompt": "用一句话介绍你自己"}, progress_handler=print_progress
+        )
+        print()
+
 
 if __name__ == "__main__":
     asyncio.run(example())
@@ -1,8 +1,102 @@
 # server.py
+import argparse
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastmcp import FastMCP
+from typing import AsyncIterator, Dict, List, Optional
 
-mcp = FastMCP("Demo 🚀")
+from fastmcp import Context, FastMCP
+from fastmcp.exceptions import ToolError
+
+# Run as `python mcp/server.py`: make the project packages importable without
+# letting this directory shadow the installed `mcp` package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.article_layout_agent import ArticleLayoutAgent  # noqa: E402
+from prompting.registry import get_prompt  # noqa: E402
+from utils.ai_client import AIClient  # noqa: E402
+from utils.env import load_env  # noqa: E402
+from utils.http_pool import get_http_pool  # noqa: E402
+from utils.response_cache import ResponseCache, is_error_text, make_cache_key  # noqa: E402
+from utils.singleflight import SingleFlight  # noqa: E402
+from utils.telemetry import get_telemetry  # noqa: E402
+
+# The server module is only ever run, never imported, so read .env before the settings below
+load_env()
+
+# Upstream calls each tool may have in flight; coalesced callers do not count
+TOOL_CONCURRENCY = {
+    "chat": int(os.getenv("MCP_CHAT_CONCURRENCY", "32")),
+    "company_analysis": int(os.getenv("MCP_COMPANY_ANALYSIS_CONCURRENCY", "4")),
+    "article_layout": int(os.getenv("MCP_ARTICLE_LAYOUT_CONCURRENCY", "8")),
+}
+
+cache = ResponseCache() if os.getenv("AI_RESPONSE_CACHE") == "1" else None
+flights = SingleFlight()
+limits: Dict[str, asyncio.Semaphore] = {}
+clients: Dict[str, AIClient] = {}
+agents: Dict[str, ArticleLayoutAgent] = {}
+
+
+def get_client(model: str) -> AIClient:
+    # One client per model; all of them share the process-wide connection pool
+    if model not in clients:
+        clients[model] = AIClient(model=model, cache=cache, stage="mcp")
+    return clients[model]
+
+
+def get_agent(model: str) -> ArticleLayoutAgent:
+    if model not in agents:
+        agents[model] = ArticleLayoutAgent(model=model, cache=cache)
+    return agents[model]
+
+
+def limited(tool: str, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Hold one of the tool's concurrency slots for as long as the upstream stream runs."""
+
+    async def run():
+        semaphore = limits.setdefault(tool, asyncio.Semaphore(TOOL_CONCURRENCY[tool]))
+        async with semaphore:
+            async for chunk in chunks:
+                yield chunk
+
+    return run()
+
+
+async def respond(tool: str, key: str, start, ctx: Optional[Context]) -> str:
+    """
+    Run (or join) the upstream stream for ``key`` and return the full text.
+
+    Each chunk is also sent as a progress notification when the caller asked for
+    progress, so clients that pass a progress handler see the answer as it is written.
+    """
+    parts: List[str] = []
+    async for chunk in flights.stream(key, lambda: limited(tool, start())):
+        parts.append(chunk)
+        if ctx is not None:
+            await ctx.report_progress(progress=len(parts), message=chunk)
+    result = "".join(parts)
+    if not result or is_error_text(result):
+        raise ToolError(result or f"{tool} returned an empty result")
+    return result
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    try:
+        yield
+    finally:
+        if cache is not None:
+            cache.log_stats()
+            cache.close()
+        get_telemetry().log_summary()
+        get_telemetry().close()
+        await get_http_pool().aclose()
+
+
+mcp = FastMCP("AITools", lifespan=lifespan)
 
 
 @mcp.tool(
@@ -13,5 +107,70 @@ def get_current_time() -> str:
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
+@mcp.tool(
+    name="chat",
+    description="Send a prompt to a language model and return its reply",
+)
+async def chat(prompt: str, system: str = "", model: str = "qwen-plus", ctx: Context = None) -> str:
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    client = get_client(model)
+    key = make_cache_key(model, client.provider, messages, tool="chat")
+    return await respond("chat", key, lambda: client.chat_stream(messages), ctx)
+
+
+@mcp.tool(
+    name="company_analysis",
+    description="Analyse company information and return a formatted markdown report",
+)
+async def company_analysis(
+    company_info: str, model: str = "doubao-seed-1-6-250615", ctx: Context = None
+) -> str:
+    messages = get_prompt("company_analysis").format()
+    messages.append({"role": "user", "content": company_info})
+    client = get_client(model)
+    agent = get_agent(model)
+    key = make_cache_key(model, client.provider, messages, tool="company_analysis")
+
+    def start() -> AsyncIterator[str]:
+        # The report is laid out section by section while the analysis is still streaming
+        analysis = client.chat_stream(messages, deep_think="disabled")
+        return agent.format_sections_stream(analysis)
+
+    return await respond("company_analysis", key, start, ctx)
+
+
+@mcp.tool(
+    name="article_layout",
+    description="Format raw text into a well-structured markdown article",
+)
+async def article_layout(text: str, model: str = "qwen-plus", ctx: Context = None) -> str:
+    agent = get_agent(model)
+    key = make_cache_key(model, agent.client.provider, agent.build_messages(text), tool="article_layout")
+
+    async def start() -> AsyncIterator[str]:
+        if len(text) > agent.long_document_chars:
+            # Map-reduce layout has no useful partial output; send it in one piece
+            yield await agent.format_long(text)
+            return
+        async for chunk in agent.format_stream(text):
+            yield chunk
+
+    return await respond("article_layout", key, start, ctx)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the AI tools over MCP")
+    parser.add_argument("--transport", default="http", choices=["http", "sse", "stdio"])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--path", default="/mcp")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    mcp.run(transport="http", host="0.0.0.0", port=8000, path="/mcp")
+    args = parse_args()
+    if args.transport == "stdio":
+        mcp.run(transport="stdio")
+    else:
+        mcp.run(transport=args.transport, host=args.host, port=args.port, path=args.path)
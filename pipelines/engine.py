@@ -0,0 +1,640 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import yaml
+from loguru import logger
+
+from utils.common import tee_stream_to_file
+from utils.file_io import preview, read_text, write_text_atomic
+from utils.response_cache import ResponseCache, is_error_text
+from utils.telemetry import stage as telemetry_stage
+
+PIPELINE_SUFFIXES = (".yml", ".yaml")
+DEFAULT_MEMO_PATH = ".cache/pipeline_stages.sqlite"
+
+_ENV_RE = re.compile(r"\$\{(\w+)(?::-([^}]*))?\}")
+
+
+class PipelineError(Exception):
+    """Raised for invalid pipeline definitions and failed stages."""
+
+
+def default_pipelines_dir() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "definitions")
+
+
+def _expand_env(value: Any) -> Any:
+    """Substitute ``${VAR}`` / ``${VAR:-default}`` in every string of a loaded definition."""
+    if isinstance(value, str):
+        return _ENV_RE.sub(lambda m: os.getenv(m.group(1), m.group(2) or ""), value)
+    if isinstance(value, list):
+        return [_expand_env(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _expand_env(v) for k, v in value.items()}
+    return value
+
+
+@dataclass
+class InputSpec:
+    """
+    A pipeline input: read from ``file``, else asked interactively with ``ask``, else
+    the literal ``text``. Answers to ``ask`` are saved to ``file`` when one is given.
+    """
+
+    name: str
+    file: str = ""
+    text: str = ""
+    ask: str = ""
+    optional: bool = False
+
+
+@dataclass
+class StageSpec:
+    name: str
+    output: str
+    type: str = "chat"
+    prompt: str = ""
+    model: str = ""
+    inputs: List[str] = field(default_factory=list)
+    stream: bool = False
+    memoize: bool = True
+    context_budget: int = 0
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class IncrementalSpec:
+    """
+    Section-wise runs: ``input`` is split into markdown sections, every stage runs per
+    section, and per-section outputs are kept in ``manifest`` (next to the last declared
+    output by default) so a re-run regenerates only sections whose text or prompts changed.
+    """
+
+    input: str
+    manifest: str = ""
+    max_level: int = 2
+    min_chars: int = 0
+    concurrency: int = 4
+
+
+@dataclass
+class Pipeline:
+    name: str
+    stages: List[StageSpec]
+    inputs: Dict[str, InputSpec] = field(default_factory=dict)
+    outputs: Dict[str, str] = field(default_factory=dict)
+    model: str = ""
+    description: str = ""
+    incremental: Optional[IncrementalSpec] = None
+
+    def __post_init__(self):
+        self._validate()
+
+    def _validate(self) -> None:
+        produced: Dict[str, str] = {}
+        for spec in self.stages:
+            if spec.type not in STAGE_KINDS:
+                raise PipelineError(f"Stage {spec.name!r} has unknown type {spec.type!r}")
+            if spec.output in produced or spec.output in self.inputs:
+                raise PipelineError(f"Output {spec.output!r} of stage {spec.name!r} is defined twice")
+            if not (spec.model or self.model):
+                raise PipelineError(f"Stage {spec.name!r} has no model and the pipeline sets none")
+            produced[spec.output] = spec.name
+        for spec in self.stages:
+            for name in spec.inputs:
+                if name not in produced and name not in self.inputs:
+                    raise PipelineError(f"Stage {spec.name!r} reads unknown input {name!r}")
+        for name in self.outputs:
+            if name not in produced and name not in self.inputs:
+                raise PipelineError(f"Pipeline output {name!r} is not produced by any stage")
+        if self.incremental is not None:
+            if self.incremental.input not in self.inputs:
+                raise PipelineError(f"Incremental input {self.incremental.input!r} is not a pipeline input")
+            if not (self.incremental.manifest or self.outputs):
+                raise PipelineError(f"Pipeline {self.name!r} is incremental but declares no outputs")
+
+        # Reject cycles: repeatedly peel off stages whose inputs are all available
+        available = set(self.inputs)
+        pending = list(self.stages)
+        while pending:
+            ready = [s for s in pending if all(i in available for i in s.inputs)]
+            if not ready:
+                names = ", ".join(s.name for s in pending)
+                raise PipelineError(f"Pipeline {self.name!r} has a dependency cycle among: {names}")
+            for spec in ready:
+                available.add(spec.output)
+                pending.remove(spec)
+
+
+def load_pipeline(path_or_name: str, pipelines_dir: Optional[str] = None) -> Pipeline:
+    """Load a pipeline definition from a YAML path or by name from ``definitions/``."""
+    path = path_or_name
+    if not path.endswith(PIPELINE_SUFFIXES):
+        path = os.path.join(pipelines_dir or default_pipelines_dir(), f"{path_or_name}.yml")
+    with open(path, "r", encoding="utf-8") as f:
+        data = _expand_env(yaml.safe_load(f))
+
+    inputs = {}
+    for name, spec in (data.get("inputs") or {}).items():
+        spec = {"file": spec} if isinstance(spec, str) else dict(spec)
+        inputs[name] = InputSpec(name=name, **spec)
+    stages = []
+    for spec in data.get("stages") or []:
+        spec = dict(spec)
+        if isinstance(spec.get("inputs"), str):
+            spec["inputs"] = [spec["inputs"]]
+        spec["context_budget"] = int(spec.get("context_budget") or 0)
+        stages.append(StageSpec(**spec))
+    incremental = data.get("incremental")
+    if incremental is not None:
+        incremental = {"input": incremental} if isinstance(incremental, str) else dict(incremental)
+        for name in ("max_level", "min_chars", "concurrency"):
+            if name in incremental:
+                incremental[name] = int(incremental[name])
+        incremental = IncrementalSpec(**incremental)
+    return Pipeline(
+        name=data.get("name") or os.path.basename(path).rsplit(".", 1)[0],
+        description=data.get("description", ""),
+        model=data.get("model", ""),
+        inputs=inputs,
+        stages=stages,
+        outputs=data.get("outputs") or {},
+        incremental=incremental,
+    )
+
+
+class StageOutput:
+    """
+    The value of one pipeline variable, published chunk by chunk.
+
+    Any number of consumers can ``stream()`` it (replaying what was already published)
+    or await the complete ``text()``, so a streaming stage can feed the next stage
+    before it has finished.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.chunks: List[str] = []
+        self.done = False
+        self.live = False
+        self.error: Optional[str] = None
+        self._changed = asyncio.Event()
+
+    def mark_live(self) -> None:
+        """The producing stage is running (not served from the memo)."""
+        self.live = True
+        self._notify()
+
+    def publish(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[str] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def settled(self) -> None:
+        """Wait until the value is either complete or being produced live."""
+        while not (self.done or self.live):
+            await self._changed.wait()
+
+    async def stream(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error:
+                    raise PipelineError(f"{self.name!r} is unavailable: {self.error}")
+                return
+            await self._changed.wait()
+
+    async def text(self) -> str:
+        return "".join([chunk async for chunk in self.stream()])
+
+
+@dataclass
+class StageReport:
+    name: str
+    status: str = "pending"  # ran | cached | failed | skipped
+    seconds: float = 0.0
+    chars: int = 0
+
+
+@dataclass
+class RunContext:
+    pipeline: Pipeline
+    values: Dict[str, StageOutput]
+    cache: Optional[ResponseCache]
+    memo: Optional[ResponseCache]
+    pool: Any = None
+    semantic: Any = None
+
+
+def _check(text: str) -> str:
+    if not text or is_error_text(text):
+        raise PipelineError(f"model returned {text[:200] if text else 'an empty result'}")
+    return text
+
+
+async def _chat_stage(spec: StageSpec, model: str, ctx: RunContext, out: StageOutput) -> None:
+    from prompting.registry import get_prompt
+    from utils.ai_client import AIClient
+
+    prompt = get_prompt(spec.prompt)
+    client = AIClient(model=model, cache=ctx.cache, pool=ctx.pool, semantic_cache=ctx.semantic)
+    texts = [await ctx.values[name].text() for name in spec.inputs]
+    if spec.context_budget:
+        from rag.retriever import ContextTrimmer, prompt_queries
+
+        trimmer = ContextTrimmer(token_budget=spec.context_budget)
+        for i, text in enumerate(texts):
+            texts[i], report = await trimmer.trim(text, prompt_queries(prompt))
+            logger.info(f"[{spec.name}] context tokens for {spec.inputs[i]}: {report}")
+
+    messages = prompt.format()
+    messages.extend({"role": "user", "content": text} for text in texts if text.strip())
+    if spec.stream:
+        async for chunk in client.chat_stream(messages, **spec.options):
+            if is_error_text(chunk):
+                raise PipelineError(f"model returned {chunk[:200]}")
+            out.publish(chunk)
+    else:
+        out.publish(_check(await client.chat(messages, **spec.options)))
+
+
+async def _layout_stage(spec: StageSpec, model: str, ctx: RunContext, out: StageOutput) -> None:
+    from agents.article_layout_agent import ArticleLayoutAgent
+
+    agent = ArticleLayoutAgent(model=model, cache=ctx.cache, pool=ctx.pool, **spec.options)
+    if spec.stream and len(spec.inputs) == 1:
+        # Lay out sections while the upstream stage is still generating them
+        async for chunk in agent.format_sections_stream(ctx.values[spec.inputs[0]].stream()):
+            if is_error_text(chunk):
+                raise PipelineError(f"model returned {chunk[:200]}")
+            out.publish(chunk)
+        return
+    text = "\n\n".join([await ctx.values[name].text() for name in spec.inputs])
+    out.publish(_check(await agent.format(text)))
+
+
+def _layout_fingerprint(spec: StageSpec) -> List[str]:
+    from prompting.registry import get_prompt
+
+    names = ("article_layout", "article_layout_section", "article_layout_reduce")
+    return [get_prompt(name).system for name in names]
+
+
+def _chat_fingerprint(spec: StageSpec) -> List[str]:
+    from prompting.registry import get_prompt
+
+    return [get_prompt(spec.prompt).system]
+
+
+StageFn = Callable[[StageSpec, str, RunContext, StageOutput], Awaitable[None]]
+
+# Stage types: (runner, fingerprint of the prompts the stage depends on)
+STAGE_KINDS: Dict[str, tuple] = {
+    "chat": (_chat_stage, _chat_fingerprint),
+    "layout": (_layout_stage, _layout_fingerprint),
+}
+
+
+def stage_key(spec: StageSpec, model: str, inputs: List[str]) -> str:
+    """Memo key: stage definition, the prompts it uses and the exact input texts."""
+    _, fingerprint = STAGE_KINDS[spec.type]
+    payload = {
+        "type": spec.type,
+        "prompt": spec.prompt,
+        "model": model,
+        "options": spec.options,
+        "context_budget": spec.context_budget,
+        "prompts": fingerprint(spec),
+        "inputs": [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in inputs],
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def resolve_inputs(pipeline: Pipeline, overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Read every pipeline input, asking on the console where the definition says so.
+    Files are read and written in worker threads (see utils.file_io).
+    """
+    overrides = overrides or {}
+    values = {}
+    for name, spec in pipeline.inputs.items():
+        if name in overrides:
+            values[name] = overrides[name]
+            continue
+        text = ""
+        if spec.file and os.path.exists(spec.file):
+            text = await read_text(spec.file)
+        if not text.strip() and spec.ask:
+            text = input(f"{spec.ask}\n")
+            if spec.file and text.strip():
+                await write_text_atomic(spec.file, text)
+                logger.info(f"Content has been written to {spec.file}")
+        if not text.strip():
+            text = spec.text
+        if not text.strip() and not spec.optional:
+            raise PipelineError(f"Input {name!r} is empty (file: {spec.file or '-'})")
+        logger.info(f"Input {name!r} loaded ({len(text)} characters)")
+        values[name] = text
+    return values
+
+
+async def _run_stages(
+    pipeline: Pipeline,
+    texts: Dict[str, str],
+    cache: Optional[ResponseCache],
+    memo: Optional[ResponseCache],
+    pool,
+    semantic,
+    write_outputs: bool = True,
+    label: str = "",
+) -> Tuple[Dict[str, StageReport], Dict[str, StageOutput]]:
+    """Run the stages over already-resolved input texts; see run_pipeline."""
+    label = label or pipeline.name
+    values = {name: StageOutput(name) for name in pipeline.inputs}
+    for name, text in texts.items():
+        values[name].publish(text)
+        values[name].finish()
+    for spec in pipeline.stages:
+        values[spec.output] = StageOutput(spec.output)
+    ctx = RunContext(pipeline, values, cache, memo, pool, semantic)
+    reports = {spec.name: StageReport(spec.name) for spec in pipeline.stages}
+
+    async def run_stage(spec: StageSpec) -> None:
+        out = values[spec.output]
+        report = reports[spec.name]
+        model = spec.model or pipeline.model
+        runner, _ = STAGE_KINDS[spec.type]
+        started = time.perf_counter()
+        try:
+            upstream = [values[name] for name in spec.inputs]
+            for value in upstream:
+                await value.settled()
+            use_memo = memo is not None and spec.memoize
+            key = None
+            # A streaming stage fed by a live stage starts right away and cannot be keyed
+            # until its inputs are complete; every other stage waits for its inputs
+            if not (spec.stream and any(not v.done for v in upstream)):
+                texts = [await v.text() for v in upstream]
+                if use_memo:
+                    key = stage_key(spec, model, texts)
+                    cached = memo.get(key)
+                    if cached is not None:
+                        for chunk in cached:
+                            out.publish(chunk)
+                        out.finish()
+                        report.status = "cached"
+                        return
+
+            out.mark_live()
+            with telemetry_stage(spec.name):
+                await runner(spec, model, ctx, out)
+            if use_memo:
+                key = key or stage_key(spec, model, [await v.text() for v in upstream])
+                memo.set(key, ["".join(out.chunks)])
+            out.finish()
+            report.status = "ran"
+        except Exception as e:
+            upstream_failed = any(values[name].error for name in spec.inputs)
+            report.status = "skipped" if upstream_failed else "failed"
+            out.finish(str(e))
+            if not upstream_failed:
+                logger.error(f"[{label}] stage {spec.name!r} failed: {preview(str(e))}")
+        finally:
+            report.seconds = time.perf_counter() - started
+            report.chars = sum(map(len, out.chunks))
+
+    async def write_output(name: str, path: str) -> None:
+        try:
+            async for _ in tee_stream_to_file(values[name].stream(), path):
+                pass
+            logger.success(f"[{label}] {name} saved to {path}")
+        except PipelineError:
+            pass
+
+    outputs = pipeline.outputs.items() if write_outputs else []
+    logger.info(f"Running pipeline {label!r} ({len(pipeline.stages)} stages)")
+    await asyncio.gather(
+        *(run_stage(spec) for spec in pipeline.stages),
+        *(write_output(name, path) for name, path in outputs),
+    )
+    for report in reports.values():
+        logger.info(
+            f"[{label}] stage {report.name}: {report.status} "
+            f"in {report.seconds:.1f}s ({report.chars} characters)"
+        )
+    return reports, values
+
+
+def _failed(reports: Dict[str, StageReport]) -> List[str]:
+    return [r.name for r in reports.values() if r.status in ("failed", "skipped")]
+
+
+async def run_pipeline(
+    pipeline: Pipeline,
+    inputs: Optional[Dict[str, str]] = None,
+    cache: Optional[ResponseCache] = None,
+    memo: Optional[ResponseCache] = None,
+    pool=None,
+    semantic=None,
+    incremental: bool = False,
+) -> Dict[str, StageReport]:
+    """
+    Run every stage as soon as its inputs are available.
+
+    Stages without a dependency between them run concurrently. A streaming stage
+    publishes chunks as they arrive, so a streaming consumer (e.g. layout) starts on
+    the first sections while its source is still being generated. When ``memo`` is
+    given, a stage whose definition, prompts and inputs hash to a stored key is not
+    re-run; editing a prompt therefore re-runs only that stage and what depends on it.
+    Declared outputs are written to their files as they are produced. ``semantic``
+    (a SemanticCache) lets chat stages reuse answers to near-identical requests.
+    ``incremental`` runs the pipeline section by section (see run_incremental).
+    """
+    texts = await resolve_inputs(pipeline, inputs)
+    if incremental:
+        return await run_incremental(pipeline, texts, cache=cache, memo=memo, pool=pool, semantic=semantic)
+    reports, _ = await _run_stages(pipeline, texts, cache, memo, pool, semantic)
+    failed = _failed(reports)
+    if failed:
+        raise PipelineError(f"Pipeline {pipeline.name!r} failed at stage(s): {', '.join(failed)}")
+    return reports
+
+
+def manifest_path(pipeline: Pipeline) -> str:
+    spec = pipeline.incremental
+    if spec.manifest:
+        return spec.manifest
+    return os.path.splitext(list(pipeline.outputs.values())[-1])[0] + ".sections.json"
+
+
+def section_key(pipeline: Pipeline, texts: Dict[str, str]) -> str:
+    """Key of one section run: every input text plus each stage's definition and prompts."""
+    payload = {
+        "inputs": {name: hashlib.sha256(text.encode("utf-8")).hexdigest() for name, text in texts.items()},
+        "stages": [stage_key(spec, spec.model or pipeline.model, []) for spec in pipeline.stages],
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def _load_manifest(path: str) -> Dict[str, Dict[str, str]]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        data = json.loads(await read_text(path))
+        return {entry["key"]: entry["outputs"] for entry in data.get("sections", [])}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable section manifest {path}: {e}")
+        return {}
+
+
+async def run_incremental(
+    pipeline: Pipeline,
+    texts: Dict[str, str],
+    cache: Optional[ResponseCache] = None,
+    memo: Optional[ResponseCache] = None,
+    pool=None,
+    semantic=None,
+) -> Dict[str, StageReport]:
+    """
+    Run the pipeline once per section of its incremental input and splice the results.
+
+    A section whose text, other inputs, stage definitions and prompts hash to an entry
+    of the manifest reuses the stored outputs; the others are regenerated concurrently
+    (up to ``concurrency`` at a time). Outputs are joined in source order with level-1
+    titles after the first section demoted, as in map-reduce layout. The manifest is
+    rewritten with the current sections even when some fail, so a re-run only retries
+    those.
+    """
+    from utils.markdown import demote_titles, split_sections
+
+    spec = pipeline.incremental
+    if spec is None:
+        raise PipelineError(f"Pipeline {pipeline.name!r} does not define an incremental input")
+    sections = split_sections(texts[spec.input], max_level=spec.max_level, min_chars=spec.min_chars)
+    sections = sections or [texts[spec.input]]
+    path = manifest_path(pipeline)
+    previous = await _load_manifest(path)
+
+    section_texts = [{**texts, spec.input: section} for section in sections]
+    keys = [section_key(pipeline, section) for section in section_texts]
+    results: List[Optional[Dict[str, str]]] = [
+        entry if entry and all(name in entry for name in pipeline.outputs) else None
+        for entry in (previous.get(key) for key in keys)
+    ]
+    stale = [i for i, result in enumerate(results) if result is None]
+    logger.info(
+        f"[{pipeline.name}] {len(sections)} sections, {len(sections) - len(stale)} unchanged, "
+        f"{len(stale)} to regenerate"
+    )
+
+    reports = {stage.name: StageReport(stage.name, status="cached") for stage in pipeline.stages}
+    semaphore = asyncio.Semaphore(spec.concurrency)
+    failed: List[int] = []
+
+    async def regenerate(index: int) -> None:
+        async with semaphore:
+            section_reports, values = await _run_stages(
+                pipeline,
+                section_texts[index],
+                cache,
+                memo,
+                pool,
+                semantic,
+                write_outputs=False,
+                label=f"{pipeline.name}#{index + 1}",
+            )
+        for name, report in section_reports.items():
+            total = reports[name]
+            total.seconds += report.seconds
+            total.chars += report.chars
+            if report.status in ("failed", "skipped"):
+                total.status = report.status
+            elif total.status == "cached":
+                total.status = report.status
+        if _failed(section_reports):
+            failed.append(index + 1)
+            return
+        results[index] = {name: await values[name].text() for name in pipeline.outputs}
+
+    await asyncio.gather(*(regenerate(i) for i in stale))
+
+    entries = [
+        {"key": key, "heading": section.strip().split("\n", 1)[0][:80], "outputs": result}
+        for key, section, result in zip(keys, sections, results)
+        if result is not None
+    ]
+    await write_text_atomic(path, json.dumps({"pipeline": pipeline.name, "sections": entries}, ensure_ascii=False, indent=1))
+    if failed:
+        raise PipelineError(
+            f"Pipeline {pipeline.name!r} failed for section(s) {', '.join(map(str, sorted(failed)))}; "
+            f"the others are saved in {path}"
+        )
+    for name, output_path in pipeline.outputs.items():
+        parts = [result[name].strip() for result in results]
+        parts = [parts[0]] + [demote_titles(part) for part in parts[1:]]
+        await write_text_atomic(output_path, "\n\n".join(part for part in parts if part) + "\n")
+        logger.success(f"[{pipeline.name}] {name} saved to {output_path}")
+    return reports
+
+
+async def run_pipeline_by_name(name: str, **kwargs) -> Dict[str, StageReport]:
+    """
+    Load and run a pipeline with the repo's defaults: the response cache when
+    ``AI_RESPONSE_CACHE=1``, the semantic cache when ``AI_SEMANTIC_CACHE=1``, stage
+    memoization unless ``AI_PIPELINE_MEMO=0``, and telemetry/pool cleanup at the end.
+    """
+    from utils.env import load_env
+    from utils.http_pool import get_http_pool
+    from utils.semantic_cache import SemanticCache
+    from utils.telemetry import get_telemetry
+
+    load_env()
+    pipeline = load_pipeline(name)
+    cache = ResponseCache() if os.getenv("AI_RESPONSE_CACHE") == "1" else None
+    memo = ResponseCache(DEFAULT_MEMO_PATH) if os.getenv("AI_PIPELINE_MEMO", "1") != "0" else None
+    semantic = SemanticCache() if os.getenv("AI_SEMANTIC_CACHE") == "1" else None
+    try:
+        return await run_pipeline(pipeline, cache=cache, memo=memo, semantic=semantic, **kwargs)
+    finally:
+        for store in (cache, memo, semantic):
+            if store is not None:
+                store.close()
+        if cache is not None:
+            cache.log_stats()
+        if semantic is not None:
+            semantic.log_stats()
+        get_telemetry().log_summary()
+        get_telemetry().close()
+        await get_http_pool().aclose()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a YAML pipeline definition")
+    parser.add_argument("pipeline", help="Definition name (pipelines/definitions) or YAML path")
+    parser.add_argument(
+        "--incremental", action="store_true", help="Regenerate only changed sections of the incremental input"
+    )
+    args = parser.parse_args()
+    asyncio.run(run_pipeline_by_name(args.pipeline, incremental=args.incremental))
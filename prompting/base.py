@@ -1,12 +1,46 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from string import Formatter
+from typing import FrozenSet, Optional
 
 
 @dataclass
 class ChatPrompt:
     system: str
+    name: str = ""
+    # Minimum cosine similarity for SemanticCache to reuse an answer; None opts out
+    semantic_threshold: Optional[float] = None
+    # Compiled on construction: placeholder names and, if there are none, the rendered text
+    fields: FrozenSet[str] = field(init=False, repr=False)
+    _static: Optional[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        try:
+            parsed = list(Formatter().parse(self.system))
+        except ValueError as e:
+            raise ValueError(f"Invalid placeholder syntax in prompt {self.name!r}: {e}") from e
+        names = set()
+        for _, field_name, _, _ in parsed:
+            if field_name is None:
+                continue
+            if field_name == "" or field_name.isdigit():
+                raise ValueError(
+                    f"Prompt {self.name!r} uses positional placeholders; use named ones"
+                )
+            names.add(field_name.split(".", 1)[0].split("[", 1)[0])
+        self.fields = frozenset(names)
+        self._static = self.system.format() if not names else None
 
     def format(self, **kwargs):
+        if self._static is not None:
+            content = self._static
+        else:
+            missing = self.fields - kwargs.keys()
+            if missing:
+                raise KeyError(
+                    f"Missing values for prompt {self.name!r}: {', '.join(sorted(missing))}"
+                )
+            content = self.system.format(**kwargs)
         return [{
             "role": "system",
-            "content": self.system.format(**kwargs),
+            "content": content,
         }]
@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .base import ChatPrompt
+
+PROMPT_SUFFIXES = (".yml", ".yaml")
+
+
+def default_prompts_dir() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+
+class PromptRegistry:
+    """
+    Process-wide cache of compiled prompts.
+
+    Each YAML file is parsed once and re-read only when its mtime changes. To keep
+    ``get`` close to a dict lookup, files are stat-ed at most once per
+    ``check_interval`` seconds (0 checks on every call, None never re-checks).
+    """
+
+    def __init__(self, prompts_dir: Optional[str] = None, check_interval: Optional[float] = 1.0):
+        self.prompts_dir = prompts_dir or default_prompts_dir()
+        self.check_interval = check_interval
+        self._entries: Dict[str, Tuple[str, float, ChatPrompt]] = {}
+        self._last_scan: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _due(self) -> bool:
+        if self._last_scan is None:
+            return True
+        if self.check_interval is None:
+            return False
+        return time.monotonic() - self._last_scan >= self.check_interval
+
+    def _scan(self) -> None:
+        from .loader import load_chat_prompt_from_yaml
+
+        if not os.path.exists(self.prompts_dir):
+            raise FileNotFoundError(f"目录不存在: {self.prompts_dir}")
+        seen = set()
+        with os.scandir(self.prompts_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(PROMPT_SUFFIXES):
+                    continue
+                name = entry.name.rsplit(".", 1)[0]
+                mtime = entry.stat().st_mtime
+                seen.add(name)
+                cached = self._entries.get(name)
+                if cached is None or cached[0] != entry.path or cached[1] != mtime:
+                    self._entries[name] = (entry.path, mtime, load_chat_prompt_from_yaml(entry.path))
+        for name in set(self._entries) - seen:
+            del self._entries[name]
+        self._last_scan = time.monotonic()
+
+    def refresh(self, force: bool = False) -> None:
+        if force or self._due():
+            with self._lock:
+                if force or self._due():
+                    self._scan()
+
+    def get(self, name: str) -> ChatPrompt:
+        self.refresh()
+        try:
+            return self._entries[name][2]
+        except KeyError:
+            raise KeyError(f"Unknown prompt: {name}") from None
+
+    def all(self) -> Dict[str, ChatPrompt]:
+        self.refresh()
+        return {name: entry[2] for name, entry in self._entries.items()}
+
+
+_registry = PromptRegistry()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    return _registry
+
+
+def get_prompt(name: str) -> ChatPrompt:
+    """Cheap lookup of a compiled prompt from the shared registry."""
+    return _registry.get(name)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List
+
+from utils.markdown import split_sections
+
+
+@dataclass
+class Chunk:
+    id: str  # stable hash of source + position + text
+    source: str
+    heading: str
+    text: str
+
+
+def _heading_of(section: str) -> str:
+    first = section.lstrip("\n").split("\n", 1)[0]
+    return first.lstrip("#").strip() if first.startswith("#") else ""
+
+
+def _windows(text: str, max_chars: int, overlap: int) -> List[str]:
+    """Split an oversized section at paragraph boundaries, hard-cutting only giant paragraphs."""
+    if len(text) <= max_chars:
+        return [text]
+    pieces: List[str] = []
+    for para in text.split("\n\n"):
+        while len(para) > max_chars:
+            pieces.append(para[:max_chars])
+            para = para[max_chars - overlap :]
+        pieces.append(para)
+
+    windows: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            windows.append(current)
+            # Carry the tail of the previous window over for context
+            current = current[-overlap:] if overlap else ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current.strip():
+        windows.append(current)
+    return windows
+
+
+def chunk_markdown(
+    text: str, source: str = "", max_chars: int = 1500, overlap: int = 150
+) -> List[Chunk]:
+    """Split markdown into heading-aligned chunks of at most ``max_chars`` characters."""
+    chunks: List[Chunk] = []
+    for section in split_sections(text, max_level=3):
+        heading = _heading_of(section)
+        for window in _windows(section.strip(), max_chars, overlap):
+            if not window.strip():
+                continue
+            digest = hashlib.sha1(
+                f"{source}\0{len(chunks)}\0{window}".encode("utf-8")
+            ).hexdigest()
+            chunks.append(Chunk(id=digest, source=source, heading=heading, text=window))
+    return chunks
+
+
+def iter_document_chunks(
+    paths: Iterable[str], max_chars: int = 1500, overlap: int = 150
+) -> Iterator[Chunk]:
+    """Read documents one at a time and yield their chunks, keeping memory flat."""
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        yield from chunk_markdown(text, source=path, max_chars=max_chars, overlap=overlap)
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+from rag.chunker import Chunk, iter_document_chunks
+from rag.local_store import LOCAL_URI_PREFIX, LocalVectorStore
+from utils.embedding_client import EmbeddingClient
+
+DEFAULT_LITE_URI = "./milvus.db"
+
+# Build parameters per index type; searched with the matching SEARCH_PARAMS
+INDEX_PARAMS = {
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {"nlist": 1024},
+    "FLAT": {},
+    "AUTOINDEX": {},
+}
+SEARCH_PARAMS = {
+    "HNSW": {"ef": 64},
+    "IVF_FLAT": {"nprobe": 16},
+    "FLAT": {},
+    "AUTOINDEX": {},
+}
+
+
+def filter_literal(value: str) -> str:
+    """Double-quoted, backslash-escaped string literal for a Milvus filter expression."""
+    return json.dumps(value, ensure_ascii=False)
+
+
+@dataclass
+class MilvusConfig:
+    collection: str = "documents"
+    dim: Optional[int] = None  # inferred from the first embedded batch when unset
+    db_name: str = ""  # ignored by milvus-lite, which has a single database
+    index_type: str = "HNSW"
+    metric_type: str = "COSINE"
+    index_params: Dict[str, Any] = field(default_factory=dict)
+    max_text_length: int = 8192
+
+
+@dataclass
+class IngestReport:
+    documents: int = 0
+    rows: int = 0
+    embed_seconds: float = 0.0
+    insert_seconds: float = 0.0
+    index_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.total_seconds if self.total_seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.rows} rows from {self.documents} documents in {self.total_seconds:.2f}s "
+            f"({self.rows_per_second:.1f} rows/s; embed {self.embed_seconds:.2f}s, "
+            f"insert {self.insert_seconds:.2f}s, index {self.index_seconds:.2f}s)"
+        )
+
+
+def get_milvus_client(uri: Optional[str] = None, token: Optional[str] = None):
+    """
+    Connect to Milvus. Without ``MILVUS_URL`` this opens a local milvus-lite file;
+    a ``local://<dir>`` URI returns the in-process LocalVectorStore instead.
+    """
+    uri = uri or os.getenv("MILVUS_URL", "").strip() or DEFAULT_LITE_URI
+    if uri.startswith(LOCAL_URI_PREFIX):
+        return LocalVectorStore(uri[len(LOCAL_URI_PREFIX) :] or None)
+
+    from pymilvus import MilvusClient
+
+    if token is None:
+        user = os.getenv("MILVUS_USER", "").strip()
+        password = os.getenv("MILVUS_PASSWORD", "").strip()
+        token = f"{user}:{password}" if user else ""
+    return MilvusClient(uri=uri, token=token)
+
+
+def ensure_collection(client, config: MilvusConfig, drop: bool = False) -> None:
+    """Create the collection without an index so bulk inserts are not slowed down."""
+    if config.db_name:
+        try:
+            if config.db_name not in client.list_databases():
+                client.create_database(db_name=config.db_name)
+            client.use_database(db_name=config.db_name)
+        except Exception as e:
+            logger.warning(f"Database {config.db_name!r} unavailable, using default: {e}")
+
+    if client.has_collection(config.collection):
+        if not drop:
+            return
+        client.drop_collection(config.collection)
+
+    if isinstance(client, LocalVectorStore):
+        client.create_collection(
+            config.collection, dimension=config.dim, metric_type=config.metric_type
+        )
+        return
+
+    from pymilvus import DataType, MilvusClient
+
+    schema = MilvusClient.create_schema(auto_id=True, description="Document chunks")
+    schema.add_field("id", DataType.INT64, is_primary=True)
+    schema.add_field("embedding", DataType.FLOAT_VECTOR, dim=config.dim)
+    schema.add_field("chunk_id", DataType.VARCHAR, max_length=64)
+    schema.add_field("source", DataType.VARCHAR, max_length=512)
+    schema.add_field("heading", DataType.VARCHAR, max_length=512)
+    schema.add_field("text", DataType.VARCHAR, max_length=config.max_text_length)
+    client.create_collection(config.collection, schema=schema)
+
+
+def build_index(client, config: MilvusConfig) -> None:
+    """Build the ANN index once all rows are loaded, then load the collection for search."""
+    existing = client.list_indexes(config.collection)
+    if existing:
+        client.release_collection(config.collection)
+        for name in existing:
+            client.drop_index(config.collection, name)
+    params = client.prepare_index_params()
+    params.add_index(
+        field_name="embedding",
+        index_type=config.index_type,
+        metric_type=config.metric_type,
+        params=config.index_params or INDEX_PARAMS.get(config.index_type, {}),
+    )
+    client.create_index(config.collection, params)
+    client.load_collection(config.collection)
+
+
+def _truncate_bytes(text: str, limit: int) -> str:
+    # VARCHAR limits are in bytes; CJK text takes three bytes per character
+    return text.encode("utf-8")[:limit].decode("utf-8", "ignore")
+
+
+def _rows(chunks: List[Chunk], vectors, config: MilvusConfig) -> List[Dict[str, Any]]:
+    return [
+        {
+            "embedding": vector,
+            "chunk_id": chunk.id,
+            "source": _truncate_bytes(chunk.source, 512),
+            "heading": _truncate_bytes(chunk.heading, 512),
+            "text": _truncate_bytes(chunk.text, config.max_text_length),
+        }
+        for chunk, vector in zip(chunks, vectors)
+    ]
+
+
+async def ingest_chunks(
+    chunks: Iterable[Chunk],
+    embedder: EmbeddingClient,
+    client,
+    config: MilvusConfig,
+    batch_size: int = 1000,
+    drop: bool = False,
+    build: bool = True,
+) -> IngestReport:
+    """
+    Embed and insert chunks in large batches, then build the index.
+
+    Embedding of batch N+1 overlaps with the (blocking) insert of batch N, which runs
+    in a worker thread. Rows previously ingested from the same source files are
+    deleted first, so re-ingesting a document replaces it instead of duplicating it.
+    """
+    report = IngestReport()
+    started = time.perf_counter()
+    created = False
+    pending_insert: Optional[asyncio.Future] = None
+    sources = set()
+    cleared = set()
+
+    async def flush(batch: List[Chunk]):
+        nonlocal created, pending_insert
+        t0 = time.perf_counter()
+        vectors = await embedder.embed([chunk.text for chunk in batch])
+        report.embed_seconds += time.perf_counter() - t0
+        if not created:
+            config.dim = config.dim or int(vectors.shape[1])
+            ensure_collection(client, config, drop=drop)
+            created = True
+        if pending_insert is not None:
+            await pending_insert
+        # Match sources as they were stored, i.e. truncated like in _rows
+        stale = {_truncate_bytes(chunk.source, 512) for chunk in batch} - cleared
+        if stale and not drop:
+            quoted = ", ".join(filter_literal(source) for source in sorted(stale))
+            await asyncio.to_thread(
+                client.delete, config.collection, filter=f"source in [{quoted}]"
+            )
+        cleared.update(stale)
+        rows = _rows(batch, vectors.tolist(), config)
+
+        def insert():
+            t1 = time.perf_counter()
+            client.insert(config.collection, rows)
+            report.insert_seconds += time.perf_counter() - t1
+
+        pending_insert = asyncio.ensure_future(asyncio.to_thread(insert))
+        report.rows += len(rows)
+
+    batch: List[Chunk] = []
+    for chunk in chunks:
+        sources.add(chunk.source)
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    if pending_insert is not None:
+        await pending_insert
+
+    report.documents = len(sources)
+    if created and build:
+        t0 = time.perf_counter()
+        await asyncio.to_thread(build_index, client, config)
+        report.index_seconds = time.perf_counter() - t0
+    report.total_seconds = time.perf_counter() - started
+    logger.info(f"Ingest finished: {report}")
+    return report
+
+
+async def ingest_documents(
+    paths: Iterable[str],
+    embedder: Optional[EmbeddingClient] = None,
+    client=None,
+    config: Optional[MilvusConfig] = None,
+    batch_size: int = 1000,
+    max_chars: int = 1500,
+    drop: bool = False,
+) -> IngestReport:
+    """Chunk, embed and bulk-load markdown files into Milvus."""
+    embedder = embedder or EmbeddingClient()
+    client = client or get_milvus_client()
+    config = config or MilvusConfig()
+    chunks = iter_document_chunks(paths, max_chars=max_chars)
+    return await ingest_chunks(chunks, embedder, client, config, batch_size=batch_size, drop=drop)
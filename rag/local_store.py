@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import re
+import shutil
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+LOCAL_URI_PREFIX = "local://"
+
+_IN_FILTER = re.compile(r'^\s*(\w+)\s+in\s+\[(.*)\]\s*$')
+_EQ_FILTER = re.compile(r'^\s*(\w+)\s*==\s*(".*")\s*$')
+
+
+def _parse_filter(expr: str):
+    """Support the two filter shapes we use against Milvus: ``f in ["a", ...]`` and ``f == "a"``."""
+    match = _IN_FILTER.match(expr)
+    if match:
+        values = set(json.loads(f"[{match.group(2)}]"))
+        return lambda row: row.get(match.group(1)) in values
+    match = _EQ_FILTER.match(expr)
+    if match:
+        value = json.loads(match.group(2))
+        return lambda row: row.get(match.group(1)) == value
+    raise ValueError(f"Unsupported filter expression: {expr}")
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd's k-means on (a sample of) the vectors; returns float32 centroids."""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), k * 32), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids.astype(np.float32)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, batch: int = 65536) -> np.ndarray:
+    out = np.empty(len(vectors), dtype=np.int32)
+    c_norm = (centroids**2).sum(axis=1)
+    for start in range(0, len(vectors), batch):
+        part = vectors[start : start + batch]
+        out[start : start + batch] = np.argmin(c_norm - 2 * part @ centroids.T, axis=1)
+    return out
+
+
+class _Buffer:
+    """A numpy array with spare capacity, doubled as needed so appends are amortised O(1)."""
+
+    def __init__(self, data: np.ndarray):
+        self._data = data
+        self.size = len(data)
+
+    @property
+    def view(self) -> np.ndarray:
+        return self._data[: self.size]
+
+    def extend(self, values: np.ndarray) -> np.ndarray:
+        needed = self.size + len(values)
+        if needed > len(self._data):
+            grown = np.empty((max(needed, 2 * len(self._data)),) + self._data.shape[1:], dtype=self._data.dtype)
+            grown[: self.size] = self._data[: self.size]
+            self._data = grown
+        self._data[self.size : needed] = values
+        self.size = needed
+        return self.view
+
+
+class _Collection:
+    """Vectors in an append-only float32 file (memory-mapped for search) plus row metadata."""
+
+    def __init__(self, path: Optional[str], dim: int, metric_type: str = "COSINE"):
+        self.path = path
+        self.dim = dim
+        self.metric_type = metric_type
+        self.rows: List[Dict[str, Any]] = []
+        self.deleted = np.zeros(0, dtype=bool)
+        self.index: Dict[str, Any] = {"index_type": "FLAT"}
+        self.centroids: Optional[np.ndarray] = None
+        self.assign: Optional[np.ndarray] = None
+        self._lists: Optional[List[np.ndarray]] = None  # inverted lists, rebuilt lazily
+        # In-memory collections keep their vectors here; persistent ones memory-map the file
+        self._vector_buffer = _Buffer(np.zeros((0, dim), dtype=np.float32))
+        self._vectors = self._vector_buffer.view
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    # Per-row arrays live in growable buffers; the attributes are views of the used part
+
+    @property
+    def deleted(self) -> np.ndarray:
+        return self._deleted.view
+
+    @deleted.setter
+    def deleted(self, value: np.ndarray) -> None:
+        self._deleted = _Buffer(value)
+
+    @property
+    def assign(self) -> Optional[np.ndarray]:
+        return self._assign.view if self._assign is not None else None
+
+    @assign.setter
+    def assign(self, value: Optional[np.ndarray]) -> None:
+        self._assign = _Buffer(value) if value is not None else None
+
+    # -- persistence -------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self) -> None:
+        if os.path.exists(self._file("meta.jsonl")):
+            with open(self._file("meta.jsonl"), "r", encoding="utf-8") as f:
+                self.rows = [json.loads(line) for line in f if line.strip()]
+        self.deleted = np.zeros(len(self.rows), dtype=bool)
+        if os.path.exists(self._file("deleted.npy")):
+            saved = np.load(self._file("deleted.npy"))
+            self.deleted[: len(saved)] = saved[: len(self.rows)]
+        if os.path.exists(self._file("index.json")):
+            with open(self._file("index.json"), "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        if os.path.exists(self._file("centroids.npy")):
+            self.centroids = np.load(self._file("centroids.npy"))
+            self.assign = np.load(self._file("assign.npy"))
+        self._map()
+
+    def _map(self) -> None:
+        if not self.path:
+            return
+        n = len(self.rows)
+        vec_file = self._file("vectors.f32")
+        if n == 0 or not os.path.exists(vec_file):
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            return
+        self._vectors = np.memmap(vec_file, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def _save_state(self) -> None:
+        if not self.path:
+            return
+        np.save(self._file("deleted.npy"), self.deleted)
+        with open(self._file("index.json"), "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        if self.centroids is not None:
+            np.save(self._file("centroids.npy"), self.centroids)
+            np.save(self._file("assign.npy"), self.assign)
+
+    # -- data --------------------------------------------------------------
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.metric_type == "COSINE":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def append(self, vectors: np.ndarray, rows: List[Dict[str, Any]]) -> List[int]:
+        vectors = self._prepare(vectors)
+        start = len(self.rows)
+        ids = list(range(start, start + len(rows)))
+        for row_id, row in zip(ids, rows):
+            row["id"] = row_id
+        if self.path:
+            with open(self._file("vectors.f32"), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._file("meta.jsonl"), "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.rows.extend(rows)
+            self._map()
+        else:
+            self.rows.extend(rows)
+            self._vectors = self._vector_buffer.extend(vectors)
+        self._deleted.extend(np.zeros(len(rows), dtype=bool))
+        if self.centroids is not None:
+            # Incremental append: new vectors join their nearest existing partition
+            self._assign.extend(_nearest(vectors, self.centroids))
+            self._lists = None
+        self._save_state()
+        return ids
+
+    def delete(self, predicate) -> int:
+        count = 0
+        for i, row in enumerate(self.rows):
+            if not self.deleted[i] and predicate(row):
+                self.deleted[i] = True
+                count += 1
+        self._lists = None
+        self._save_state()
+        return count
+
+    def build_ivf(self, nlist: int) -> None:
+        live = np.flatnonzero(~self.deleted)
+        nlist = max(1, min(nlist, len(live)))
+        self.centroids = kmeans(np.asarray(self._vectors[live]), nlist)
+        self.assign = _nearest(np.asarray(self._vectors), self.centroids)
+        self.index = {"index_type": "IVF_FLAT", "nlist": nlist}
+        self._lists = None
+        self._save_state()
+
+    def drop_index(self) -> None:
+        self.index = {"index_type": "FLAT"}
+        self.centroids = self.assign = self._lists = None
+        if self.path:
+            for name in ("centroids.npy", "assign.npy"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+        self._save_state()
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            live = np.flatnonzero(~self.deleted)
+            order = live[np.argsort(self.assign[live], kind="stable")]
+            bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[i] : bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._lists
+
+    def _scores(self, subset: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        if self.metric_type == "L2":
+            return -(
+                (subset**2).sum(axis=1)[None, :] - 2 * queries @ subset.T + (queries**2).sum(axis=1)[:, None]
+            )
+        return queries @ subset.T
+
+    @staticmethod
+    def _top(scores: np.ndarray, limit: int) -> np.ndarray:
+        k = min(limit, scores.shape[-1])
+        if k == 0:
+            return np.zeros((scores.shape[0], 0), dtype=np.int64)
+        top = np.argpartition(-scores, k - 1, axis=-1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1)
+        return np.take_along_axis(top, order, axis=-1)
+
+    def _hits(self, ids: np.ndarray, scores: np.ndarray) -> List[tuple]:
+        sign = -1.0 if self.metric_type == "L2" else 1.0
+        return [
+            (int(i), sign * float(s)) for i, s in zip(ids, scores) if np.isfinite(s)
+        ]
+
+    def search(self, queries: np.ndarray, limit: int, nprobe: int) -> List[List[tuple]]:
+        queries = self._prepare(np.atleast_2d(queries))
+        if self.centroids is None:
+            return self._search_exact(queries, limit)
+
+        lists = self._inverted_lists()
+        probes = self._top(self._scores_to_centroids(queries), nprobe)
+        results = []
+        for q, probe in zip(queries, probes):
+            candidates = np.concatenate([lists[c] for c in probe])
+            scores = self._scores(np.asarray(self._vectors[candidates]), q[None, :])
+            top = self._top(scores, limit)[0]
+            results.append(self._hits(candidates[top], scores[0, top]))
+        return results
+
+    def _scores_to_centroids(self, queries: np.ndarray) -> np.ndarray:
+        return -((self.centroids**2).sum(axis=1)[None, :] - 2 * queries @ self.centroids.T)
+
+    def _search_exact(self, queries: np.ndarray, limit: int, block: int = 65536) -> List[List[tuple]]:
+        """Brute force over all vectors, scoring every query against a block at a time."""
+        n = len(self.rows)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, n, block):
+            scores = self._scores(np.asarray(self._vectors[start : start + block]), queries)
+            scores[:, self.deleted[start : start + block]] = -np.inf
+            top = self._top(scores, limit)
+            best_ids = np.concatenate([best_ids, top + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            keep = self._top(best_scores, limit)
+            best_ids = np.take_along_axis(best_ids, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        return [self._hits(ids, scores) for ids, scores in zip(best_ids, best_scores)]
+
+
+class _IndexParams(list):
+    def add_index(self, field_name: str, index_type: str = "FLAT", metric_type: str = "COSINE", params=None, **_):
+        self.append({"field_name": field_name, "index_type": index_type, "metric_type": metric_type, "params": params or {}})
+
+
+class LocalVectorStore:
+    """
+    In-process stand-in for the parts of ``MilvusClient`` this repo uses.
+
+    Collections live under ``path`` (one directory each) or purely in memory when
+    ``path`` is None. Search is exact and vectorized until an ``IVF_FLAT`` index is
+    created, which partitions vectors with k-means and probes the ``nprobe`` nearest
+    partitions; ``HNSW`` requests are served by the same IVF index. Collections smaller
+    than ``ivf_min_rows`` always stay on exact search.
+    """
+
+    def __init__(self, path: Optional[str] = None, ivf_min_rows: int = 20_000):
+        self.path = path
+        self.ivf_min_rows = ivf_min_rows
+        self._collections: Dict[str, _Collection] = {}
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def _dir(self, name: str) -> Optional[str]:
+        return os.path.join(self.path, name) if self.path else None
+
+    def _get(self, name: str) -> _Collection:
+        if name not in self._collections:
+            directory = self._dir(name)
+            config_file = directory and os.path.join(directory, "collection.json")
+            if not config_file or not os.path.exists(config_file):
+                raise KeyError(f"Collection not found: {name}")
+            with open(config_file, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            self._collections[name] = _Collection(directory, config["dim"], config["metric_type"])
+        return self._collections[name]
+
+    def has_collection(self, collection_name: str) -> bool:
+        try:
+            self._get(collection_name)
+            return True
+        except KeyError:
+            return False
+
+    def create_collection(self, collection_name: str, dimension: int, metric_type: str = "COSINE", **_):
+        directory = self._dir(collection_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, "collection.json"), "w", encoding="utf-8") as f:
+                json.dump({"dim": dimension, "metric_type": metric_type}, f)
+        self._collections[collection_name] = _Collection(directory, dimension, metric_type)
+
+    def drop_collection(self, collection_name: str) -> None:
+        self._collections.pop(collection_name, None)
+        directory = self._dir(collection_name)
+        if directory and os.path.isdir(directory):
+            shutil.rmtree(directory)
+
+    def list_databases(self) -> List[str]:
+        # A local store is a single database
+        return ["default"]
+
+    def insert(self, collection_name: str, data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        collection = self._get(collection_name)
+        vectors = np.asarray([row["embedding"] for row in data], dtype=np.float32)
+        rows = [{k: v for k, v in row.items() if k != "embedding"} for row in data]
+        ids = collection.append(vectors, rows)
+        return {"insert_count": len(ids), "ids": ids}
+
+    def delete(self, collection_name: str, filter: str = "", **_) -> Dict[str, int]:
+        return {"delete_count": self._get(collection_name).delete(_parse_filter(filter))}
+
+    def prepare_index_params(self) -> _IndexParams:
+        return _IndexParams()
+
+    def list_indexes(self, collection_name: str) -> List[str]:
+        index_type = self._get(collection_name).index["index_type"]
+        return [] if index_type == "FLAT" else ["embedding"]
+
+    def create_index(self, collection_name: str, index_params: _IndexParams, **_) -> None:
+        collection = self._get(collection_name)
+        for spec in index_params:
+            live_rows = int((~collection.deleted).sum())
+            if spec["index_type"] == "FLAT" or live_rows < self.ivf_min_rows:
+                collection.drop_index()
+                continue
+            nlist = spec["params"].get("nlist") or int(np.sqrt(live_rows))
+            logger.debug(f"Building IVF index on {collection_name} ({live_rows} rows, nlist={nlist})")
+            collection.build_ivf(nlist)
+
+    def drop_index(self, collection_name: str, index_name: str = "embedding") -> None:
+        self._get(collection_name).drop_index()
+
+    def load_collection(self, collection_name: str) -> None:
+        self._get(collection_name)
+
+    def release_collection(self, collection_name: str) -> None:
+        pass
+
+    def search(
+        self,
+        collection_name: str,
+        data: List[List[float]],
+        limit: int = 10,
+        output_fields: Optional[List[str]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        **_,
+    ) -> List[List[Dict[str, Any]]]:
+        collection = self._get(collection_name)
+        params = (search_params or {}).get("params", {})
+        nlist = collection.index.get("nlist", 1)
+        nprobe = params.get("nprobe") or max(1, nlist // 16)
+        results = []
+        for hits in collection.search(np.asarray(data, dtype=np.float32), limit, nprobe):
+            out = []
+            for row_id, distance in hits:
+                row = collection.rows[row_id]
+                entity = {k: row.get(k) for k in (output_fields or [])}
+                out.append({"id": row_id, "distance": distance, "entity": entity})
+            results.append(out)
+        return results
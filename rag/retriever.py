@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import uuid
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from prompting.base import ChatPrompt
+from rag.chunker import Chunk, chunk_markdown
+from rag.ingest import SEARCH_PARAMS, MilvusConfig, build_index, ensure_collection
+from rag.local_store import LocalVectorStore
+from utils.embedding_client import EmbeddingClient
+from utils.markdown import split_sections
+from utils.tokens import estimate_tokens
+
+
+def prompt_queries(prompt: ChatPrompt, min_chars: int = 20) -> List[str]:
+    """Use each headed section of a system prompt as one retrieval query."""
+    queries = []
+    for section in split_sections(prompt.system, max_level=3):
+        section = section.strip()
+        if section.startswith("#") and len(section) >= min_chars:
+            queries.append(section)
+    return queries or [prompt.system]
+
+
+@dataclass
+class TrimReport:
+    original_tokens: int
+    context_tokens: int
+    chunks_total: int = 0
+    chunks_selected: int = 0
+    trimmed: bool = False
+    scores: List[float] = field(default_factory=list)
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.context_tokens
+
+    def __str__(self) -> str:
+        ratio = self.saved_tokens / self.original_tokens if self.original_tokens else 0.0
+        return (
+            f"{self.original_tokens} -> {self.context_tokens} tokens "
+            f"(saved {self.saved_tokens}, {ratio:.0%}; "
+            f"{self.chunks_selected}/{self.chunks_total} chunks)"
+        )
+
+
+class ContextTrimmer:
+    """
+    Shrink a source document to the chunks most relevant to a prompt.
+
+    Documents within ``token_budget`` pass through untouched. Larger ones are chunked
+    and embedded; the top ``top_k`` chunks for every query are pooled, ranked by their
+    best score, added greedily until the budget is reached and emitted in original
+    document order. Search runs in an in-memory LocalVectorStore by default; pass a
+    ``MilvusClient`` (or a persistent store) as ``vector_store`` to search there instead;
+    each trim then uses its own temporary collection (dropped afterwards), so
+    concurrent trims sharing a store do not see each other's chunks.
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[EmbeddingClient] = None,
+        token_budget: int = 6000,
+        top_k: int = 4,
+        max_chars: int = 800,
+        vector_store=None,
+        store_config: Optional[MilvusConfig] = None,
+    ):
+        self.embedder = embedder or EmbeddingClient()
+        self.token_budget = token_budget
+        self.top_k = top_k
+        self.max_chars = max_chars
+        self.vector_store = vector_store
+        self.store_config = store_config or MilvusConfig(
+            collection="context_trim", index_type="FLAT"
+        )
+
+    def _search(
+        self, chunks: List[Chunk], chunk_vectors: np.ndarray, query_vectors: np.ndarray
+    ) -> Dict[int, float]:
+        """Blocking: index the chunks and search them. Run off the event loop."""
+        client = self.vector_store if self.vector_store is not None else LocalVectorStore()
+        config = replace(
+            self.store_config,
+            collection=f"{self.store_config.collection}_{uuid.uuid4().hex[:12]}",
+            dim=int(chunk_vectors.shape[1]),
+        )
+        ensure_collection(client, config, drop=True)
+        try:
+            return self._index_and_search(client, config, chunks, chunk_vectors, query_vectors)
+        finally:
+            client.drop_collection(config.collection)
+
+    def _index_and_search(
+        self,
+        client,
+        config: MilvusConfig,
+        chunks: List[Chunk],
+        chunk_vectors: np.ndarray,
+        query_vectors: np.ndarray,
+    ) -> Dict[int, float]:
+        client.insert(
+            config.collection,
+            [
+                {
+                    "embedding": vector,
+                    "chunk_id": str(i),
+                    "source": chunk.source,
+                    "heading": chunk.heading[:512],
+                    "text": "",
+                }
+                for i, (chunk, vector) in enumerate(zip(chunks, chunk_vectors.tolist()))
+            ],
+        )
+        build_index(client, config)
+        hits = client.search(
+            config.collection,
+            query_vectors.tolist(),
+            limit=self.top_k,
+            output_fields=["chunk_id"],
+            search_params={"metric_type": config.metric_type, "params": SEARCH_PARAMS.get(config.index_type, {})},
+        )
+        best: Dict[int, float] = {}
+        for per_query in hits:
+            for hit in per_query:
+                idx = int(hit["entity"]["chunk_id"])
+                best[idx] = max(best.get(idx, -1.0), float(hit["distance"]))
+        return best
+
+    async def trim(self, source: str, queries: List[str]) -> Tuple[str, TrimReport]:
+        original_tokens = estimate_tokens(source)
+        if original_tokens <= self.token_budget:
+            return source, TrimReport(original_tokens, original_tokens)
+
+        chunks = chunk_markdown(source, source="context", max_chars=self.max_chars, overlap=0)
+        vectors = await self.embedder.embed([chunk.text for chunk in chunks] + queries)
+        chunk_vectors, query_vectors = vectors[: len(chunks)], vectors[len(chunks) :]
+        best = await asyncio.to_thread(self._search, chunks, chunk_vectors, query_vectors)
+
+        selected, used = [], 0
+        for idx, score in sorted(best.items(), key=lambda item: -item[1]):
+            cost = estimate_tokens(chunks[idx].text)
+            if used + cost > self.token_budget:
+                continue
+            selected.append((idx, score))
+            used += cost
+
+        selected.sort()
+        context = "\n\n".join(chunks[idx].text for idx, _ in selected)
+        report = TrimReport(
+            original_tokens=original_tokens,
+            context_tokens=estimate_tokens(context),
+            chunks_total=len(chunks),
+            chunks_selected=len(selected),
+            trimmed=True,
+            scores=[score for _, score in selected],
+        )
+        logger.debug(f"Context trimmed: {report}")
+        return context, report
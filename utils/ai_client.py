@@ -1,24 +1,95 @@
 ﻿# -*- coding: utf-8 -*-
-import json
+import asyncio
 import os
 from loguru import logger
-from typing import List, Dict, Any, AsyncGenerator, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, AsyncGenerator, AsyncIterator, Optional
 
 import httpx
-from dotenv import load_dotenv
 
 # Import model config
-from utils.model_config import detect_provider, get_provider_env, get_provider_parser
-
-load_dotenv()
+from utils.model_config import (
+    detect_provider,
+    get_prefix_cache_config,
+    get_provider_env,
+    get_provider_parser,
+)
+from utils.http_pool import HTTPPool, get_http_pool
+from utils.prompt_cache import (
+    get_context_cache,
+    mark_cache_control,
+    order_stable_prefix,
+    split_prefix,
+)
+from utils.rate_limit import (
+    RETRYABLE_STATUS,
+    CircuitOpenError,
+    ProviderLimiter,
+    get_limiter,
+    parse_retry_after,
+)
+from utils.response_cache import ResponseCache, is_error_text, make_cache_key
+from utils.sse import StreamAccumulator, StreamEvent, StreamParser, loads, usage_from_response
+from utils.env import load_env
+from utils.file_io import preview
+from utils.telemetry import CallRecord, Telemetry, current_stage, get_telemetry
+from utils.tokens import (
+    ContextOverflowError,
+    RequestEstimate,
+    estimate_messages,
+    estimate_request,
+    estimate_tokens,
+    split_messages,
+    truncate_messages,
+)
+
+if TYPE_CHECKING:
+    # numpy-backed; only needed when a semantic cache is passed in
+    from utils.semantic_cache import SemanticCache, SemanticLookup
+
+OVERFLOW_POLICIES = {"reject", "truncate", "split"}
+# Providers that only report usage on streams when asked via stream_options
+STREAM_USAGE_PROVIDERS = {"openai", "qwen", "volcengine"}
 
 
 class AIClient:
-    def __init__(self, model: str):
+    def __init__(
+        self,
+        model: str,
+        pool: Optional[HTTPPool] = None,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[ProviderLimiter] = None,
+        overflow_policy: str = "reject",
+        stage: str = "",
+        telemetry: Optional[Telemetry] = None,
+        prefix_cache: bool = True,
+        semantic_cache: Optional["SemanticCache"] = None,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {sorted(OVERFLOW_POLICIES)}")
+        load_env()
         self.model = model
         self.provider = detect_provider(model)
         self.api_key, self.api_url = self._load_provider_env()
+        # Provider root for the other endpoints (context caches); api_url itself may be
+        # redirected, e.g. to a batch inference endpoint
+        self.base_url = self.api_url.rsplit("/chat/completions", 1)[0]
         self.parser = get_provider_parser(self.provider)
+        # Connections are shared with every other AIClient using the same pool
+        self.pool = pool or get_http_pool()
+        # Opt-in completion cache; None disables caching entirely
+        self.cache = cache
+        # Opt-in similarity cache consulted after an exact-cache miss
+        self.semantic_cache = semantic_cache
+        # Rate limits, retries and the circuit breaker are shared per provider
+        self.limiter = limiter or get_limiter(self.provider)
+        # What to do with prompts larger than the context window: reject, truncate or split
+        self.overflow_policy = overflow_policy
+        # Pipeline stage used to tag telemetry; falls back to telemetry.stage() context
+        self.stage = stage
+        self.telemetry = telemetry or get_telemetry()
+        # Provider-side prompt prefix caching (cache_control blocks / context caches)
+        self.prefix_cache = prefix_cache
+        self.prefix_cache_config = get_prefix_cache_config(self.provider) if prefix_cache else None
 
     def _load_provider_env(self) -> tuple[str, str]:
         env_config = get_provider_env(self.provider)
@@ -57,6 +128,15 @@ class AIClient:
         self, messages: List[Dict[str, str]], stream: bool, **kwargs
     ) -> Dict[str, Any]:
         base_payload = {"model": self.model, "stream": stream, **kwargs}
+        if self.prefix_cache:
+            # Providers cache by exact prefix, so the repeated system prompt must come first
+            messages = order_stable_prefix(messages)
+
+        # Cap the output to what the model allows and what is left of its context window
+        if "max_tokens" not in kwargs and self.provider != "google":
+            base_payload["max_tokens"] = self.estimate(messages).output_cap
+        if stream and self.provider in STREAM_USAGE_PROVIDERS and "stream_options" not in kwargs:
+            base_payload["stream_options"] = {"include_usage": True}
 
         if self.provider == "anthropic":
             system_msg = next(
@@ -64,14 +144,11 @@ class AIClient:
             )
             user_messages = [msg for msg in messages if msg["role"] != "system"]
 
-            base_payload.update(
-                {
-                    "max_tokens": kwargs.get("max_tokens", 4000),
-                    "messages": user_messages,
-                }
-            )
+            base_payload["messages"] = user_messages
             if system_msg:
                 base_payload["system"] = system_msg
+                if self._worth_caching(estimate_tokens(system_msg, self.provider)):
+                    mark_cache_control(base_payload)
         else:
             base_payload["messages"] = messages
 
@@ -87,42 +164,397 @@ class AIClient:
             base_payload.pop("deep_think", None)
         return base_payload
 
-    async def chat(
-        self, messages: List[Dict[str, str]], stream: bool = False, **kwargs: Any
-    ) -> Any:
-        headers = self._get_headers()
+    def _worth_caching(self, prefix_tokens: int) -> bool:
+        config = self.prefix_cache_config
+        return config is not None and prefix_tokens >= config["min_tokens"]
+
+    async def _prepare_payload(
+        self, messages: List[Dict[str, str]], stream: bool, **kwargs
+    ) -> Dict[str, Any]:
+        """Build the payload, replacing a long system prefix with a context cache where supported."""
         payload = self._build_payload(messages, stream, **kwargs)
+        config = self.prefix_cache_config
+        if config is None or config["mode"] != "context":
+            return payload
+        prefix, rest = split_prefix(payload["messages"])
+        if not rest or not self._worth_caching(estimate_messages(prefix, self.provider)):
+            return payload
+        context_id = await get_context_cache().context_id(self, prefix, config)
+        if context_id:
+            payload["context_id"] = context_id
+            payload["messages"] = rest
+        return payload
+
+    def _build_url(self, payload: Optional[Dict[str, Any]] = None, path: Optional[str] = None) -> str:
         url = self.api_url
+        if path is None and payload is not None and "context_id" in payload:
+            path = self.prefix_cache_config["chat_path"]
+        if path is not None:
+            url = self.base_url + path
         if get_provider_env(self.provider).get("key_in_query"):
-            url = f"{self.api_url}?key={self.api_key}"
-
-        try:
-            async with httpx.AsyncClient(timeout=1800) as client:
-                response = await client.post(url, headers=headers, json=payload)
+            return f"{url}?key={self.api_key}"
+        return url
+
+    def _new_record(self, stream: bool) -> CallRecord:
+        return CallRecord(
+            model=self.model,
+            provider=self.provider,
+            stage=self.stage or current_stage(),
+            stream=stream,
+        )
+
+    async def _open_response(
+        self, payload: Dict[str, Any], record: Optional[CallRecord] = None, path: Optional[str] = None
+    ) -> httpx.Response:
+        """Send the request on a pooled connection and return once headers arrive."""
+        client = self.pool.get(self.provider)
+        request = client.build_request(
+            "POST", self._build_url(payload, path), headers=self._get_headers(), json=payload
+        )
+        if record is not None:
+            record.bytes_sent += len(request.content)
+            request.extensions["trace"] = self._connect_tracer(record)
+        # Bound the wait for response headers separately from the body read timeout
+        return await asyncio.wait_for(
+            client.send(request, stream=True),
+            timeout=self.pool.first_byte_timeout(self.provider),
+        )
+
+    @staticmethod
+    def _connect_tracer(record: CallRecord):
+        """httpcore trace hook adding TCP and TLS setup time to ``record.connect_time``."""
+        started: Dict[str, float] = {}
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if not event_name.startswith(("connection.connect_tcp", "connection.start_tls")):
+                return
+            step, _, phase = event_name.rpartition(".")
+            if phase == "started":
+                started[step] = record.elapsed()
+            elif phase in ("complete", "failed") and step in started:
+                record.connect_time += record.elapsed() - started.pop(step)
+
+        return trace
+
+    def estimate(self, messages: List[Dict[str, str]]) -> RequestEstimate:
+        """Estimate prompt size and output budget for ``messages`` on this model."""
+        return estimate_request(messages, self.model, self.provider)
+
+    def _fit_messages(self, messages: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+        """
+        Apply the overflow policy, returning one or more requests that fit the context window.
+
+        Raises ContextOverflowError under the ``reject`` policy or when the prompt cannot
+        be shrunk (e.g. the system prompt alone is too large).
+        """
+        estimate = self.estimate(messages)
+        if estimate.fits:
+            return [messages]
+        detail = (
+            f"prompt of ~{estimate.prompt_tokens} tokens exceeds the "
+            f"{estimate.context_window}-token context window of {self.model}"
+        )
+        if self.overflow_policy == "truncate":
+            logger.warning(f"{detail}; truncating")
+            return [truncate_messages(messages, estimate.prompt_budget, self.provider)]
+        if self.overflow_policy == "split":
+            requests = split_messages(messages, estimate.prompt_budget, self.provider)
+            logger.warning(f"{detail}; splitting into {len(requests)} requests")
+            return requests
+        raise ContextOverflowError(detail)
+
+    def _estimate_request_tokens(self, payload: Dict[str, Any]) -> int:
+        tokens = estimate_messages(payload.get("messages", []), self.provider)
+        system = payload.get("system")
+        if isinstance(system, list):
+            system = "".join(block.get("text", "") for block in system)
+        if isinstance(system, str):
+            tokens += estimate_tokens(system, self.provider)
+        return tokens + int(payload.get("max_tokens") or 0)
+
+    async def _send_with_retry(
+        self, payload: Dict[str, Any], record: Optional[CallRecord] = None, path: Optional[str] = None
+    ) -> httpx.Response:
+        """
+        Open a response under the provider's rate limits, retrying transient failures.
+
+        ``path`` sends the payload to another endpoint under ``base_url`` instead of the
+        chat completions URL.
+
+        Retryable statuses and transport errors are retried with jittered exponential
+        backoff that honours Retry-After. The last failing response is returned (or the
+        last transport error raised) once retries are exhausted. Only 5xx responses and
+        transport errors count as circuit breaker failures; a 429 is backpressure that
+        pauses the provider's callers instead. Any other answer from the provider
+        (including a 4xx) counts as a success; an attempt that ends without one (e.g.
+        cancelled or throttled) releases a half-open probe.
+        """
+        limiter = self.limiter
+        tokens = self._estimate_request_tokens(payload)
+        attempt = 0
+        while True:
+            probe = limiter.breaker.check(self.provider)
+            try:
+                waited = await limiter.acquire(tokens)
+                if record is not None:
+                    record.queue_wait += waited
+                    record.retries = attempt
+                response = await self._open_response(payload, record, path)
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                limiter.breaker.record_failure()
+                if attempt >= limiter.max_retries:
+                    raise
+                delay = limiter.backoff_delay(attempt)
+                reason = repr(e)
+            except BaseException:
+                if probe:
+                    limiter.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    # The provider answered: a client error says nothing about its health
+                    limiter.breaker.record_success()
+                    if response.status_code != 200 and "context_id" in payload:
+                        # The context may have expired early; recreate it next time
+                        get_context_cache().invalidate(payload["context_id"])
+                    return response
+                if response.status_code >= 500:
+                    limiter.breaker.record_failure()
+                elif probe:
+                    # Throttled: the provider is up, so leave the breaker as it was
+                    limiter.breaker.release()
+                if attempt >= limiter.max_retries:
+                    return response
+                retry_after = parse_retry_after(response.headers.get("retry-after"))
+                await response.aclose()
+                delay = limiter.backoff_delay(attempt, retry_after)
+                if response.status_code == 429:
+                    limiter.pause(retry_after or delay)
+                reason = f"status {response.status_code}"
+
+            attempt += 1
+            logger.warning(
+                f"{self.provider} request failed ({reason}), "
+                f"retry {attempt}/{limiter.max_retries} in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
 
-                if response.status_code != 200:
-                    return f"[Request Failed] {response.status_code} - {response.text}"
+    def _cache_key(
+        self, messages: List[Dict[str, str]], use_cache: bool, kwargs: Dict[str, Any]
+    ) -> Optional[str]:
+        if self.cache is None or not use_cache:
+            return None
+        return make_cache_key(self.model, self.provider, messages, **kwargs)
 
-                if stream:
-                    return self._stream_response(response)
-                else:
-                    return self._parse_non_stream_response(response)
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool = False,
+        use_cache: bool = True,
+        **kwargs: Any,
+    ) -> Any:
+        if stream:
+            return self.chat_stream(messages, use_cache=use_cache, **kwargs)
+
+        cache_key = self._cache_key(messages, use_cache, kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._record_cached(stream=False)
+                return "".join(cached)
+        semantic = await self._semantic_lookup(messages, use_cache, kwargs)
+        if semantic is not None and semantic.chunks is not None:
+            self._record_cached(stream=False)
+            return "".join(semantic.chunks)
 
-        except httpx.TimeoutException:
-            return "[Error] Request timed out, please try again later"
-        except httpx.RequestError as e:
+        try:
+            requests = self._fit_messages(messages)
+        except ContextOverflowError as e:
             return f"[Request Failed] {e}"
+        if len(requests) == 1:
+            result = await self._chat_once(requests[0], **kwargs)
+        else:
+            parts = await asyncio.gather(*(self._chat_once(r, **kwargs) for r in requests))
+            error = next((part for part in parts if is_error_text(part)), None)
+            result = error or "\n\n".join(parts)
+        if result and not is_error_text(result):
+            if cache_key is not None:
+                self.cache.set(cache_key, [result])
+            if semantic is not None:
+                self.semantic_cache.store(semantic, [result])
+        return result
+
+    async def _semantic_lookup(
+        self, messages: List[Dict[str, str]], use_cache: bool, kwargs: Dict[str, Any]
+    ) -> Optional["SemanticLookup"]:
+        if self.semantic_cache is None or not use_cache:
+            return None
+        return await self.semantic_cache.lookup(self.model, messages, **kwargs)
+
+    def _record_cached(self, stream: bool) -> None:
+        record = self._new_record(stream)
+        record.status = "cached"
+        self.telemetry.record(record)
+
+    def _finish_record(self, record: CallRecord, error: Optional[str] = None) -> None:
+        record.latency = record.elapsed()
+        if error is not None and record.status == "ok":
+            record.status, record.error = "error", error[:500]
+        self.telemetry.record(record)
+
+    async def _chat_once(self, messages: List[Dict[str, str]], **kwargs: Any) -> str:
+        record = self._new_record(stream=False)
+        result = ""
+        try:
+            payload = await self._prepare_payload(messages, False, **kwargs)
+            response = await self._send_with_retry(payload, record)
+            # Non-streaming calls get their first byte with the response headers
+            record.mark_first_token()
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+                record.bytes_received += response.num_bytes_downloaded
+
+            if response.status_code != 200:
+                result = f"[Request Failed] {response.status_code} - {response.text}"
+            else:
+                result = self._parse_non_stream_response(response, record)
+
+        except asyncio.CancelledError:
+            # Hedge losers and timed-out callers: neither ok nor an error
+            record.status = "cancelled"
+            raise
+        except CircuitOpenError as e:
+            result = f"[Request Failed] {e}"
+        except (httpx.TimeoutException, asyncio.TimeoutError):
+            result = "[Error] Request timed out, please try again later"
+        except httpx.RequestError as e:
+            result = f"[Request Failed] {e}"
         except Exception as e:
-            return f"[Unknown Error] {e}"
+            result = f"[Unknown Error] {e}"
+        finally:
+            self._finish_record(record, result if is_error_text(result) else None)
+        return result
+
+    async def chat_stream(
+        self, messages: List[Dict[str, str]], use_cache: bool = True, **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """
+        Stream the completion token by token.
+
+        The iterator owns its response: the connection stays open while it is being
+        consumed and is returned to the pool when iteration ends or is abandoned.
+        Cached responses are replayed chunk by chunk; a fresh stream is cached only
+        once it has been consumed completely without errors.
+        """
+        cache_key = self._cache_key(messages, use_cache, kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._record_cached(stream=True)
+                for chunk in cached:
+                    yield chunk
+                return
+        semantic = await self._semantic_lookup(messages, use_cache, kwargs)
+        if semantic is not None and semantic.chunks is not None:
+            self._record_cached(stream=True)
+            for chunk in semantic.chunks:
+                yield chunk
+            return
+
+        chunks: List[str] = []
+        async for event in self.stream_events(messages, **kwargs):
+            if event.type == "content" or event.type == "error":
+                chunks.append(event.text)
+                yield event.text
+
+        if chunks and not any(map(is_error_text, chunks)):
+            if cache_key is not None:
+                self.cache.set(cache_key, chunks)
+            if semantic is not None:
+                self.semantic_cache.store(semantic, chunks)
+
+    async def stream_events(
+        self, messages: List[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        Stream structured events (content, reasoning, usage, finish, error), uncached.
+
+        Failures are reported as ``error`` events carrying the usual in-band error text.
+        """
+        try:
+            requests = self._fit_messages(messages)
+        except ContextOverflowError as e:
+            yield StreamEvent("error", f"[Request Failed] {e}")
+            return
+
+        for i, request in enumerate(requests):
+            if i:
+                yield StreamEvent("content", "\n\n")
+            async for event in self._stream_once(request, **kwargs):
+                yield event
+
+    async def _stream_once(
+        self, messages: List[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[StreamEvent]:
+        record = self._new_record(stream=True)
+        error: Optional[str] = None
+        try:
+            payload = await self._prepare_payload(messages, True, **kwargs)
+            response = await self._send_with_retry(payload, record)
+        except CircuitOpenError as e:
+            error = f"[Request Failed] {e}"
+        except (httpx.TimeoutException, asyncio.TimeoutError):
+            error = "[Error] Request timed out, please try again later"
+        except httpx.RequestError as e:
+            error = f"[Request Failed] {e}"
+        except Exception as e:
+            error = f"[Unknown Error] {e}"
+        if error is not None:
+            self._finish_record(record, error)
+            yield StreamEvent("error", error)
+            return
 
-    def _parse_non_stream_response(self, response: httpx.Response) -> str:
+        produced: List[str] = []
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                error = f"[Request Failed] {response.status_code} - {response.text}"
+                yield StreamEvent("error", error)
+                return
+
+            async for event in self._stream_response(response):
+                if event.type == "content" or event.type == "reasoning":
+                    record.mark_first_token()
+                    produced.append(event.text)
+                elif event.type == "usage":
+                    record.add_usage(event.usage)
+                elif event.type == "error" and error is None:
+                    error = event.text
+                yield event
+        except (GeneratorExit, asyncio.CancelledError):
+            record.status = "cancelled"
+            raise
+        finally:
+            await response.aclose()
+            record.bytes_received += response.num_bytes_downloaded
+            if not record.completion_tokens and produced:
+                # Provider sent no usage block; fall back to an estimate
+                record.completion_tokens = estimate_tokens("".join(produced), self.provider)
+            self._finish_record(record, error)
+
+    def _parse_non_stream_response(
+        self, response: httpx.Response, record: Optional[CallRecord] = None
+    ) -> str:
         try:
-            data = response.json()
-            # Check if reasoning_content is output
-            if data["choices"][0]["message"].get("reasoning_content"):
-                logger.debug(
-                    f"reasoning_content: {data['choices'][0]['message']['reasoning_content']}"
-                )
+            data = loads(response.content)
+            if record is not None:
+                record.add_usage(usage_from_response(self.provider, data))
+            # Check if reasoning_content is output (OpenAI-compatible responses only)
+            message = (data.get("choices") or [{}])[0].get("message") or {}
+            if message.get("reasoning_content"):
+                logger.debug(f"reasoning_content: {preview(message['reasoning_content'])}")
             else:
                 logger.debug("No reasoning_content field detected")
 
@@ -131,54 +563,33 @@ class AIClient:
 
             return data["choices"][0]["message"]["content"]
 
-        except (KeyError, IndexError, json.JSONDecodeError) as e:
+        except (KeyError, IndexError, ValueError) as e:
             return f"[Parse Error] Abnormal return format: {e}\nRaw response: {response.text[:500]}"
 
     async def _stream_response(
         self, response: httpx.Response
-    ) -> AsyncGenerator[str, None]:
-        buffer = ""
-
-        try:
-            async for line in response.aiter_lines():
-                if not line or line.strip() == "":
-                    continue
+    ) -> AsyncGenerator[StreamEvent, None]:
+        parser = StreamParser(self.provider)
+        result = StreamAccumulator()
 
-                content = self._extract_stream_content(line.strip())
-                if content:
-                    buffer += content
-                    yield content
-
-        except Exception as e:
-            yield f"\n[Stream Parse Exception] {e}"
-
-        if not buffer.strip():
-            yield "[Warning] No valid content received"
-
-    def _extract_stream_content(self, line: str) -> Optional[str]:
         try:
-            if line.startswith("data:"):
-                line = line[5:].strip()
-
-            if line in ["[DONE]", "data: [DONE]"]:
-                return None
+            async for chunk in response.aiter_bytes():
+                for event in parser.feed(chunk):
+                    result.add(event)
+                    yield event
+            for event in parser.flush():
+                result.add(event)
+                yield event
 
-            chunk = json.loads(line)
-
-            if self.parser and "stream" in self.parser:
-                return self.parser["stream"](chunk)
-
-            choices = chunk.get("choices", [])
-            if choices:
-                delta = choices[0].get("delta", {})
-                return delta.get("content", "")
-
-        except json.JSONDecodeError:
-            pass
         except Exception as e:
-            return f"[Parse Error: {e}]"
-
-        return None
+            yield StreamEvent("error", f"\n[Stream Parse Exception] {e}")
+
+        if result.reasoning:
+            logger.debug(f"reasoning_content: {preview(result.reasoning)}")
+        if result.usage:
+            logger.debug(f"{self.model} usage: {result.usage}, finish: {result.finish_reason}")
+        if not result.content.strip() and not result.errors:
+            yield StreamEvent("error", "[Warning] No valid content received")
 
     def get_model_info(self) -> Dict[str, str]:
         return {
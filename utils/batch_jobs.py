@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from loguru import logger
+
+from prompting.registry import get_prompt
+from utils.ai_client import AIClient
+from utils.batch_runner import BatchItem, BatchSummary, Checkpoint, Stage, run_batch
+from utils.env import load_env
+from utils.file_io import JSONLWriter, preview, write_text_atomic
+from utils.http_pool import get_http_pool
+from utils.model_config import get_batch_api
+from utils.rate_limit import RETRYABLE_STATUS
+from utils.response_cache import is_error_text
+from utils.sse import loads
+
+# OpenAI caps a batch input file at 50,000 requests
+MAX_BATCH_REQUESTS = 50_000
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+@dataclass
+class ChatRequest:
+    id: str
+    messages: List[Dict[str, str]]
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+def load_requests(path: str) -> List[ChatRequest]:
+    """
+    Read a JSONL file of chat requests.
+
+    Each line names a ChatPrompt template and fills it in::
+
+        {"id": "acme", "prompt": "company_analysis", "vars": {}, "input": "...", "options": {"deep_think": "disabled"}}
+
+    ``input`` becomes the user message; ``messages`` may be given instead of (or after)
+    a template for free-form conversations. Lines without an ``id`` are numbered.
+    """
+    requests = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            messages = get_prompt(record["prompt"]).format(**record.get("vars", {})) if record.get("prompt") else []
+            messages.extend(record.get("messages", []))
+            if "input" in record:
+                messages.append({"role": "user", "content": record["input"]})
+            if not messages:
+                raise ValueError(f"{path}:{line_no}: request has no prompt, messages or input")
+            requests.append(ChatRequest(str(record.get("id", line_no)), messages, record.get("options", {})))
+    ids = [r.id for r in requests]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"{path}: request ids must be unique")
+    return requests
+
+
+class OrderedWriter:
+    """
+    Write result records to a JSONL file in input order as they arrive.
+
+    Records that finish early are held back until every record before them has been
+    written. Lines go to ``<path>.part`` (which can be tailed while the job runs) and
+    the file is moved into place on close, so ``path`` never holds a torn line. A job
+    that stops early calls ``abandon`` instead, leaving the partial ``.part`` file.
+    """
+
+    def __init__(self, path: str, ids: List[str]):
+        self._order = ids
+        self._next = 0
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._writer = JSONLWriter(path)
+
+    async def put(self, record: Dict[str, Any]) -> None:
+        self._pending[record["id"]] = record
+        while self._next < len(self._order) and self._order[self._next] in self._pending:
+            await self._writer.write_record(self._pending.pop(self._order[self._next]))
+            self._next += 1
+
+    async def close(self) -> None:
+        await self._writer.commit()
+
+    async def abandon(self) -> None:
+        await self._writer.close_partial()
+
+
+class BatchAPIError(RuntimeError):
+    """A batch API call answered with a non-200 status."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FilesBatchAPI:
+    """
+    OpenAI-style batch API: upload a JSONL input file, create a batch, poll it and
+    download the output and error files. Also served by DashScope's compatible mode.
+    """
+
+    def __init__(self, client: AIClient, completion_window: str = "24h"):
+        self.client = client
+        self.base_url = client.base_url
+        self.completion_window = completion_window
+
+    @property
+    def _http(self) -> httpx.AsyncClient:
+        return self.client.pool.get(self.client.provider)
+
+    def _headers(self, json_body: bool = True) -> Dict[str, str]:
+        headers = self.client._get_headers()
+        if not json_body:
+            headers.pop("Content-Type", None)
+        return headers
+
+    async def _json(self, method: str, url: str, **kwargs: Any) -> Dict[str, Any]:
+        response = await self._http.request(method, url, **kwargs)
+        if response.status_code != 200:
+            raise BatchAPIError(
+                f"{method} {url} failed: {response.status_code} - {response.text[:500]}", response.status_code
+            )
+        return loads(response.content)
+
+    async def submit(self, requests: List[ChatRequest]) -> str:
+        lines = []
+        for request in requests:
+            body = self.client._build_payload(request.messages, False, **request.options)
+            body.pop("stream", None)
+            lines.append(json.dumps(
+                {"custom_id": request.id, "method": "POST", "url": "/v1/chat/completions", "body": body},
+                ensure_ascii=False,
+            ))
+        upload = await self._json(
+            "POST",
+            f"{self.base_url}/files",
+            headers=self._headers(json_body=False),
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", ("\n".join(lines) + "\n").encode("utf-8"), "application/jsonl")},
+        )
+        batch = await self._json(
+            "POST",
+            f"{self.base_url}/batches",
+            headers=self._headers(),
+            json={
+                "input_file_id": upload["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": self.completion_window,
+            },
+        )
+        logger.info(f"Submitted batch {batch['id']} with {len(requests)} requests")
+        return batch["id"]
+
+    async def wait(self, batch_id: str, poll_interval: float) -> Dict[str, Any]:
+        while True:
+            try:
+                batch = await self._json("GET", f"{self.base_url}/batches/{batch_id}", headers=self._headers())
+            except httpx.RequestError as e:
+                # A dropped connection says nothing about the batch itself; keep waiting
+                logger.warning(f"Polling batch {batch_id} failed: {e}")
+            except BatchAPIError as e:
+                # Neither do throttling or a transient server error
+                if e.status_code not in RETRYABLE_STATUS:
+                    raise
+                logger.warning(f"Polling batch {batch_id} failed: {e}")
+            else:
+                if batch["status"] in BATCH_FINAL_STATUSES:
+                    return batch
+                logger.debug(f"Batch {batch_id} is {batch['status']}: {batch.get('request_counts')}")
+            await asyncio.sleep(poll_interval)
+
+    async def results(self, batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Return one record per request found in the output and error files."""
+        records = []
+        for name in ("output_file_id", "error_file_id"):
+            if not batch.get(name):
+                continue
+            response = await self._http.get(f"{self.base_url}/files/{batch[name]}/content", headers=self._headers())
+            if response.status_code != 200:
+                raise RuntimeError(f"Downloading {name} of batch {batch['id']} failed: {response.status_code}")
+            # Split on newlines only: the JSON may contain other Unicode line separators
+            for line in response.content.split(b"\n"):
+                if line.strip():
+                    records.append(self._to_record(loads(line)))
+        return records
+
+    def _to_record(self, line: Dict[str, Any]) -> Dict[str, Any]:
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or body.get("error") or {}
+            message = error.get("message", "unknown error") if isinstance(error, dict) else str(error)
+            return {"id": line["custom_id"], "status": "failed", "error": f"{response.get('status_code')} - {message}"}
+        try:
+            if self.client.parser and "non_stream" in self.client.parser:
+                content = self.client.parser["non_stream"](body)
+            else:
+                content = body["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            return {"id": line["custom_id"], "status": "failed", "error": f"abnormal response format: {e}"}
+        if not content:
+            return {"id": line["custom_id"], "status": "failed", "error": "no content in response"}
+        return {"id": line["custom_id"], "status": "done", "content": content, "usage": body.get("usage")}
+
+
+async def run_chat_batch(
+    source: str,
+    output: str,
+    model: str,
+    checkpoint_path: str = "",
+    mode: str = "auto",
+    concurrency: int = 8,
+    poll_interval: float = 30.0,
+) -> BatchSummary:
+    """
+    Answer every request in ``source`` and write one result line per request to ``output``.
+
+    ``mode`` is ``batch-api`` (submit to the provider's batch API and poll), ``concurrent``
+    (interactive calls through run_batch) or ``auto``, which uses the batch API when the
+    provider has one. Results are written in input order. Each result is checkpointed
+    with its content, so rerunning the job rewrites the output and retries only the
+    lines that failed or never finished; a submitted batch that was still running is
+    picked up again instead of being resubmitted.
+    """
+    requests = await asyncio.to_thread(load_requests, source)
+    checkpoint = Checkpoint(checkpoint_path or f"{output}.checkpoint.jsonl", keep_results=True)
+    writer = OrderedWriter(output, [r.id for r in requests])
+    client = AIClient(model=model, stage="batch")
+    summary = BatchSummary(total=len(requests))
+    started = time.perf_counter()
+
+    async def finish(record: Dict[str, Any]) -> None:
+        if record["status"] == "done":
+            summary.succeeded += 1
+            checkpoint.record(record["id"], "done", **{k: v for k, v in record.items() if k not in ("id", "status")})
+        else:
+            summary.failed += 1
+            logger.error(f"Batch request {record['id']} failed: {preview(record.get('error'))}")
+            checkpoint.record(record["id"], "failed", error=record.get("error"))
+        await writer.put(record)
+
+    pending = []
+    for request in requests:
+        if request.id in checkpoint.done:
+            summary.skipped += 1
+            await writer.put(checkpoint.results[request.id])
+        else:
+            pending.append(request)
+
+    batch_api = get_batch_api(client.provider)
+    if mode == "batch-api" and (batch_api is None or batch_api["mode"] != "files"):
+        raise ValueError(f"{client.provider} has no files-based batch API; use --mode concurrent")
+    use_files = mode != "concurrent" and batch_api is not None and batch_api["mode"] == "files"
+    if mode != "concurrent" and batch_api is not None and batch_api["mode"] == "endpoint":
+        # Dedicated batch inference endpoint: same wire format, higher limits, run locally
+        client.api_url = client.api_url.replace("/chat/completions", batch_api["path"])
+
+    try:
+        if pending and use_files:
+            await _run_files_batch(
+                FilesBatchAPI(client, batch_api["completion_window"]),
+                pending,
+                f"{checkpoint.path}.batch",
+                poll_interval,
+                finish,
+            )
+        elif pending:
+            await _run_concurrent(client, pending, concurrency, finish)
+    except BaseException:
+        # Keep the incomplete output out of place; the checkpoint lets a rerun resume
+        await writer.abandon()
+        logger.error(f"Chat batch stopped early, partial results in {output}.part")
+        raise
+    else:
+        await writer.close()
+    finally:
+        checkpoint.close()
+        await get_http_pool().aclose()
+    summary.elapsed = time.perf_counter() - started
+    logger.success(f"Chat batch finished: {summary}, results in {output}")
+    return summary
+
+
+async def _run_files_batch(
+    api: FilesBatchAPI,
+    pending: List[ChatRequest],
+    state_path: str,
+    poll_interval: float,
+    finish: Callable[[Dict[str, Any]], Awaitable[None]],
+):
+    # The ids of submitted batches are kept next to the checkpoint until their results are in
+    submitted: List[str] = []
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            submitted = json.load(f)
+        logger.info(f"Resuming submitted batches {submitted}")
+    else:
+        for start in range(0, len(pending), MAX_BATCH_REQUESTS):
+            submitted.append(await api.submit(pending[start : start + MAX_BATCH_REQUESTS]))
+            await write_text_atomic(state_path, json.dumps(submitted))
+
+    # A resumed batch may also hold requests whose results were already recorded
+    waiting = {request.id for request in pending}
+    for batch_id in submitted:
+        batch = await api.wait(batch_id, poll_interval)
+        logger.info(f"Batch {batch_id} {batch['status']}: {batch.get('request_counts')}")
+        for record in await api.results(batch):
+            if record["id"] in waiting:
+                waiting.discard(record["id"])
+                await finish(record)
+    for request in pending:
+        if request.id in waiting:
+            await finish({"id": request.id, "status": "failed", "error": "missing from batch results"})
+    os.remove(state_path)
+
+
+async def _run_concurrent(
+    client: AIClient,
+    pending: List[ChatRequest],
+    concurrency: int,
+    finish: Callable[[Dict[str, Any]], Awaitable[None]],
+):
+    async def call(request: ChatRequest) -> Dict[str, Any]:
+        result = await client.chat(request.messages, **request.options)
+        if not result or is_error_text(result):
+            return {"id": request.id, "status": "failed", "error": result[:500] if result else "empty result"}
+        return {"id": request.id, "status": "done", "content": result}
+
+    async def on_result(item: BatchItem, record: Dict[str, Any]) -> None:
+        await finish(record)
+
+    await run_batch(
+        (BatchItem(r.id, r) for r in pending),
+        [Stage("chat", call, concurrency)],
+        on_result=on_result,
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of chat requests offline")
+    parser.add_argument("input", help="JSONL file of chat requests")
+    parser.add_argument("output", help="JSONL file to write results to, in input order")
+    parser.add_argument("--model", default="qwen-plus")
+    parser.add_argument("--mode", choices=["auto", "batch-api", "concurrent"], default="auto")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--poll-interval", type=float, default=30.0)
+    parser.add_argument("--checkpoint", default="", help="Defaults to <output>.checkpoint.jsonl")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> BatchSummary:
+    args = parse_args(argv)
+    load_env()
+    return asyncio.run(
+        run_chat_batch(
+            args.input,
+            args.output,
+            args.model,
+            checkpoint_path=args.checkpoint,
+            mode=args.mode,
+            concurrency=args.concurrency,
+            poll_interval=args.poll_interval,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from utils.file_io import preview, read_text, read_text_sync
+from utils.tokens import estimate_tokens
+
+StageFn = Callable[[Any], Awaitable[Any]]
+CostFn = Callable[["BatchItem"], int]
+
+
+@dataclass
+class BatchItem:
+    id: str
+    payload: Any
+
+
+@dataclass
+class Stage:
+    """One step of a batch pipeline with its own concurrency limit."""
+
+    name: str
+    fn: StageFn
+    concurrency: int = 4
+    _semaphore: Optional[asyncio.Semaphore] = field(default=None, repr=False)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+
+class Checkpoint:
+    """
+    Append-only JSONL record of finished items, used to resume an interrupted run.
+
+    Each line is ``{"id": ..., "status": "done" | "failed", ...}``; on resume only
+    items whose latest status is ``done`` are skipped, so failures are retried. With
+    ``keep_results`` the latest ``done`` record of each item is kept in ``results``,
+    for jobs that store their outputs in the checkpoint itself.
+    """
+
+    def __init__(self, path: str, keep_results: bool = False):
+        self.path = path
+        self.done: Set[str] = set()
+        self.keep_results = keep_results
+        self.results: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash mid-write can leave a truncated last line
+                        continue
+                    if record.get("status") == "done":
+                        self.done.add(record["id"])
+                        if keep_results:
+                            self.results[record["id"]] = record
+                    else:
+                        self.done.discard(record["id"])
+                        self.results.pop(record["id"], None)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, item_id: str, status: str, **extra: Any) -> None:
+        record = {"id": item_id, "status": status, **extra}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if status == "done":
+            self.done.add(item_id)
+            if self.keep_results:
+                self.results[item_id] = record
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _CostBudget:
+    """Admit work while the summed cost of running items stays within ``capacity``."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.used = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, cost: int) -> int:
+        # An item larger than the whole budget still runs, just on its own
+        cost = min(cost, self.capacity)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.used + cost <= self.capacity)
+            self.used += cost
+        return cost
+
+    async def release(self, cost: int) -> None:
+        async with self._cond:
+            self.used -= cost
+            self._cond.notify_all()
+
+
+@dataclass
+class BatchSummary:
+    total: int = 0
+    skipped: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self) -> str:
+        rate = self.succeeded / self.elapsed if self.elapsed else 0.0
+        return (
+            f"total={self.total} skipped={self.skipped} succeeded={self.succeeded} "
+            f"failed={self.failed} elapsed={self.elapsed:.1f}s ({rate:.2f} items/s)"
+        )
+
+
+async def run_batch(
+    items: Iterable[BatchItem],
+    stages: List[Stage],
+    on_result: Callable[[BatchItem, Any], Awaitable[None]],
+    checkpoint: Optional[Checkpoint] = None,
+    max_in_flight: Optional[int] = None,
+    cost: Optional[CostFn] = None,
+    max_in_flight_cost: Optional[int] = None,
+) -> BatchSummary:
+    """
+    Run every item through ``stages`` in order with bounded concurrency.
+
+    Each stage has its own semaphore, so item B can be in stage 1 while item A is in
+    stage 2. ``max_in_flight`` caps how many items are started but not finished, which
+    keeps memory flat on very large inputs. ``on_result`` is awaited per item as soon as
+    it finishes its last stage.
+
+    With ``cost`` (e.g. estimated prompt tokens per item) and ``max_in_flight_cost``,
+    items are additionally admitted only while the summed cost of running items fits
+    the budget, so a few huge inputs cannot monopolise the provider's token quota while
+    small ones keep flowing.
+    """
+    summary = BatchSummary()
+    started = time.perf_counter()
+    limit = max_in_flight or sum(stage.concurrency for stage in stages) * 2
+    in_flight = asyncio.Semaphore(limit)
+    budget = _CostBudget(max_in_flight_cost) if cost and max_in_flight_cost else None
+    tasks: Set[asyncio.Task] = set()
+
+    def fail(item: BatchItem, error: Exception) -> None:
+        summary.failed += 1
+        logger.error(f"Batch item {item.id} failed: {preview(str(error))}")
+        if checkpoint is not None:
+            checkpoint.record(item.id, "failed", error=str(error))
+
+    async def process(item: BatchItem, weight: int):
+        try:
+            value = item.payload
+            for stage in stages:
+                async with stage.semaphore:
+                    value = await stage.fn(value)
+            await on_result(item, value)
+            summary.succeeded += 1
+            if checkpoint is not None:
+                checkpoint.record(item.id, "done")
+        except Exception as e:
+            fail(item, e)
+        finally:
+            if budget is not None:
+                await budget.release(weight)
+            in_flight.release()
+
+    try:
+        for item in items:
+            summary.total += 1
+            if checkpoint is not None and item.id in checkpoint.done:
+                summary.skipped += 1
+                continue
+            await in_flight.acquire()
+            try:
+                weight = await budget.acquire(cost(item)) if budget is not None else 0
+            except Exception as e:
+                # e.g. the item's file is missing: fail this item, not the run
+                in_flight.release()
+                fail(item, e)
+                continue
+            except BaseException:
+                in_flight.release()
+                raise
+            task = asyncio.create_task(process(item, weight))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        # Started items always finish (or are cancelled) before run_batch returns or raises
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    summary.elapsed = time.perf_counter() - started
+    return summary
+
+
+def iter_input_items(source: str) -> Iterable[BatchItem]:
+    """
+    Yield items lazily from a directory of ``.md``/``.txt`` files or a JSONL manifest.
+
+    Manifest lines look like ``{"id": "acme", "path": "acme.md"}`` or carry the text
+    inline as ``{"id": "acme", "content": "..."}``; relative paths are resolved
+    against the manifest's directory. Malformed lines are logged and skipped. Pass the payload to ``load_text`` (or
+    ``resolve_text`` outside the event loop) to get the document text; files are only
+    read when their item starts.
+    """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith((".md", ".txt")):
+                path = os.path.join(source, name)
+                yield BatchItem(id=name.rsplit(".", 1)[0], payload=_LazyText(path))
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                item_id = str(record.get("id", line_no))
+                if "content" in record:
+                    payload = record["content"]
+                else:
+                    payload = _LazyText(os.path.join(base_dir, record["path"]))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                # One bad line should not stop the batch; the rest of the manifest still runs
+                logger.error(f"Skipping malformed manifest line {source}:{line_no}: {preview(repr(e))}")
+                continue
+            yield BatchItem(id=item_id, payload=payload)
+
+
+class _LazyText:
+    """Defers reading a document until its item actually runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> str:
+        return read_text_sync(self.path)
+
+
+def resolve_text(payload: Any) -> str:
+    return payload.read() if isinstance(payload, _LazyText) else payload
+
+
+async def load_text(payload: Any) -> str:
+    """resolve_text for async stages: lazily loaded files are read in a worker thread."""
+    return await read_text(payload.path) if isinstance(payload, _LazyText) else payload
+
+
+def estimate_payload_tokens(payload: Any) -> int:
+    """Estimate an item's prompt tokens without reading lazily loaded files."""
+    if isinstance(payload, _LazyText):
+        # UTF-8 CJK text is ~3 bytes per character and roughly one token per character
+        return os.path.getsize(payload.path) // 3
+    return estimate_tokens(payload)
@@ -2,6 +2,8 @@ def append_file_content(file_path, formatted_list, role="assistant"):
     """
     读取文件内容，并以指定角色添加到 formatted 列表中。
 
+    大文件通过内存映射读取；在异步代码中请使用 append_file_content_async，避免阻塞事件循环。
+
     :param file_path: 文件路径
     :param formatted_list: 要添加的列表对象
     :param role: 消息角色，默认为 assistant
@@ -9,15 +11,50 @@ def append_file_content(file_path, formatted_list, role="assistant"):
     """
     import os
 
+    from utils.file_io import read_text_sync
+
+    if not os.path.exists(file_path):
+        print(f"Error: {file_path} does not exist.")
+        return False
+    return _append_content(file_path, read_text_sync(file_path), formatted_list, role)
+
+
+async def append_file_content_async(file_path, formatted_list, role="assistant"):
+    """
+    append_file_content 的异步版本：在工作线程中读取文件，不阻塞事件循环。
+    """
+    import os
+
+    from utils.file_io import read_text
+
     if not os.path.exists(file_path):
         print(f"Error: {file_path} does not exist.")
         return False
+    return _append_content(file_path, await read_text(file_path), formatted_list, role)
+
+
+def _append_content(file_path, content, formatted_list, role):
+    content = content.strip()
+    if content:
+        formatted_list.append({"role": role, "content": content})
+        return True
+    print(f"Warning: {file_path} is empty.")
+    return False
+
+
+async def tee_stream_to_file(chunks, file_path):
+    """
+    边接收边将流式内容写入文件，同时原样产出每个片段，供下游继续消费。
+
+    内容先写入 ``<file_path>.part``，完整结束后再原子替换目标文件；中途出错时丢弃
+    临时文件，原有文件保持不变。
+
+    :param chunks: 异步文本片段迭代器
+    :param file_path: 输出文件路径（目录不存在时自动创建）
+    """
+    from utils.file_io import AtomicWriter
 
-    with open(file_path, "r", encoding="utf-8") as f:
-        content = f.read().strip()
-        if content:
-            formatted_list.append({"role": role, "content": content})
-            return True
-        else:
-            print(f"Warning: {file_path} is empty.")
-            return False
+    async with AtomicWriter(file_path) as writer:
+        async for chunk in chunks:
+            await writer.write(chunk)
+            yield chunk
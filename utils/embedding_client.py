@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import hashlib
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+import numpy as np
+from loguru import logger
+
+from utils.env import load_env
+from utils.http_pool import HTTPPool, get_http_pool
+from utils.rate_limit import RETRYABLE_STATUS, ProviderLimiter, get_limiter, parse_retry_after
+from utils.tokens import estimate_tokens
+
+EMBEDDING_PROVIDER = "embedding"
+DEFAULT_EMBEDDING_MODEL = "doubao-embedding-text-240715"
+
+
+class EmbeddingError(Exception):
+    """Raised when the embedding endpoint cannot produce vectors for a batch."""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by (model, sha256(text))."""
+
+    def __init__(self, path: str = ".cache/embeddings.sqlite"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            part = hashes[start : start + 500]
+            marks = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                (model, *part),
+            )
+            for digest, blob in rows:
+                found[digest] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: Iterable[tuple]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+            (
+                (model, digest, np.asarray(vector, dtype=np.float32).tobytes())
+                for digest, vector in items
+            ),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class EmbeddingClient:
+    """
+    Batched client for an OpenAI-compatible ``/embeddings`` endpoint.
+
+    ``embed`` deduplicates its input, serves known texts from the on-disk cache,
+    splits the rest into batches bounded by ``batch_size`` and ``max_batch_tokens``,
+    sends up to ``max_concurrency`` batches at once and returns a C-contiguous
+    float32 matrix with one row per input text.
+    """
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        batch_size: int = 64,
+        max_batch_tokens: int = 32_000,
+        max_concurrency: int = 4,
+        cache: Optional[EmbeddingCache] = None,
+        use_cache: bool = True,
+        pool: Optional[HTTPPool] = None,
+        limiter: Optional[ProviderLimiter] = None,
+    ):
+        load_env()
+        self.model = model or os.getenv("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODEL
+        self.api_url = os.getenv("EMBEDDING_URL", "").strip()
+        self.api_key = os.getenv("EMBEDDING_KEY", "").strip()
+        if not self.api_url or not self.api_key:
+            raise EnvironmentError("Missing environment variable: EMBEDDING_KEY or EMBEDDING_URL")
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.cache = (cache or EmbeddingCache()) if use_cache else None
+        self.pool = pool or get_http_pool()
+        self.limiter = limiter or get_limiter(EMBEDDING_PROVIDER)
+        self.dimension: Optional[int] = None
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        batches: List[List[str]] = []
+        current: List[str] = []
+        tokens = 0
+        for text in texts:
+            cost = estimate_tokens(text)
+            if current and (len(current) >= self.batch_size or tokens + cost > self.max_batch_tokens):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(text)
+            tokens += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        client = self.pool.get(EMBEDDING_PROVIDER)
+        headers = {
+            "Content-Type": "application/json; charset=utf-8",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+        payload = {"model": self.model, "input": texts, "encoding_format": "float"}
+        tokens = sum(estimate_tokens(text) for text in texts)
+        attempt = 0
+        while True:
+            probe = self.limiter.breaker.check(EMBEDDING_PROVIDER)
+            retry_after = None
+            try:
+                await self.limiter.acquire(tokens)
+                response = await client.post(self.api_url, headers=headers, json=payload)
+            except httpx.TransportError as e:
+                self.limiter.breaker.record_failure()
+                if attempt >= self.limiter.max_retries:
+                    raise EmbeddingError(f"Embedding request failed: {e}") from e
+            except BaseException:
+                # Cancelled or unexpected: hand a half-open probe back to the breaker
+                if probe:
+                    self.limiter.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    # Any definitive answer (200 or a client error) resolves the breaker
+                    self.limiter.breaker.record_success()
+                    if response.status_code == 200:
+                        data = sorted(response.json()["data"], key=lambda item: item["index"])
+                        return [np.asarray(item["embedding"], dtype=np.float32) for item in data]
+                    raise EmbeddingError(
+                        f"Embedding request failed: {response.status_code} - {response.text[:500]}"
+                    )
+                if response.status_code >= 500:
+                    self.limiter.breaker.record_failure()
+                elif probe:
+                    # Throttled: the provider is up, so leave the breaker as it was
+                    self.limiter.breaker.release()
+                if attempt >= self.limiter.max_retries:
+                    raise EmbeddingError(
+                        f"Embedding request failed: {response.status_code} - {response.text[:500]}"
+                    )
+                retry_after = parse_retry_after(response.headers.get("retry-after"))
+                if response.status_code == 429 and retry_after:
+                    self.limiter.pause(retry_after)
+            delay = self.limiter.backoff_delay(attempt, retry_after)
+            attempt += 1
+            logger.warning(f"Embedding batch failed, retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        unique: Dict[str, str] = {}
+        for text in texts:
+            unique.setdefault(text_hash(text), text)
+
+        vectors: Dict[str, np.ndarray] = {}
+        if self.cache is not None:
+            vectors.update(self.cache.get_many(self.model, list(unique)))
+        missing = [digest for digest in unique if digest not in vectors]
+        logger.debug(
+            f"Embedding {len(texts)} texts: {len(unique)} unique, {len(missing)} not cached"
+        )
+
+        if missing:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            by_text = {unique[digest]: digest for digest in missing}
+
+            async def run(batch: List[str]):
+                async with semaphore:
+                    result = await self._embed_batch(batch)
+                fresh = [(by_text[text], vec) for text, vec in zip(batch, result)]
+                vectors.update(fresh)
+                if self.cache is not None:
+                    self.cache.put_many(self.model, fresh)
+
+            await asyncio.gather(*(run(b) for b in self._batches([unique[d] for d in missing])))
+
+        if not texts:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        first = vectors[text_hash(texts[0])]
+        self.dimension = first.shape[0]
+        matrix = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = vectors[text_hash(text)]
+        return matrix
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        return (await self.embed([text]))[0]
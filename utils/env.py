@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import os
+from typing import Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_loaded = False
+
+
+def load_env(path: Optional[str] = None) -> None:
+    """
+    Load ``.env`` into ``os.environ`` once per process; later calls are no-ops.
+
+    Variables already set in the environment take precedence. Called by the CLI at
+    startup and by clients on construction, so importing a module never reads files.
+    """
+    global _loaded
+    if _loaded:
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv(path or os.path.join(PROJECT_ROOT, ".env"))
+    _loaded = True
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import codecs
+import json
+import mmap
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Files at least this large are decoded straight from a memory map instead of read()
+MMAP_THRESHOLD = 4 * 1024 * 1024
+READ_CHUNK_BYTES = 1024 * 1024
+# Longest piece of document text that goes into a log line
+LOG_PREVIEW_CHARS = 200
+
+
+def preview(text: Optional[str], limit: int = LOG_PREVIEW_CHARS) -> str:
+    """Cap text for logging, noting how much was left out."""
+    if not text:
+        return ""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}… (+{len(text) - limit} chars)"
+
+
+def read_text_sync(path: str) -> str:
+    """
+    Read a UTF-8 text file. Large files are decoded from a memory map, so the only
+    full-size copy is the resulting string.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            return f.read().decode("utf-8")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return str(view, "utf-8")
+
+
+async def read_text(path: str) -> str:
+    """read_text_sync in a worker thread, so large inputs do not block the event loop."""
+    return await asyncio.to_thread(read_text_sync, path)
+
+
+async def iter_text(path: str, chunk_size: int = READ_CHUNK_BYTES) -> AsyncIterator[str]:
+    """Yield a UTF-8 file in decoded chunks, each read in a worker thread."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        while True:
+            data = await asyncio.to_thread(f.read, chunk_size)
+            text = decoder.decode(data, final=not data)
+            if text:
+                yield text
+            if not data:
+                return
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def _replace_file(tmp_path: str, path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    os.replace(tmp_path, path)
+
+
+class AtomicWriter:
+    """
+    Stream text into ``<path>.part`` and move it over ``path`` on commit.
+
+    ``path`` only ever holds a complete previous or new version; the ``.part`` file
+    grows while the content is produced and can be tailed. Writes are buffered and
+    flushed from a worker thread once ``flush_bytes`` have accumulated or
+    ``flush_interval`` seconds have passed. Used as an async context manager it
+    commits on success and, on error, discards the partial file, leaving ``path``
+    as it was.
+    """
+
+    def __init__(self, path: str, flush_bytes: int = 64 * 1024, flush_interval: float = 0.5):
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.written = 0
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._lock = asyncio.Lock()
+        self._closed = False
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.part_path) or ".", exist_ok=True)
+        return open(self.part_path, "w", encoding="utf-8")
+
+    def _write_out(self, text: str) -> None:
+        if self._file is None:
+            self._file = self._open()
+        self._file.write(text)
+        self._file.flush()
+
+    async def write(self, text: str) -> None:
+        if self._closed:
+            raise ValueError(f"write to closed writer for {self.path}")
+        if not text:
+            return
+        self._buffer.append(text)
+        self._buffered += len(text)
+        self.written += len(text)
+        if self._buffered >= self.flush_bytes or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._buffer and self._file is not None:
+                return
+            text = "".join(self._buffer)
+            self._buffer, self._buffered = [], 0
+            self._last_flush = time.monotonic()
+            await asyncio.to_thread(self._write_out, text)
+
+    async def commit(self) -> None:
+        if self._closed:
+            return
+        await self.flush()
+        self._closed = True
+        await asyncio.to_thread(self._file.close)
+        await asyncio.to_thread(_replace_file, self.part_path, self.path)
+
+    async def close_partial(self) -> None:
+        """Flush and close without committing: ``.part`` is kept and ``path`` is left as it was."""
+        if self._closed:
+            return
+        await self.flush()
+        self._closed = True
+        await asyncio.to_thread(self._file.close)
+
+    async def abort(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._buffer = []
+
+        def discard():
+            if self._file is not None:
+                self._file.close()
+            if os.path.exists(self.part_path):
+                os.remove(self.part_path)
+
+        await asyncio.to_thread(discard)
+
+    async def __aenter__(self) -> "AtomicWriter":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.commit()
+        else:
+            await self.abort()
+
+
+class JSONLWriter(AtomicWriter):
+    """AtomicWriter for JSON Lines output: one record per line."""
+
+    async def write_record(self, record: Dict[str, Any]) -> None:
+        await self.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+async def write_text_atomic(path: str, text: str) -> None:
+    """Write a whole file atomically (in a worker thread)."""
+    async with AtomicWriter(path, flush_bytes=0) as writer:
+        await writer.write(text)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from utils.model_config import get_http_config
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HTTPPool:
+    """
+    Process-wide registry of pooled ``httpx.AsyncClient`` instances, one per provider.
+
+    Clients are created lazily on first use and keep their connections alive between
+    calls. A client is bound to the event loop it was created on, so a new one is built
+    transparently when the pool is used from a different loop (e.g. successive
+    ``asyncio.run`` calls).
+    """
+
+    def __init__(self, overrides: Optional[Dict[str, Dict]] = None):
+        self._overrides = overrides or {}
+        self._clients: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+
+    def config(self, provider: str) -> Dict:
+        return {**get_http_config(provider), **self._overrides.get(provider, {})}
+
+    def first_byte_timeout(self, provider: str) -> Optional[float]:
+        return self.config(provider).get("first_byte_timeout")
+
+    def _build_client(self, provider: str) -> httpx.AsyncClient:
+        cfg = self.config(provider)
+        http2 = bool(cfg["http2"])
+        if http2 and not _h2_available():
+            logger.warning(
+                f"HTTP/2 requested for {provider} but 'h2' is not installed, falling back to HTTP/1.1"
+            )
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=cfg["max_connections"],
+            max_keepalive_connections=cfg["max_keepalive_connections"],
+            keepalive_expiry=cfg["keepalive_expiry"],
+        )
+        timeout = httpx.Timeout(
+            connect=cfg["connect_timeout"],
+            read=cfg["read_timeout"],
+            write=cfg["write_timeout"],
+            pool=cfg["pool_timeout"],
+        )
+        logger.debug(f"Creating pooled HTTP client for {provider} (http2={http2})")
+        return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(provider)
+        if entry is not None:
+            client, client_loop = entry
+            if not client.is_closed and client_loop is loop and not loop.is_closed():
+                return client
+        client = self._build_client(provider)
+        self._clients[provider] = (client, loop)
+        return client
+
+    async def aclose(self, provider: Optional[str] = None) -> None:
+        providers = [provider] if provider else list(self._clients)
+        loop = asyncio.get_running_loop()
+        for name in providers:
+            entry = self._clients.pop(name, None)
+            if entry is None:
+                continue
+            client, client_loop = entry
+            # Clients from an already finished loop cannot be closed from here
+            if client_loop is loop and not client.is_closed:
+                await client.aclose()
+
+    async def __aenter__(self) -> "HTTPPool":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+
+_default_pool = HTTPPool()
+
+
+def get_http_pool() -> HTTPPool:
+    """Return the shared process-wide HTTP pool."""
+    return _default_pool
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import AsyncIterable, AsyncIterator, List
+
+_HEADING_RE = re.compile(r"^#{1,6}\s")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+
+def _heading_level(line: str) -> int:
+    if not _HEADING_RE.match(line):
+        return 0
+    return len(line) - len(line.lstrip("#"))
+
+
+class SectionSplitter:
+    """
+    Incrementally split markdown into sections at heading boundaries.
+
+    Text can be fed in arbitrary pieces (e.g. streamed tokens); a section is emitted as
+    soon as the heading of the next one is seen. Headings inside fenced code blocks are
+    ignored, and sections shorter than ``min_chars`` are merged into the following one.
+    """
+
+    def __init__(self, max_level: int = 2, min_chars: int = 0):
+        self.max_level = max_level
+        self.min_chars = min_chars
+        self._pending = ""  # incomplete trailing line
+        self._lines: List[str] = []
+        self._size = 0
+        self._in_fence = False
+
+    def _is_boundary(self, line: str) -> bool:
+        if _FENCE_RE.match(line):
+            self._in_fence = not self._in_fence
+            return False
+        if self._in_fence:
+            return False
+        level = _heading_level(line)
+        return 0 < level <= self.max_level
+
+    def _take_line(self, line: str) -> List[str]:
+        done = []
+        if self._is_boundary(line) and self._size >= self.min_chars and self._lines:
+            section = "".join(self._lines)
+            if section.strip():
+                done.append(section)
+                self._lines, self._size = [], 0
+        self._lines.append(line)
+        self._size += len(line)
+        return done
+
+    def feed(self, text: str) -> List[str]:
+        """Feed more text and return the sections completed by it."""
+        done: List[str] = []
+        lines = (self._pending + text).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            done.extend(self._take_line(line + "\n"))
+        return done
+
+    def flush(self) -> List[str]:
+        """Return whatever is left once the input has ended."""
+        done: List[str] = []
+        if self._pending:
+            done.extend(self._take_line(self._pending))
+            self._pending = ""
+        section = "".join(self._lines)
+        self._lines, self._size = [], 0
+        if section.strip():
+            done.append(section)
+        return done
+
+
+def split_sections(text: str, max_level: int = 2, min_chars: int = 0) -> List[str]:
+    """Split a markdown document into sections at headings up to ``max_level``."""
+    splitter = SectionSplitter(max_level=max_level, min_chars=min_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+async def iter_sections(
+    chunks: AsyncIterable[str], max_level: int = 2, min_chars: int = 0
+) -> AsyncIterator[str]:
+    """Turn a stream of text chunks into a stream of completed markdown sections."""
+    splitter = SectionSplitter(max_level=max_level, min_chars=min_chars)
+    async for chunk in chunks:
+        for section in splitter.feed(chunk):
+            yield section
+    for section in splitter.flush():
+        yield section
+
+
+def pack_sections(sections: List[str], max_chars: int) -> List[str]:
+    """Greedily merge consecutive sections into parts of at most ``max_chars`` characters."""
+    parts: List[str] = []
+    current = ""
+    for section in sections:
+        if current and len(current) + len(section) > max_chars:
+            parts.append(current)
+            current = ""
+        current += section
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _map_headings(text: str, fn) -> str:
+    """Apply ``fn(line, index)`` to every heading line outside code fences."""
+    out = []
+    in_fence = False
+    index = 0
+    for line in text.split("\n"):
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+        elif not in_fence and _heading_level(line):
+            line = fn(line, index)
+            index += 1
+        out.append(line)
+    return "\n".join(out)
+
+
+async def demote_titles_stream(chunks: AsyncIterable[str]) -> AsyncIterator[str]:
+    """Streaming demote_titles: each line is passed on as soon as it is complete."""
+    pending = ""
+    in_fence = False
+
+    def convert(line: str) -> str:
+        nonlocal in_fence
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+        elif not in_fence and _heading_level(line) == 1:
+            return "#" + line
+        return line
+
+    async for chunk in chunks:
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        if lines:
+            yield "\n".join(convert(line) for line in lines) + "\n"
+    if pending:
+        yield convert(pending)
+
+
+def heading_lines(text: str) -> List[str]:
+    found: List[str] = []
+    _map_headings(text, lambda line, _: found.append(line) or line)
+    return found
+
+
+def replace_headings(text: str, headings: List[str]) -> str:
+    """Swap heading lines in order for ``headings`` (which must match in count)."""
+    return _map_headings(text, lambda line, i: headings[i])
+
+
+def demote_titles(text: str) -> str:
+    """Turn every level-1 heading into a level-2 heading."""
+    return _map_headings(text, lambda line, _: "#" + line if _heading_level(line) == 1 else line)
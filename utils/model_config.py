@@ -12,6 +12,34 @@ MODEL_PROVIDER_MAPPING = {
     "gemini": "google",
 }
 
+# 模型前缀到上下文窗口/最大输出令牌数的映射（按最长前缀匹配）
+MODEL_CONTEXT_WINDOW = {
+    "gpt-4o": {"context": 128_000, "max_output": 16_384},
+    "gpt-4.1": {"context": 1_047_576, "max_output": 32_768},
+    "gpt-": {"context": 128_000, "max_output": 16_384},
+    "glm-4": {"context": 128_000, "max_output": 4_096},
+    "glm": {"context": 128_000, "max_output": 4_096},
+    "zhipu": {"context": 128_000, "max_output": 4_096},
+    "doubao-seed-1-6": {"context": 256_000, "max_output": 16_384},
+    "doubao": {"context": 128_000, "max_output": 12_288},
+    "qwen-plus": {"context": 131_072, "max_output": 8_192},
+    "qwen-max": {"context": 32_768, "max_output": 8_192},
+    "qwen-long": {"context": 1_000_000, "max_output": 8_192},
+    "qwen": {"context": 131_072, "max_output": 8_192},
+    "claude": {"context": 200_000, "max_output": 8_192},
+    "gemini": {"context": 1_048_576, "max_output": 8_192},
+}
+
+# 各提供商分词器的粗略比例：每个中日韩字符/每个其他字符约合多少令牌
+PROVIDER_TOKEN_RATIO = {
+    "openai": {"cjk": 1.0, "other": 0.25},
+    "zhipu": {"cjk": 0.7, "other": 0.25},
+    "volcengine": {"cjk": 0.7, "other": 0.25},
+    "qwen": {"cjk": 0.7, "other": 0.25},
+    "anthropic": {"cjk": 1.3, "other": 0.3},
+    "google": {"cjk": 0.8, "other": 0.25},
+}
+
 # 提供商到环境变量的映射
 PROVIDER_ENV_MAPPING = {
     "openai": {
@@ -42,47 +70,80 @@ PROVIDER_ENV_MAPPING = {
     },
 }
 
-# 提供商到响应解析器的映射（如果有特殊解析逻辑）
+# 限流与重试默认配置：rpm/tpm 为每分钟请求数/令牌数预算，0 表示不限制
+DEFAULT_RATE_LIMIT = {
+    "rpm": 60,
+    "tpm": 200_000,
+    "max_retries": 4,
+    "backoff_base": 1.0,  # 指数退避的初始等待（秒），实际等待带随机抖动
+    "backoff_max": 60.0,
+    "breaker_threshold": 5,  # 连续失败多少次后熔断
+    "breaker_cooldown": 30.0,  # 熔断后多久允许试探请求（秒）
+}
+
+# 提供商限流配置（覆盖 DEFAULT_RATE_LIMIT 中的对应项）
+PROVIDER_RATE_LIMIT_MAPPING = {
+    "openai": {"rpm": 500, "tpm": 200_000},
+    "zhipu": {"rpm": 60, "tpm": 200_000},
+    "volcengine": {"rpm": 1_000, "tpm": 1_000_000},
+    "qwen": {"rpm": 600, "tpm": 1_000_000},
+    "anthropic": {"rpm": 50, "tpm": 40_000},
+    "google": {"rpm": 60, "tpm": 1_000_000},
+}
+
+# HTTP 连接池默认配置（可在 PROVIDER_ENV_MAPPING 中通过 "http" 键按提供商覆盖）
+DEFAULT_HTTP_CONFIG = {
+    "http2": False,  # 需要安装 h2，未安装时自动回退到 HTTP/1.1
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 30.0,
+    "connect_timeout": 10.0,
+    "read_timeout": 1800.0,
+    "write_timeout": 60.0,
+    "pool_timeout": 60.0,
+    "first_byte_timeout": 600.0,  # 从发出请求到收到响应头的最长等待
+}
+
+# 提供商批处理接口：files 为 OpenAI 风格（上传 JSONL 文件、创建批任务并轮询）；
+# endpoint 为专用批量推理对话端点（替换 *_URL 中的 /chat/completions，由本地并发执行）
+PROVIDER_BATCH_API = {
+    "openai": {"mode": "files", "completion_window": "24h"},
+    "qwen": {"mode": "files", "completion_window": "24h"},
+    "volcengine": {"mode": "endpoint", "path": "/batch/chat/completions"},
+}
+
+# 提示前缀缓存：cache_control 在系统提示上标记缓存断点（Anthropic）；context 先创建上下文缓存，
+# 再以其 ID 发起对话（火山引擎）。其余提供商会自动缓存相同前缀，只需保证稳定前缀在前。
+# min_tokens 为值得显式缓存的最短前缀，ttl 为上下文缓存的有效期（秒）
+PROVIDER_PREFIX_CACHE = {
+    "anthropic": {"mode": "cache_control", "min_tokens": 1024},
+    "volcengine": {
+        "mode": "context",
+        "min_tokens": 1024,
+        "ttl": 3600,
+        "create_path": "/context/create",
+        "chat_path": "/context/chat/completions",
+    },
+}
+
+# 提供商到非流式响应解析器的映射（如果有特殊解析逻辑）；流式响应格式统一由 utils/sse.StreamParser 解析
 PROVIDER_PARSER_MAPPING = {
     "anthropic": {
         "non_stream": lambda data: data["content"][0]["text"],
-        "stream": lambda chunk: (
-            chunk.get("delta", {}).get("text", "")
-            if chunk.get("type") == "content_block_delta"
-            else ""
-        ),
     },
     "google": {
         "non_stream": lambda data: data["candidates"][0]["content"]["parts"][0]["text"],
-        "stream": lambda chunk: next(
-            (
-                part.get("text", "")
-                for candidate in chunk.get("candidates", [])
-                for part in candidate.get("content", {}).get("parts", [])
-            ),
-            "",
-        ),
     },
     # 添加其他模型提供商的解析器
     "openai": {
         "non_stream": lambda data: data["choices"][0]["message"]["content"],
-        "stream": lambda chunk: chunk.get("choices", [{}])[0]
-        .get("delta", {})
-        .get("content", ""),
     },
     "zhipu": {
         "non_stream": lambda data: data["choices"][0]["message"]["content"],
-        "stream": lambda chunk: chunk.get("choices", [{}])[0]
-        .get("delta", {})
-        .get("content", ""),
     },
     "volcengine": {
         "non_stream": lambda data: data["choices"][0]["message"]["content"],
-        "stream": lambda chunk: chunk.get("choices", [{}])[0]
-        .get("delta", {})
-        .get("content", ""),
     },
-    
 }
 
 
@@ -102,3 +163,36 @@ def get_provider_env(provider: str) -> Dict[str, Any]:
 def get_provider_parser(provider: str) -> Optional[Dict[str, Callable]]:
     """获取提供商的响应解析器"""
     return PROVIDER_PARSER_MAPPING.get(provider)
+
+
+def get_http_config(provider: str) -> Dict[str, Any]:
+    """获取提供商的 HTTP 连接池配置（默认值 + 提供商覆盖）"""
+    return {**DEFAULT_HTTP_CONFIG, **get_provider_env(provider).get("http", {})}
+
+
+def get_rate_limit_config(provider: str) -> Dict[str, Any]:
+    """获取提供商的限流与重试配置（默认值 + 提供商覆盖）"""
+    return {**DEFAULT_RATE_LIMIT, **PROVIDER_RATE_LIMIT_MAPPING.get(provider, {})}
+
+
+def get_model_limits(model_name: str) -> Dict[str, int]:
+    """获取模型的上下文窗口与最大输出令牌数（最长前缀匹配，未知模型使用保守默认值）"""
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOW if model_name.startswith(prefix)]
+    if not matches:
+        return {"context": 32_768, "max_output": 4_096}
+    return MODEL_CONTEXT_WINDOW[max(matches, key=len)]
+
+
+def get_token_ratio(provider: str) -> Dict[str, float]:
+    """获取提供商分词器的令牌估算比例"""
+    return PROVIDER_TOKEN_RATIO.get(provider, {"cjk": 1.0, "other": 0.25})
+
+
+def get_batch_api(provider: str) -> Optional[Dict[str, Any]]:
+    """获取提供商的批处理接口配置（无批处理接口时返回 None）"""
+    return PROVIDER_BATCH_API.get(provider)
+
+
+def get_prefix_cache_config(provider: str) -> Optional[Dict[str, Any]]:
+    """获取提供商的提示前缀缓存配置（自动缓存的提供商返回 None）"""
+    return PROVIDER_PREFIX_CACHE.get(provider)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.ai_client import AIClient
+from utils.http_pool import HTTPPool
+from utils.response_cache import ResponseCache, is_error_text
+
+
+class _LatencyStats:
+    """EWMA plus a sliding window of recent samples for quantiles."""
+
+    def __init__(self, alpha: float, window: int = 100):
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, value: float) -> None:
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RouteStats:
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency = _LatencyStats(alpha)  # full non-stream completion
+        self.ttfb = _LatencyStats(alpha)  # first streamed chunk
+        self.error_rate = 0.0
+        self.calls = 0
+        self.last_used: Optional[float] = None  # monotonic time of the last call (or re-probe)
+        self.probing = False
+
+    def stale(self, after: float) -> bool:
+        """True if the model has had no traffic for ``after`` seconds, so its stats are out of date."""
+        return self.last_used is not None and time.monotonic() - self.last_used >= after
+
+    def start_probe(self) -> None:
+        self.last_used = time.monotonic()
+        self.probing = True
+
+    def record(self, ok: bool, latency: Optional[float] = None, ttfb: Optional[float] = None):
+        self.calls += 1
+        self.last_used = time.monotonic()
+        if self.probing and ok:
+            # A successful re-probe replaces the stale estimates instead of nudging them
+            self.error_rate = 0.0
+            if latency is not None:
+                self.latency.ewma = None
+            if ttfb is not None:
+                self.ttfb.ewma = None
+        self.probing = False
+        self.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_rate
+        if ok and latency is not None:
+            self.latency.add(latency)
+        if ok and ttfb is not None:
+            self.ttfb.add(ttfb)
+
+    def record_cancelled(self, latency: Optional[float] = None, ttfb: Optional[float] = None):
+        """A hedging loser: its elapsed time is a lower bound, so it still counts as a sample."""
+        self.last_used = time.monotonic()
+        self.probing = False
+        if latency is not None:
+            self.latency.add(latency)
+        if ttfb is not None:
+            self.ttfb.add(ttfb)
+
+
+class ModelRouter:
+    """
+    Drop-in replacement for AIClient that spreads calls over a pool of equivalent models.
+
+    Each call goes to the healthy model with the lowest EWMA latency (time to first
+    chunk for streams, full completion otherwise); models never tried yet are explored
+    first, and a failed call fails over to the next candidate. With ``hedge=True`` a
+    second request is fired at the runner-up if the first has not produced its first
+    chunk within its p95 time to first chunk, and whichever answers first wins while the
+    other is cancelled (non-streaming calls are hedged the same way, as collected streams).
+
+    Stats only move when a model gets traffic, so a model that has not been called for
+    ``reprobe_after`` seconds (and whose breaker is not open) is put first for one call;
+    if that call succeeds its fresh latency replaces the stale estimate.
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        hedge: bool = False,
+        pool: Optional[HTTPPool] = None,
+        cache: Optional[ResponseCache] = None,
+        alpha: float = 0.2,
+        max_error_rate: float = 0.5,
+        hedge_quantile: float = 0.95,
+        default_hedge_delay: float = 10.0,
+        min_samples: int = 5,
+        reprobe_after: float = 60.0,
+    ):
+        if not models:
+            raise ValueError("ModelRouter needs at least one model")
+        self.clients: Dict[str, AIClient] = {
+            model: AIClient(model, pool=pool, cache=cache) for model in models
+        }
+        self.stats: Dict[str, RouteStats] = {model: RouteStats(alpha) for model in models}
+        self.hedge = hedge
+        self.max_error_rate = max_error_rate
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.reprobe_after = reprobe_after
+
+    def _healthy(self, model: str) -> bool:
+        breaker = self.clients[model].limiter.breaker
+        return breaker.state != "open" and self.stats[model].error_rate < self.max_error_rate
+
+    def ranked(self, streaming: bool = False) -> List[str]:
+        """Models ordered from best to worst for the next call."""
+
+        def score(model: str) -> Tuple[int, float]:
+            stats = self.stats[model]
+            ewma = (stats.ttfb if streaming else stats.latency).ewma
+            if ewma is None:
+                ewma = 0.0  # explore untried models first
+            return (0 if self._healthy(model) else 1, ewma * (1 + stats.error_rate))
+
+        models = sorted(self.clients, key=score)
+        for model in models[1:]:
+            stats = self.stats[model]
+            if stats.stale(self.reprobe_after) and self.clients[model].limiter.breaker.state != "open":
+                # Demoted and idle since: give it this call so its stats can recover
+                stats.start_probe()
+                models.remove(model)
+                models.insert(0, model)
+                break
+        return models
+
+    def _hedge_delay(self, model: str) -> float:
+        """The ``hedge_quantile`` of the model's recent time to first chunk."""
+        stats = self.stats[model].ttfb
+        if len(stats.samples) < self.min_samples:
+            return self.default_hedge_delay
+        return stats.quantile(self.hedge_quantile)
+
+    async def _timed_chat(self, model: str, messages, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            result = await self.clients[model].chat(messages, **kwargs)
+        except asyncio.CancelledError:
+            self.stats[model].record_cancelled(latency=time.perf_counter() - started)
+            raise
+        ok = bool(result) and not is_error_text(result)
+        self.stats[model].record(ok, latency=time.perf_counter() - started)
+        return result
+
+    async def chat(
+        self, messages: List[Dict[str, str]], stream: bool = False, **kwargs: Any
+    ) -> Any:
+        if stream:
+            return self.chat_stream(messages, **kwargs)
+
+        candidates = self.ranked()
+        if self.hedge and len(candidates) > 1:
+            return await self._hedged_chat(messages, **kwargs)
+
+        result = ""
+        for model in candidates:
+            result = await self._timed_chat(model, messages, **kwargs)
+            if result and not is_error_text(result):
+                return result
+            logger.warning(f"Router: {model} failed, failing over")
+        return result
+
+    async def _hedged_chat(self, messages, **kwargs) -> str:
+        """
+        Hedge on the time to first byte rather than full-completion latency: the call
+        runs as a hedged stream (see chat_stream) and the winning stream is collected.
+        """
+        parts: List[str] = []
+        async for chunk in self.chat_stream(messages, **kwargs):
+            if is_error_text(chunk):
+                return chunk
+            parts.append(chunk)
+        return "".join(parts)
+
+    async def chat_stream(
+        self, messages: List[Dict[str, str]], **kwargs: Any
+    ) -> AsyncIterator[str]:
+        candidates = self.ranked(streaming=True)
+        queued = list(candidates)
+        running: Dict[asyncio.Task, Tuple[str, AsyncIterator[str], float]] = {}
+
+        def launch():
+            model = queued.pop(0)
+            agen = self.clients[model].chat_stream(messages, **kwargs)
+            task = asyncio.create_task(agen.__anext__())
+            running[task] = (model, agen, time.perf_counter())
+
+        launch()
+        winner: Optional[Tuple[str, AsyncIterator[str], float]] = None
+        first_chunk = ""
+        failed_chunk = ""
+        try:
+            while running and winner is None:
+                model = next(iter(running.values()))[0]
+                hedging = self.hedge and queued
+                timeout = self._hedge_delay(model) if hedging else None
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    model, agen, started = running.pop(task)
+                    try:
+                        chunk = task.result()
+                    except StopAsyncIteration:
+                        chunk = ""
+                    if chunk and not is_error_text(chunk):
+                        self.stats[model].record(True, ttfb=time.perf_counter() - started)
+                        winner, first_chunk = (model, agen, started), chunk
+                        break
+                    self.stats[model].record(False)
+                    failed_chunk = chunk or failed_chunk
+                    await agen.aclose()
+                if winner is None and queued and (not done or not running):
+                    launch()
+        finally:
+            losers = list(running.items())
+            for task, (model, agen, started) in losers:
+                self.stats[model].record_cancelled(ttfb=time.perf_counter() - started)
+                task.cancel()
+            # Let every loser unwind (releasing limiter slots and breaker probes) before returning
+            await asyncio.gather(*(task for task, _ in losers), return_exceptions=True)
+            for _, (_, agen, _) in losers:
+                await agen.aclose()
+
+        if winner is None:
+            yield failed_chunk or "[Request Failed] all routed models failed"
+            return
+
+        _, agen, _ = winner
+        yield first_chunk
+        async for chunk in agen:
+            yield chunk
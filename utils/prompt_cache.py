@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import hashlib
+import json
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from utils.rate_limit import CircuitOpenError
+from utils.sse import loads
+
+if TYPE_CHECKING:
+    from utils.ai_client import AIClient
+
+# How long a failed context-cache creation is remembered before trying again
+FAILED_CREATE_TTL = 300.0
+# Stop using a context cache this long before the provider expires it
+EXPIRY_MARGIN = 60.0
+
+
+def order_stable_prefix(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Move system messages to the front (keeping their order) so requests share a prefix."""
+    _, rest = split_prefix(messages)
+    if not any(msg.get("role") == "system" for msg in rest):
+        return messages
+    system = [msg for msg in messages if msg.get("role") == "system"]
+    return system + [msg for msg in messages if msg.get("role") != "system"]
+
+
+def split_prefix(messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split off the leading system messages: the part repeated verbatim across requests."""
+    count = 0
+    while count < len(messages) and messages[count].get("role") == "system":
+        count += 1
+    return messages[:count], messages[count:]
+
+
+def mark_cache_control(payload: Dict[str, Any]) -> None:
+    """Turn an Anthropic payload's system prompt into a block with a cache breakpoint."""
+    system = payload.get("system")
+    if isinstance(system, str) and system:
+        payload["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+
+
+class ContextCache:
+    """
+    Volcengine context caches, created on first use and shared by identical prefixes.
+
+    Concurrent requests with the same prefix wait for a single creation call. A prefix
+    whose cache could not be created is sent uncached for a while instead of retrying
+    the creation on every request.
+    """
+
+    def __init__(self):
+        # key -> (context id or None after a failed creation, monotonic expiry)
+        self._entries: Dict[str, Tuple[Optional[str], float]] = {}
+        self._creating: Dict[str, asyncio.Future] = {}
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(model: str, prefix: List[Dict[str, Any]]) -> str:
+        encoded = json.dumps([model, prefix], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    async def context_id(
+        self, client: "AIClient", prefix: List[Dict[str, Any]], config: Dict[str, Any]
+    ) -> Optional[str]:
+        key = self._key(client.model, prefix)
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            if entry[0] is not None:
+                self.reused += 1
+            return entry[0]
+        if key in self._creating:
+            return await asyncio.shield(self._creating[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._creating[key] = future
+        try:
+            context_id = await self._create(client, prefix, config)
+            ttl = config["ttl"] - EXPIRY_MARGIN if context_id else FAILED_CREATE_TTL
+            self._entries[key] = (context_id, time.monotonic() + ttl)
+            future.set_result(context_id)
+            return context_id
+        except BaseException:
+            # Requests waiting on this creation go ahead uncached
+            future.set_result(None)
+            raise
+        finally:
+            del self._creating[key]
+
+    async def _create(
+        self, client: "AIClient", prefix: List[Dict[str, Any]], config: Dict[str, Any]
+    ) -> Optional[str]:
+        body = {"model": client.model, "messages": prefix, "mode": "common_prefix", "ttl": config["ttl"]}
+        try:
+            # Under the provider's rate limits and circuit breaker, like any other call
+            response = await client._send_with_retry(body, path=config["create_path"])
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+        except (CircuitOpenError, httpx.RequestError, asyncio.TimeoutError) as e:
+            logger.warning(f"Creating context cache for {client.model} failed: {e!r}")
+            return None
+        if response.status_code != 200:
+            logger.warning(
+                f"Creating context cache for {client.model} failed: "
+                f"{response.status_code} - {response.text[:200]}"
+            )
+            return None
+        try:
+            context_id = loads(response.content)["id"]
+        except (ValueError, KeyError, TypeError) as e:
+            # Send uncached rather than fail the request over a malformed answer
+            logger.warning(f"Creating context cache for {client.model} returned no id: {e!r} {response.text[:200]}")
+            return None
+        self.created += 1
+        logger.debug(f"Created context cache {context_id} for {client.model}")
+        return context_id
+
+    def invalidate(self, context_id: str) -> None:
+        """Forget a context the provider rejected (e.g. expired early) so it is recreated."""
+        for key, (cached_id, _) in list(self._entries.items()):
+            if cached_id == context_id:
+                del self._entries[key]
+
+
+_default_context_cache = ContextCache()
+
+
+def get_context_cache() -> ContextCache:
+    """Return the shared process-wide context cache registry."""
+    return _default_context_cache
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from loguru import logger
+
+from utils.model_config import get_rate_limit_config
+
+# Status codes worth retrying: throttling, timeouts and transient server errors
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider's circuit breaker is open and calls are short-circuited."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at ``capacity`` per minute.
+
+    Waiters are served strictly in arrival order: the lock is held while a caller
+    sleeps for its refill, so a large request cannot be starved by small ones. The
+    bucket outlives event loops (limiters are process-wide), so the lock is recreated
+    when it is used from a different loop (e.g. successive ``asyncio.run`` calls).
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _loop_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        return self._lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Take ``amount`` tokens, waiting as needed; returns the time spent waiting."""
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._loop_lock():
+            self._refill()
+            while self._tokens < amount:
+                delay = (amount - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= amount
+        return waited
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures and lets one probe through after ``cooldown``.
+
+    The caller that gets the probe (``check`` returns True) must resolve it with
+    ``record_success``/``record_failure``, or ``release`` it when it ends without an
+    answer (cancelled, unexpected error), otherwise no further probe is let through.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def check(self, name: str) -> bool:
+        """Raise CircuitOpenError if calls are short-circuited; return True if this call is the probe."""
+        state = self.state
+        if state == "open" or (state == "half-open" and self._probing):
+            raise CircuitOpenError(
+                f"circuit open for provider {name} after {self.failures} consecutive failures"
+            )
+        if state == "half-open":
+            self._probing = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """Give up an unresolved probe so the next call may probe again."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.threshold:
+            self._opened_at = time.monotonic()
+
+
+class ProviderLimiter:
+    """Request/token budgets, retry policy and circuit breaker for one provider."""
+
+    def __init__(self, provider: str, config: Optional[Dict] = None):
+        cfg = {**get_rate_limit_config(provider), **(config or {})}
+        self.provider = provider
+        self.requests = TokenBucket(cfg["rpm"])
+        self.tokens = TokenBucket(cfg["tpm"])
+        self.max_retries = cfg["max_retries"]
+        self.backoff_base = cfg["backoff_base"]
+        self.backoff_max = cfg["backoff_max"]
+        self.breaker = CircuitBreaker(cfg["breaker_threshold"], cfg["breaker_cooldown"])
+        self._paused_until = 0.0
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait for a request slot and ``tokens`` of TPM budget; returns total wait time."""
+        waited = 0.0
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+            waited += pause
+        waited += await self.requests.acquire(1)
+        waited += await self.tokens.acquire(tokens)
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller of this provider, e.g. after a 429 with Retry-After."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """Return the process-wide limiter for ``provider``."""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        limiter = _limiters[provider] = ProviderLimiter(provider)
+        logger.debug(f"Created rate limiter for {provider}")
+    return limiter
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# Prefixes AIClient uses for in-band error strings; such results are never cached
+ERROR_PREFIXES = (
+    "[Request Failed]",
+    "[Error]",
+    "[Unknown Error]",
+    "[Parse Error",
+    "[Stream Parse Exception]",
+    "[Warning] No valid content received",
+)
+
+
+def is_error_text(text: str) -> bool:
+    return text.lstrip().startswith(ERROR_PREFIXES)
+
+
+def _normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    normalized = []
+    for msg in messages:
+        content = msg.get("content", "")
+        if isinstance(content, str):
+            content = content.replace("\r\n", "\n").strip()
+        normalized.append({**msg, "content": content})
+    return normalized
+
+
+def make_cache_key(
+    model: str, provider: str, messages: List[Dict[str, Any]], **kwargs: Any
+) -> str:
+    """Stable content hash of everything that determines a completion."""
+    material = {
+        "model": model,
+        "provider": provider,
+        "messages": _normalize_messages(messages),
+        "kwargs": kwargs,
+    }
+    encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "hit_rate": round(self.hit_rate, 4)}
+
+
+class ResponseCache:
+    """
+    Two-tier completion cache: a bounded in-memory LRU in front of a SQLite store.
+
+    Entries are stored as the list of chunks that made up the response, so a cached
+    stream replays chunk by chunk and a non-stream response is a single chunk.
+    ``ttl`` (seconds) expires entries on read; ``max_disk_entries`` and
+    ``max_disk_bytes`` trim the least recently used rows after each write.
+    """
+
+    def __init__(
+        self,
+        path: str = ".cache/responses.sqlite",
+        max_memory_entries: int = 256,
+        max_disk_entries: int = 10_000,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+        ttl: Optional[float] = None,
+    ):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._memory: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, chunks TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)"
+            )
+        return self._conn
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, created_at: float, chunks: List[str]) -> None:
+        self._memory[key] = (created_at, chunks)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    def get(self, key: str) -> Optional[List[str]]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, chunks = entry
+            if not self._expired(created_at):
+                self._memory.move_to_end(key)
+                self.stats.memory_hits += 1
+                return chunks
+            self.delete(key)
+
+        db = self._db()
+        row = db.execute(
+            "SELECT chunks, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            chunks_json, created_at = row
+            if not self._expired(created_at):
+                db.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+                db.commit()
+                chunks = json.loads(chunks_json)
+                self._remember(key, created_at, chunks)
+                self.stats.disk_hits += 1
+                return chunks
+            self.delete(key)
+
+        self.stats.misses += 1
+        return None
+
+    def set(self, key: str, chunks: List[str]) -> None:
+        now = time.time()
+        payload = json.dumps(chunks, ensure_ascii=False)
+        self._remember(key, now, chunks)
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO responses (key, chunks, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, payload, len(payload.encode("utf-8")), now, now),
+        )
+        db.commit()
+        self.stats.writes += 1
+        self._trim_disk()
+
+    def delete(self, key: str) -> None:
+        self._memory.pop(key, None)
+        db = self._db()
+        db.execute("DELETE FROM responses WHERE key = ?", (key,))
+        db.commit()
+
+    def _trim_disk(self) -> None:
+        db = self._db()
+        if self.ttl is not None:
+            cur = db.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            self.stats.evictions += cur.rowcount
+        count, size = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        while count > self.max_disk_entries or size > self.max_disk_bytes:
+            row = db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self._memory.pop(row[0], None)
+            count, size = count - 1, size - row[1]
+            self.stats.evictions += 1
+        db.commit()
+
+    def clear(self) -> None:
+        self._memory.clear()
+        db = self._db()
+        db.execute("DELETE FROM responses")
+        db.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def log_stats(self) -> None:
+        logger.info(f"Response cache stats: {self.stats.as_dict()}")
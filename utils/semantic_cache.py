@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from utils.embedding_client import EmbeddingClient, EmbeddingError
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# A miss whose best match is this close below the threshold counts as a near miss
+NEAR_MISS_MARGIN = 0.05
+
+
+def normalize_request(messages: List[Dict[str, Any]]) -> str:
+    """The part of a request that varies between calls (non-system turns), normalised for embedding."""
+    parts = []
+    for msg in messages:
+        if msg.get("role") == "system" or not isinstance(msg.get("content"), str):
+            continue
+        text = unicodedata.normalize("NFKC", msg["content"]).lower()
+        parts.append(f"{msg.get('role', 'user')}: {_WHITESPACE_RE.sub(' ', text).strip()}")
+    return "\n".join(parts)
+
+
+@dataclass
+class SemanticStats:
+    lookups: int = 0
+    hits: int = 0
+    misses: int = 0
+    near_misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+    errors: int = 0
+    hit_similarities: List[float] = field(default_factory=list, repr=False)
+    by_prompt: Dict[str, Dict[str, int]] = field(default_factory=dict, repr=False)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def count(self, prompt: str, outcome: str) -> None:
+        counts = self.by_prompt.setdefault(prompt, {"hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        result = {k: v for k, v in asdict(self).items() if k not in ("hit_similarities", "by_prompt")}
+        sims = self.hit_similarities
+        result.update(
+            hit_rate=round(self.hit_rate, 4),
+            mean_hit_similarity=round(float(np.mean(sims)), 4) if sims else None,
+            min_hit_similarity=round(float(np.min(sims)), 4) if sims else None,
+            by_prompt=self.by_prompt,
+        )
+        return result
+
+
+@dataclass
+class SemanticLookup:
+    """Outcome of a lookup; pass it back to ``store`` to cache the fresh completion on a miss."""
+
+    scope: str
+    prompt: str
+    request: str
+    vector: np.ndarray
+    threshold: float
+    chunks: Optional[List[str]] = None
+    similarity: float = 0.0
+
+
+class _ScopeIndex:
+    """In-memory matrix of unit vectors for one scope, mirroring its SQLite rows."""
+
+    def __init__(self, ids: List[int], vectors: List[np.ndarray]):
+        self.ids = ids
+        self.matrix = np.vstack(vectors) if vectors else None
+
+    def best(self, query: np.ndarray) -> Tuple[Optional[int], float]:
+        if self.matrix is None or not self.ids:
+            return None, 0.0
+        scores = self.matrix @ query
+        row = int(np.argmax(scores))
+        return self.ids[row], float(scores[row])
+
+    def add(self, entry_id: int, vector: np.ndarray) -> None:
+        self.ids.append(entry_id)
+        row = vector[None, :]
+        self.matrix = row if self.matrix is None else np.vstack([self.matrix, row])
+
+    def remove(self, entry_ids: List[int]) -> None:
+        drop = set(entry_ids)
+        keep = [i for i, entry_id in enumerate(self.ids) if entry_id not in drop]
+        self.ids = [self.ids[i] for i in keep]
+        self.matrix = self.matrix[keep] if self.matrix is not None and keep else None
+
+
+class SemanticCache:
+    """
+    Completion cache keyed by meaning rather than exact text.
+
+    The non-system turns of a request are normalised and embedded; the stored
+    completion of the nearest earlier request is returned when its cosine similarity
+    reaches the prompt's threshold. Entries are scoped by model, options, embedding
+    model and the exact system prompt, so different templates (or template versions)
+    never share answers. Only prompts that declare ``semantic_threshold`` in their
+    YAML are cached unless ``default_threshold`` is set.
+
+    Each scope keeps at most ``max_entries_per_scope`` entries and the whole store at
+    most ``max_entries``, evicting the least recently used; ``ttl`` (seconds) expires
+    entries on lookup.
+    """
+
+    def __init__(
+        self,
+        path: str = ".cache/semantic.sqlite",
+        embedder: Optional[EmbeddingClient] = None,
+        default_threshold: Optional[float] = None,
+        max_entries_per_scope: int = 1_000,
+        max_entries: int = 20_000,
+        ttl: Optional[float] = None,
+    ):
+        self.path = path
+        self._embedder = embedder
+        self.default_threshold = default_threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = SemanticStats()
+        self._indexes: Dict[str, _ScopeIndex] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def embedder(self) -> EmbeddingClient:
+        if self._embedder is None:
+            self._embedder = EmbeddingClient()
+        return self._embedder
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT NOT NULL, prompt TEXT NOT NULL, "
+                "request TEXT NOT NULL, vector BLOB NOT NULL, chunks TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_scope ON entries(scope, accessed_at)")
+        return self._conn
+
+    def _prompt_of(self, system: str) -> Tuple[str, Optional[float]]:
+        """Find the registered prompt whose rendered text is ``system``."""
+        from prompting.registry import get_prompt_registry
+
+        for name, prompt in get_prompt_registry().all().items():
+            if prompt.fields:
+                # Templates with placeholders match on their literal text before the first one
+                literal = prompt.system.split("{", 1)[0]
+                if literal and system.startswith(literal):
+                    return name, prompt.semantic_threshold
+            elif system == prompt.format()[0]["content"]:
+                return name, prompt.semantic_threshold
+        return "", None
+
+    def _scope(self, model: str, system: str, kwargs: Dict[str, Any]) -> str:
+        material = [model, self.embedder.model, system, kwargs]
+        encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _index(self, scope: str) -> _ScopeIndex:
+        index = self._indexes.get(scope)
+        if index is None:
+            rows = self._db().execute("SELECT id, vector FROM entries WHERE scope = ?", (scope,)).fetchall()
+            index = _ScopeIndex(
+                [row[0] for row in rows], [np.frombuffer(row[1], dtype=np.float32) for row in rows]
+            )
+            self._indexes[scope] = index
+        return index
+
+    async def lookup(
+        self, model: str, messages: List[Dict[str, Any]], **kwargs: Any
+    ) -> Optional[SemanticLookup]:
+        """Return a lookup (with ``chunks`` set on a hit), or None when the request is not cacheable."""
+        system = "\n".join(m["content"] for m in messages if m.get("role") == "system" and isinstance(m.get("content"), str))
+        prompt, threshold = self._prompt_of(system)
+        threshold = threshold if threshold is not None else self.default_threshold
+        request = normalize_request(messages)
+        if threshold is None or not request:
+            return None
+        try:
+            vector = await self.embedder.embed_one(request)
+        except (EmbeddingError, EnvironmentError) as e:
+            self.stats.errors += 1
+            logger.warning(f"Semantic cache disabled for this request: {e}")
+            return None
+        norm = float(np.linalg.norm(vector))
+        vector = (vector / norm if norm else vector).astype(np.float32)
+
+        result = SemanticLookup(self._scope(model, system, kwargs), prompt or "-", request, vector, threshold)
+        self.stats.lookups += 1
+        entry_id, similarity = self._index(result.scope).best(vector)
+        result.similarity = similarity
+        if entry_id is not None and similarity >= threshold:
+            row = self._db().execute("SELECT chunks, created_at FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            if row is not None and not self._expired(row[1]):
+                self._db().execute(
+                    "UPDATE entries SET accessed_at = ?, hits = hits + 1 WHERE id = ?", (time.time(), entry_id)
+                )
+                self._db().commit()
+                result.chunks = json.loads(row[0])
+                self.stats.hits += 1
+                self.stats.hit_similarities.append(similarity)
+                self.stats.count(result.prompt, "hits")
+                logger.debug(f"Semantic cache hit for {result.prompt} (similarity {similarity:.3f})")
+                return result
+            self._delete(result.scope, [entry_id])
+        self.stats.misses += 1
+        self.stats.count(result.prompt, "misses")
+        if entry_id is not None and similarity >= threshold - NEAR_MISS_MARGIN:
+            self.stats.near_misses += 1
+        return result
+
+    def store(self, lookup: SemanticLookup, chunks: List[str]) -> None:
+        now = time.time()
+        db = self._db()
+        cur = db.execute(
+            "INSERT INTO entries (scope, prompt, request, vector, chunks, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                lookup.scope,
+                lookup.prompt,
+                lookup.request,
+                lookup.vector.tobytes(),
+                json.dumps(chunks, ensure_ascii=False),
+                now,
+                now,
+            ),
+        )
+        db.commit()
+        self._index(lookup.scope).add(cur.lastrowid, lookup.vector)
+        self.stats.writes += 1
+        self._evict(lookup.scope)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _delete(self, scope: Optional[str], entry_ids: List[int]) -> None:
+        if not entry_ids:
+            return
+        db = self._db()
+        db.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in entry_ids])
+        db.commit()
+        if scope is None:
+            # Global eviction: drop the in-memory indexes and rebuild them on next use
+            self._indexes.clear()
+        elif scope in self._indexes:
+            self._indexes[scope].remove(entry_ids)
+        self.stats.evictions += len(entry_ids)
+
+    def _evict(self, scope: str) -> None:
+        db = self._db()
+        (count,) = db.execute("SELECT COUNT(*) FROM entries WHERE scope = ?", (scope,)).fetchone()
+        if count > self.max_entries_per_scope:
+            rows = db.execute(
+                "SELECT id FROM entries WHERE scope = ? ORDER BY accessed_at LIMIT ?",
+                (scope, count - self.max_entries_per_scope),
+            ).fetchall()
+            self._delete(scope, [row[0] for row in rows])
+        (total,) = db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if total > self.max_entries:
+            rows = db.execute(
+                "SELECT id FROM entries ORDER BY accessed_at LIMIT ?", (total - self.max_entries,)
+            ).fetchall()
+            self._delete(None, [row[0] for row in rows])
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def log_stats(self) -> None:
+        logger.info(f"Semantic cache stats: {self.stats.as_dict()}")
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+
+@dataclass
+class FlightStats:
+    started: int = 0
+    joined: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class _Flight:
+    """One upstream stream, buffered so late subscribers can replay it from the start."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def pump(self, source: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in source:
+                async with self.changed:
+                    self.chunks.append(chunk)
+                    self.changed.notify_all()
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            async with self.changed:
+                self.done = True
+                self.changed.notify_all()
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent requests into one upstream call.
+
+    The first caller for a key starts the stream; callers arriving while it is
+    still in flight attach to it instead, receiving the chunks produced so far and
+    then the rest as they arrive. The key is forgotten as soon as the stream ends,
+    so later calls start afresh (caching finished results is ResponseCache's job).
+    The upstream call is cancelled only when every subscriber has gone away.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.stats = FlightStats()
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def stream(self, key: str, start: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(flight.pump(start()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.stats.started += 1
+        else:
+            self.stats.joined += 1
+
+        flight.subscribers += 1
+        try:
+            sent = 0
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: flight.done or len(flight.chunks) > sent)
+                    pending = flight.chunks[sent:]
+                    finished = flight.done
+                for chunk in pending:
+                    yield chunk
+                sent += len(pending)
+                if finished and sent == len(flight.chunks):
+                    break
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+import codecs
+import io
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+try:
+    import ujson as _json
+except ImportError:  # pragma: no cover - ujson is in requirements.txt
+    import json as _json
+
+_LINE_BREAK_RE = re.compile(r"\r\n|\r|\n")
+
+
+def loads(data: str) -> Any:
+    return _json.loads(data)
+
+
+@dataclass
+class SSEMessage:
+    """One server-sent event: its ``event:`` name (if any) and joined ``data:`` lines."""
+
+    data: str
+    event: str = ""
+
+
+class SSEDecoder:
+    """
+    Incremental server-sent events decoder working on raw byte chunks.
+
+    Handles ``\\n``, ``\\r\\n`` and ``\\r`` line endings, multi-line ``data:`` fields,
+    ``event:`` names, comments, and UTF-8 characters or lines split across chunks.
+    """
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._tail = ""
+        self._event = ""
+        self._data: List[str] = []
+
+    def _field(self, line: str) -> None:
+        if line.startswith(":"):
+            return
+        name, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if name == "data":
+            self._data.append(value)
+        elif name == "event":
+            self._event = value
+
+    def _dispatch(self) -> Optional[SSEMessage]:
+        data = self._data
+        if not data:
+            self._event = ""
+            return None
+        message = SSEMessage(data[0] if len(data) == 1 else "\n".join(data), self._event)
+        self._data, self._event = [], ""
+        return message
+
+    def _lines(self, text: str) -> List[SSEMessage]:
+        # Only CR/LF end SSE lines; str.splitlines would also split on U+2028 etc.
+        lines = _LINE_BREAK_RE.split(text) if "\r" in text else text.split("\n")
+        self._tail = lines.pop()
+        messages = []
+        for line in lines:
+            if not line:
+                message = self._dispatch()
+                if message is not None:
+                    messages.append(message)
+            elif line.startswith("data: "):
+                # Fast path for the overwhelmingly common line shape
+                self._data.append(line[6:])
+            else:
+                self._field(line)
+        return messages
+
+    def feed(self, chunk: bytes) -> List[SSEMessage]:
+        """Feed raw bytes and return the events completed by them."""
+        text = self._tail + self._utf8.decode(chunk)
+        # A trailing "\r" might be the first half of "\r\n"; wait for the next chunk
+        if text.endswith("\r"):
+            messages = self._lines(text[:-1])
+            self._tail += "\r"
+            return messages
+        return self._lines(text)
+
+    def flush(self) -> List[SSEMessage]:
+        """Return the last event when the stream ends without a blank line."""
+        messages = self._lines(self._tail + self._utf8.decode(b"", final=True) + "\n")
+        message = self._dispatch()
+        if message is not None:
+            messages.append(message)
+        return messages
+
+
+@dataclass
+class StreamEvent:
+    """
+    A decoded stream event.
+
+    ``type`` is one of ``content``, ``reasoning``, ``usage``, ``finish`` or ``error``;
+    ``text`` carries content/reasoning deltas or error text.
+    """
+
+    type: str
+    text: str = ""
+    usage: Optional[Dict[str, int]] = None
+    finish_reason: str = ""
+
+
+def _openai_events(chunk: Dict[str, Any], event: str) -> List[StreamEvent]:
+    events = []
+    for choice in chunk.get("choices") or ():
+        delta = choice.get("delta")
+        if delta:
+            if delta.get("reasoning_content"):
+                events.append(StreamEvent("reasoning", delta["reasoning_content"]))
+            if delta.get("content"):
+                events.append(StreamEvent("content", delta["content"]))
+        if choice.get("finish_reason"):
+            events.append(StreamEvent("finish", finish_reason=choice["finish_reason"]))
+    usage = chunk.get("usage")
+    if usage:
+        events.append(StreamEvent("usage", usage=_openai_usage(usage)))
+    return events
+
+
+def _openai_usage(usage: Dict[str, Any]) -> Dict[str, int]:
+    details = usage.get("completion_tokens_details") or {}
+    prompt_details = usage.get("prompt_tokens_details") or {}
+    result = {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+    }
+    if details.get("reasoning_tokens"):
+        result["reasoning_tokens"] = details["reasoning_tokens"]
+    if prompt_details.get("cached_tokens"):
+        result["cached_tokens"] = prompt_details["cached_tokens"]
+    return result
+
+
+def _anthropic_usage(usage: Dict[str, Any]) -> Dict[str, int]:
+    # input_tokens excludes the prompt-cache reads and writes; report the full prompt
+    cache_read = usage.get("cache_read_input_tokens") or 0
+    cache_write = usage.get("cache_creation_input_tokens") or 0
+    result = {"prompt_tokens": usage.get("input_tokens", 0) + cache_read + cache_write}
+    if cache_read:
+        result["cached_tokens"] = cache_read
+    return result
+
+
+def _anthropic_events(chunk: Dict[str, Any], event: str) -> List[StreamEvent]:
+    kind = chunk.get("type") or event
+    if kind == "content_block_delta":
+        delta = chunk.get("delta") or {}
+        if delta.get("type") == "thinking_delta":
+            return [StreamEvent("reasoning", delta.get("thinking", ""))]
+        if delta.get("text"):
+            return [StreamEvent("content", delta["text"])]
+    elif kind == "message_start":
+        usage = (chunk.get("message") or {}).get("usage") or {}
+        if usage:
+            return [StreamEvent("usage", usage=_anthropic_usage(usage))]
+    elif kind == "message_delta":
+        events = []
+        usage = chunk.get("usage") or {}
+        if usage:
+            events.append(
+                StreamEvent("usage", usage={"completion_tokens": usage.get("output_tokens", 0)})
+            )
+        stop_reason = (chunk.get("delta") or {}).get("stop_reason")
+        if stop_reason:
+            events.append(StreamEvent("finish", finish_reason=stop_reason))
+        return events
+    elif kind == "error":
+        message = (chunk.get("error") or {}).get("message", "unknown error")
+        return [StreamEvent("error", f"[Request Failed] {message}")]
+    return []
+
+
+def _google_events(chunk: Dict[str, Any], event: str) -> List[StreamEvent]:
+    events = []
+    for candidate in chunk.get("candidates") or ():
+        for part in (candidate.get("content") or {}).get("parts") or ():
+            if part.get("text"):
+                kind = "reasoning" if part.get("thought") else "content"
+                events.append(StreamEvent(kind, part["text"]))
+        if candidate.get("finishReason"):
+            events.append(StreamEvent("finish", finish_reason=candidate["finishReason"]))
+    usage = chunk.get("usageMetadata")
+    if usage:
+        result = {
+            "prompt_tokens": usage.get("promptTokenCount", 0),
+            "completion_tokens": usage.get("candidatesTokenCount", 0),
+        }
+        if usage.get("thoughtsTokenCount"):
+            result["reasoning_tokens"] = usage["thoughtsTokenCount"]
+        if usage.get("cachedContentTokenCount"):
+            result["cached_tokens"] = usage["cachedContentTokenCount"]
+        events.append(StreamEvent("usage", usage=result))
+    return events
+
+
+def usage_from_response(provider: str, data: Dict[str, Any]) -> Dict[str, int]:
+    """Normalise the usage block of a non-streaming response to prompt/cached/completion/reasoning tokens."""
+    if provider == "anthropic":
+        usage = data.get("usage") or {}
+        return {**_anthropic_usage(usage), "completion_tokens": usage.get("output_tokens", 0)}
+    if provider == "google":
+        for event in _google_events({"usageMetadata": data.get("usageMetadata")}, ""):
+            return event.usage
+        return {}
+    return _openai_usage(data["usage"]) if data.get("usage") else {}
+
+
+# Providers not listed here speak the OpenAI-compatible chunk format
+STREAM_EVENT_PARSERS: Dict[str, Callable[[Dict[str, Any], str], List[StreamEvent]]] = {
+    "anthropic": _anthropic_events,
+    "google": _google_events,
+}
+
+
+class StreamParser:
+    """Turn raw response bytes from one provider into StreamEvents."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.decoder = SSEDecoder()
+        self._parse = STREAM_EVENT_PARSERS.get(provider, _openai_events)
+        self.errors = 0
+
+    def _events(self, messages: List[SSEMessage]) -> List[StreamEvent]:
+        events: List[StreamEvent] = []
+        parse = self._parse
+        for message in messages:
+            data = message.data
+            if data == "[DONE]":
+                continue
+            try:
+                chunk = loads(data)
+            except ValueError as e:
+                self.errors += 1
+                logger.warning(f"{self.provider} stream: undecodable event skipped ({e}): {data[:200]}")
+                continue
+            if isinstance(chunk, dict):
+                events.extend(parse(chunk, message.event))
+        return events
+
+    def feed(self, chunk: bytes) -> List[StreamEvent]:
+        return self._events(self.decoder.feed(chunk))
+
+    def flush(self) -> List[StreamEvent]:
+        return self._events(self.decoder.flush())
+
+
+class StreamAccumulator:
+    """Collect StreamEvents into the final content, reasoning, usage and finish reason."""
+
+    def __init__(self):
+        self._content = io.StringIO()
+        self._reasoning = io.StringIO()
+        self.usage: Dict[str, int] = {}
+        self.finish_reason = ""
+        self.errors: List[str] = []
+
+    def add(self, event: StreamEvent) -> None:
+        if event.type == "content":
+            self._content.write(event.text)
+        elif event.type == "reasoning":
+            self._reasoning.write(event.text)
+        elif event.type == "usage":
+            self.usage.update(event.usage)
+        elif event.type == "finish":
+            self.finish_reason = event.finish_reason
+        elif event.type == "error":
+            self.errors.append(event.text)
+
+    @property
+    def content(self) -> str:
+        return self._content.getvalue()
+
+    @property
+    def reasoning(self) -> str:
+        return self._reasoning.getvalue()
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+# Histogram buckets (seconds) for latency-type metrics
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Latency samples kept per label set for percentiles in the summary
+MAX_SAMPLES = 10_000
+
+_stage: contextvars.ContextVar[str] = contextvars.ContextVar("telemetry_stage", default="")
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Tag every call made inside the block (including spawned tasks) with ``name``."""
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def current_stage() -> str:
+    return _stage.get()
+
+
+@dataclass
+class CallRecord:
+    """Timings and accounting for one AIClient call (all durations in seconds)."""
+
+    model: str
+    provider: str
+    stage: str = ""
+    stream: bool = False
+    started_at: float = field(default_factory=time.time)
+    status: str = "ok"  # ok | error | cached | cancelled
+    error: str = ""
+    queue_wait: float = 0.0  # time spent waiting on the provider's rate limiter
+    connect_time: float = 0.0  # TCP + TLS setup; 0 when a pooled connection was reused
+    ttft: Optional[float] = None  # first content token (stream) or response headers
+    latency: float = 0.0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0  # part of prompt_tokens served from the provider's prefix cache
+    completion_tokens: int = 0
+    reasoning_tokens: int = 0
+    retries: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    _t0: float = field(default_factory=time.perf_counter, repr=False)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def mark_first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = self.elapsed()
+
+    def add_usage(self, usage: Dict[str, int]) -> None:
+        self.prompt_tokens = usage.get("prompt_tokens", self.prompt_tokens)
+        self.cached_prompt_tokens = usage.get("cached_tokens", self.cached_prompt_tokens)
+        self.completion_tokens = usage.get("completion_tokens", self.completion_tokens)
+        self.reasoning_tokens = usage.get("reasoning_tokens", self.reasoning_tokens)
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Completion tokens per second of generation (after the first token when streaming)."""
+        generating = self.latency - (self.ttft or 0.0) if self.stream else self.latency
+        return self.completion_tokens / generating if generating > 0 else 0.0
+
+    def as_dict(self) -> Dict:
+        data = {k: v for k, v in asdict(self).items() if not k.startswith("_")}
+        data["tokens_per_second"] = round(self.tokens_per_second, 2)
+        return data
+
+
+class JSONLExporter:
+    """Append every call record to a JSONL file as it completes."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, record: CallRecord) -> None:
+        self._file.write(json.dumps(record.as_dict(), ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _Aggregate:
+    def __init__(self):
+        self.status: Dict[str, int] = {}
+        self.tokens = {"prompt": 0, "cached_prompt": 0, "completion": 0, "reasoning": 0}
+        self.bytes = {"sent": 0, "received": 0}
+        self.retries = 0
+        self.sums = {"latency": 0.0, "ttft": 0.0, "queue_wait": 0.0, "connect_time": 0.0}
+        self.counts = {"latency": 0, "ttft": 0, "queue_wait": 0, "connect_time": 0}
+        self.buckets = {"latency": [0] * len(LATENCY_BUCKETS), "ttft": [0] * len(LATENCY_BUCKETS)}
+        self.samples: Dict[str, List[float]] = {"latency": [], "ttft": [], "tps": []}
+
+    def _observe(self, name: str, value: float) -> None:
+        self.sums[name] += value
+        self.counts[name] += 1
+        if name in self.buckets:
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    self.buckets[name][i] += 1
+        samples = self.samples.get(name)
+        if samples is not None and len(samples) < MAX_SAMPLES:
+            samples.append(value)
+
+    def add(self, record: CallRecord) -> None:
+        self.status[record.status] = self.status.get(record.status, 0) + 1
+        if record.status == "cached":
+            return
+        self.tokens["prompt"] += record.prompt_tokens
+        self.tokens["cached_prompt"] += record.cached_prompt_tokens
+        self.tokens["completion"] += record.completion_tokens
+        self.tokens["reasoning"] += record.reasoning_tokens
+        self.bytes["sent"] += record.bytes_sent
+        self.bytes["received"] += record.bytes_received
+        self.retries += record.retries
+        self._observe("queue_wait", record.queue_wait)
+        self._observe("connect_time", record.connect_time)
+        if record.status == "ok":
+            self._observe("latency", record.latency)
+            if record.ttft is not None:
+                self._observe("ttft", record.ttft)
+            if record.tokens_per_second and len(self.samples["tps"]) < MAX_SAMPLES:
+                self.samples["tps"].append(record.tokens_per_second)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_prometheus(aggregates: Dict[Tuple[str, str, str], _Aggregate]) -> str:
+    """Render aggregates in the Prometheus text exposition format."""
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, help_text: str, rows: List[Tuple[str, float]]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{labels} {value:g}" for labels, value in rows)
+
+    items = sorted(aggregates.items())
+    key = lambda m, p, s: dict(model=m, provider=p, stage=s)  # noqa: E731
+
+    metric("aitools_llm_requests_total", "counter", "LLM calls by outcome", [
+        (_labels(**key(*k), status=status), n) for k, agg in items for status, n in sorted(agg.status.items())
+    ])
+    metric("aitools_llm_tokens_total", "counter", "Token usage reported by the provider", [
+        (_labels(**key(*k), type=kind), n) for k, agg in items for kind, n in agg.tokens.items()
+    ])
+    metric("aitools_llm_bytes_total", "counter", "HTTP bytes transferred", [
+        (_labels(**key(*k), direction=d), n) for k, agg in items for d, n in agg.bytes.items()
+    ])
+    metric("aitools_llm_retries_total", "counter", "Retried HTTP attempts", [
+        (_labels(**key(*k)), agg.retries) for k, agg in items
+    ])
+    for name, help_text in (("queue_wait", "Time waiting on rate limits"), ("connect_time", "TCP/TLS connect time")):
+        lines.append(f"# HELP aitools_llm_{name}_seconds {help_text}")
+        lines.append(f"# TYPE aitools_llm_{name}_seconds summary")
+        for k, agg in items:
+            labels = _labels(**key(*k))
+            lines.append(f"aitools_llm_{name}_seconds_sum{labels} {agg.sums[name]:g}")
+            lines.append(f"aitools_llm_{name}_seconds_count{labels} {agg.counts[name]:g}")
+    for name, metric_name, help_text in (
+        ("latency", "aitools_llm_request_duration_seconds", "Total latency of successful calls"),
+        ("ttft", "aitools_llm_time_to_first_token_seconds", "Time to first token"),
+    ):
+        lines.append(f"# HELP {metric_name} {help_text}")
+        lines.append(f"# TYPE {metric_name} histogram")
+        for k, agg in items:
+            base = key(*k)
+            for bound, count in zip(LATENCY_BUCKETS, agg.buckets[name]):
+                lines.append(f"{metric_name}_bucket{_labels(**base, le=f'{bound:g}')} {count}")
+            lines.append(f"{metric_name}_bucket{_labels(**base, le='+Inf')} {agg.counts[name]}")
+            lines.append(f"{metric_name}_sum{_labels(**base)} {agg.sums[name]:g}")
+            lines.append(f"{metric_name}_count{_labels(**base)} {agg.counts[name]}")
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusExporter:
+    """
+    Write aggregated metrics as a Prometheus text file (e.g. for node_exporter's
+    textfile collector). The file is rewritten atomically on ``flush``/``close``.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.telemetry: Optional["Telemetry"] = None
+
+    def export(self, record: CallRecord) -> None:
+        pass  # aggregated by Telemetry; written on flush
+
+    def flush(self) -> None:
+        if self.telemetry is None:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render_prometheus(self.telemetry.aggregates))
+        os.replace(tmp_path, self.path)
+
+    def close(self) -> None:
+        self.flush()
+
+
+class Telemetry:
+    """Collects CallRecords, keeps per (model, provider, stage) aggregates and feeds exporters."""
+
+    def __init__(self, exporters: Optional[List] = None):
+        self.aggregates: Dict[Tuple[str, str, str], _Aggregate] = {}
+        self.exporters: List = []
+        for exporter in exporters or []:
+            self.add_exporter(exporter)
+
+    def add_exporter(self, exporter) -> None:
+        if isinstance(exporter, PrometheusExporter):
+            exporter.telemetry = self
+        self.exporters.append(exporter)
+
+    def record(self, record: CallRecord) -> None:
+        key = (record.model, record.provider, record.stage)
+        aggregate = self.aggregates.get(key)
+        if aggregate is None:
+            aggregate = self.aggregates[key] = _Aggregate()
+        aggregate.add(record)
+        for exporter in self.exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                logger.warning(f"Telemetry exporter {type(exporter).__name__} failed: {e}")
+
+    def summary(self) -> List[Dict]:
+        # Only needed at the end of a run; keeps numpy out of every client's import
+        import numpy as np
+
+        rows = []
+        for (model, provider, stage_name), agg in sorted(self.aggregates.items()):
+            latency, ttft, tps = agg.samples["latency"], agg.samples["ttft"], agg.samples["tps"]
+            rows.append(
+                {
+                    "model": model,
+                    "provider": provider,
+                    "stage": stage_name or "-",
+                    "calls": sum(agg.status.values()),
+                    "errors": agg.status.get("error", 0),
+                    "cached": agg.status.get("cached", 0),
+                    "retries": agg.retries,
+                    "p50_latency": float(np.percentile(latency, 50)) if latency else 0.0,
+                    "p95_latency": float(np.percentile(latency, 95)) if latency else 0.0,
+                    "p50_ttft": float(np.percentile(ttft, 50)) if ttft else 0.0,
+                    "tokens_per_second": float(np.median(tps)) if tps else 0.0,
+                    "queue_wait": agg.sums["queue_wait"],
+                    **{f"{kind}_tokens": n for kind, n in agg.tokens.items()},
+                    "bytes_received": agg.bytes["received"],
+                }
+            )
+        return rows
+
+    def log_summary(self) -> None:
+        for row in self.summary():
+            logger.info(
+                f"[telemetry] {row['stage']} {row['model']} ({row['provider']}): "
+                f"{row['calls']} calls, {row['errors']} errors, {row['cached']} cached, "
+                f"{row['retries']} retries | latency p50 {row['p50_latency']:.2f}s "
+                f"p95 {row['p95_latency']:.2f}s, TTFT p50 {row['p50_ttft']:.2f}s, "
+                f"{row['tokens_per_second']:.1f} tok/s, queue wait {row['queue_wait']:.2f}s | "
+                f"tokens prompt {row['prompt_tokens']} (cached {row['cached_prompt_tokens']}) "
+                f"completion {row['completion_tokens']} "
+                f"reasoning {row['reasoning_tokens']}, {row['bytes_received'] / 1024:.1f} KiB received"
+            )
+
+    def flush(self) -> None:
+        for exporter in self.exporters:
+            if hasattr(exporter, "flush"):
+                exporter.flush()
+
+    def close(self) -> None:
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters = []
+
+
+_telemetry: Optional[Telemetry] = None
+
+
+def get_telemetry() -> Telemetry:
+    """
+    Return the process-wide Telemetry. Exporters are configured from
+    ``AI_TELEMETRY_JSONL`` and ``AI_TELEMETRY_PROM`` (file paths) on first use.
+    """
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = Telemetry()
+        jsonl_path = os.getenv("AI_TELEMETRY_JSONL", "").strip()
+        prom_path = os.getenv("AI_TELEMETRY_PROM", "").strip()
+        if jsonl_path:
+            _telemetry.add_exporter(JSONLExporter(jsonl_path))
+        if prom_path:
+            _telemetry.add_exporter(PrometheusExporter(prom_path))
+    return _telemetry
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from utils.markdown import split_sections
+from utils.model_config import get_model_limits, get_token_ratio
+
+# Per-message framing tokens (role markers, separators) added by chat templates
+MESSAGE_OVERHEAD = 4
+# Smallest output budget worth sending a request for
+MIN_OUTPUT_TOKENS = 256
+TRUNCATION_MARKER = "\n\n[……中间内容过长已省略……]\n\n"
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]")
+
+
+class ContextOverflowError(Exception):
+    """Raised when a request cannot be made to fit the model's context window."""
+
+
+def estimate_tokens(text: str, provider: Optional[str] = None) -> int:
+    """Approximate token count using per-provider ratios for CJK and other characters."""
+    if not text:
+        return 0
+    ratio = get_token_ratio(provider or "")
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * ratio["cjk"] + (len(text) - cjk) * ratio["other"])
+
+
+def estimate_messages(messages: List[Dict[str, str]], provider: Optional[str] = None) -> int:
+    total = 0
+    for msg in messages:
+        content = msg.get("content")
+        total += MESSAGE_OVERHEAD
+        if isinstance(content, str):
+            total += estimate_tokens(content, provider)
+    return total
+
+
+@dataclass
+class RequestEstimate:
+    model: str
+    prompt_tokens: int
+    context_window: int
+    max_output: int
+
+    @property
+    def output_cap(self) -> int:
+        """Largest output budget that still fits next to the prompt."""
+        return max(0, min(self.max_output, self.context_window - self.prompt_tokens))
+
+    @property
+    def fits(self) -> bool:
+        return self.output_cap >= min(MIN_OUTPUT_TOKENS, self.max_output)
+
+    @property
+    def prompt_budget(self) -> int:
+        """Prompt tokens available while leaving room for a minimal answer."""
+        return self.context_window - min(MIN_OUTPUT_TOKENS, self.max_output)
+
+    @property
+    def overflow(self) -> int:
+        return max(0, self.prompt_tokens - self.prompt_budget)
+
+
+def estimate_request(
+    messages: List[Dict[str, str]], model: str, provider: Optional[str] = None
+) -> RequestEstimate:
+    limits = get_model_limits(model)
+    return RequestEstimate(
+        model=model,
+        prompt_tokens=estimate_messages(messages, provider),
+        context_window=limits["context"],
+        max_output=limits["max_output"],
+    )
+
+
+def _largest_index(messages: List[Dict[str, str]]) -> int:
+    candidates = [
+        i for i, msg in enumerate(messages)
+        if msg.get("role") != "system" and isinstance(msg.get("content"), str)
+    ]
+    if not candidates:
+        raise ContextOverflowError("No user content to shrink")
+    return max(candidates, key=lambda i: len(messages[i]["content"]))
+
+
+def truncate_messages(
+    messages: List[Dict[str, str]], budget: int, provider: Optional[str] = None
+) -> List[Dict[str, str]]:
+    """Cut the middle out of the largest non-system message until the prompt fits ``budget``."""
+    messages = [dict(msg) for msg in messages]
+    for _ in range(8):
+        total = estimate_messages(messages, provider)
+        if total <= budget:
+            return messages
+        idx = _largest_index(messages)
+        content = messages[idx]["content"]
+        own = estimate_tokens(content, provider)
+        keep_tokens = own - (total - budget) - estimate_tokens(TRUNCATION_MARKER, provider)
+        if keep_tokens <= 0:
+            raise ContextOverflowError("System prompt alone exceeds the context window")
+        keep_chars = int(len(content) * keep_tokens / own * 0.98)
+        head = keep_chars * 2 // 3
+        messages[idx]["content"] = (
+            content[:head] + TRUNCATION_MARKER + content[len(content) - (keep_chars - head):]
+        )
+    raise ContextOverflowError("Could not truncate request to fit the context window")
+
+
+def _hard_split(text: str, budget: int, provider: Optional[str]) -> List[str]:
+    tokens = estimate_tokens(text, provider)
+    pieces = max(1, math.ceil(tokens / budget))
+    size = math.ceil(len(text) / pieces)
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def split_messages(
+    messages: List[Dict[str, str]], budget: int, provider: Optional[str] = None
+) -> List[List[Dict[str, str]]]:
+    """
+    Split the largest non-system message into pieces so every request fits ``budget``.
+
+    Pieces follow markdown section boundaries where possible; each returned request
+    keeps all the other messages unchanged.
+    """
+    idx = _largest_index(messages)
+    content = messages[idx]["content"]
+    rest = estimate_messages(messages, provider) - estimate_tokens(content, provider)
+    piece_budget = budget - rest
+    if piece_budget <= 0:
+        raise ContextOverflowError("Fixed messages alone exceed the context window")
+
+    pieces: List[str] = []
+    current = ""
+    for section in split_sections(content):
+        parts = (
+            [section]
+            if estimate_tokens(section, provider) <= piece_budget
+            else _hard_split(section, piece_budget, provider)
+        )
+        for part in parts:
+            if current and estimate_tokens(current + part, provider) > piece_budget:
+                pieces.append(current)
+                current = ""
+            current += part
+    if current:
+        pieces.append(current)
+
+    requests = []
+    for piece in pieces:
+        request = [dict(msg) for msg in messages]
+        request[idx]["content"] = piece
+        requests.append(request)
+    return requests